@@ -0,0 +1,161 @@
+"""
+Cache en memoria con TTL por clave, límite de tamaño (LRU) y métricas
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any, Callable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Estados de una entrada devueltos por TTLCache.lookup
+FRESH = "fresh"
+STALE = "stale"
+
+# Registro de caches del proceso, para consultar sus métricas
+_registry: Dict[str, "TTLCache"] = {}
+
+class TTLCache:
+    """
+    Cache LRU acotada con expiración por clave.
+    
+    Usa un reloj monotónico, por lo que no le afectan los cambios de hora
+    del sistema. Una entrada es:
+    - fresca mientras su antigüedad sea menor que su TTL
+    - vencida (stale) hasta max_staleness, si se configuró
+    - expirada después, y se elimina al consultarla
+    """
+    
+    def __init__(self, name: str, max_size: int = 256, ttl: float = 30.0,
+                 max_staleness: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self.max_staleness = max_staleness
+        self._clock = clock
+        
+        # key -> (valor, momento de guardado, ttl)
+        self._data: "OrderedDict[str, Tuple[Any, float, float]]" = OrderedDict()
+        
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        
+        _registry[name] = self
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def __contains__(self, key: str) -> bool:
+        return key in self._data
+    
+    def _expire_after(self, ttl: float) -> float:
+        """Antigüedad a partir de la cual una entrada ya no puede servirse"""
+        if self.max_staleness is None:
+            return ttl
+        return max(ttl, self.max_staleness)
+    
+    def lookup(self, key: str, allow_stale: bool = False) -> Tuple[Any, Optional[str], float]:
+        """
+        Busca una entrada.
+        
+        Returns:
+            (valor, estado, antigüedad) con estado FRESH o STALE,
+            o (None, None, 0.0) si no existe o no puede servirse
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None, None, 0.0
+        
+        value, stored_at, ttl = entry
+        age = self._clock() - stored_at
+        
+        if age < ttl:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value, FRESH, age
+        
+        expire_after = self._expire_after(ttl)
+        if age >= expire_after:
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return None, None, 0.0
+        
+        if not allow_stale:
+            self.misses += 1
+            return None, None, 0.0
+        
+        self._data.move_to_end(key)
+        self.stale_hits += 1
+        return value, STALE, age
+    
+    def get(self, key: str, default: Any = None) -> Any:
+        """Obtiene una entrada solo si está fresca"""
+        value, state, _ = self.lookup(key)
+        return value if state == FRESH else default
+    
+    def peek(self, key: str) -> Any:
+        """Obtiene una entrada sin importar su antigüedad ni contar métricas"""
+        entry = self._data.get(key)
+        return entry[0] if entry is not None else None
+    
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Guarda una entrada; ttl sobrescribe el TTL por defecto de la cache"""
+        if key in self._data:
+            self._data.move_to_end(key)
+        
+        self._data[key] = (value, self._clock(), self.ttl if ttl is None else ttl)
+        
+        while len(self._data) > self.max_size:
+            evicted_key, _ = self._data.popitem(last=False)
+            self.evictions += 1
+            logger.debug(f"[CACHE] {self.name}: expulsada {evicted_key} (LRU)")
+    
+    def delete(self, key: str) -> bool:
+        """Elimina una entrada. Devuelve True si existía"""
+        if key in self._data:
+            del self._data[key]
+            self.invalidations += 1
+            return True
+        return False
+    
+    def invalidate_prefix(self, prefix: str) -> int:
+        """Elimina todas las entradas cuya clave empieza por prefix"""
+        keys = [key for key in self._data if key.startswith(prefix)]
+        for key in keys:
+            del self._data[key]
+        self.invalidations += len(keys)
+        return len(keys)
+    
+    def clear(self):
+        """Vacía la cache (las métricas se conservan)"""
+        self.invalidations += len(self._data)
+        self._data.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Métricas de uso de la cache"""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0
+        }
+
+def get_all_stats() -> List[Dict[str, Any]]:
+    """Métricas de todas las caches registradas"""
+    return [cache.stats() for cache in _registry.values()]
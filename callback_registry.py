@@ -0,0 +1,257 @@
+"""
+Registro de callbacks largos
+
+Telegram limita callback_data a 64 bytes. Los callbacks que no caben (o que
+llevan ':' dentro de un argumento) se guardan aquí y el botón solo lleva
+un identificador corto: "t:<id>", firmado con HMAC si hay CALLBACK_SECRET.
+El registro se persiste en disco para que los botones sigan funcionando
+después de reiniciar el bot.
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from config import (
+    CALLBACK_REGISTRY_FILE, CALLBACK_TTL, CALLBACK_SECRET, CALLBACK_MAX_ENTRIES, CALLBACK_SAVE_DELAY
+)
+
+logger = logging.getLogger(__name__)
+
+# Límite de Telegram para callback_data (en bytes)
+CALLBACK_DATA_LIMIT = 64
+
+# Prefijo de los callbacks registrados
+REGISTRY_PREFIX = "t"
+
+def _b64(digest: bytes) -> str:
+    return base64.urlsafe_b64encode(digest).decode("ascii")
+
+class CallbackRegistry:
+    """
+    Identificador corto -> (acción, argumentos), con caducidad.
+    
+    El identificador se deriva del contenido, así que volver a pintar el
+    mismo botón reutiliza la entrada (y renueva su caducidad) en lugar de
+    crear otra. Se conservan como mucho max_entries, descartando las
+    menos usadas.
+    """
+    
+    def __init__(self, path: Optional[str], ttl: int = 604800, secret: str = "",
+                 max_entries: int = 10000, save_delay: float = 5):
+        self.path = path
+        self.ttl = ttl
+        self.save_delay = save_delay
+        self.max_entries = max(1, max_entries)
+        self._secret = secret.encode() if secret else None
+        # id -> (expira, acción, argumentos), de la menos a la más usada
+        self._entries: "OrderedDict[str, Tuple[float, str, List[str]]]" = OrderedDict()
+        self._dirty = False
+        self._save_task: Optional[asyncio.Task] = None
+        self._writing = False
+        self._load()
+    
+    # ================= IDENTIFICADORES ================= #
+    def _entry_id(self, action: str, args: List[str]) -> str:
+        payload = json.dumps([action, args], ensure_ascii=False, separators=(",", ":"))
+        return _b64(hashlib.blake2b(payload.encode(), digest_size=6).digest())
+    
+    def _signature(self, entry_id: str) -> str:
+        return _b64(hmac.new(self._secret, entry_id.encode(), hashlib.sha256).digest()[:6])
+    
+    def _split_token(self, token: str) -> Optional[str]:
+        """id de un token, o None si la firma no es válida"""
+        if not self._secret:
+            return token
+        
+        entry_id, signature = token[:8], token[8:]
+        if not hmac.compare_digest(signature, self._signature(entry_id)):
+            return None
+        return entry_id
+    
+    # ================= API ================= #
+    def pack(self, action: str, *args: Any) -> str:
+        """
+        callback_data para una acción y sus argumentos.
+        
+        Si cabe en 64 bytes se devuelve tal cual ("acción:arg1:arg2");
+        si no, se registra y se devuelve "t:<token>".
+        """
+        args = [str(arg) for arg in args]
+        data = ":".join([action, *args])
+        
+        if len(data.encode()) <= CALLBACK_DATA_LIMIT and not any(":" in arg for arg in args):
+            return data
+        
+        return f"{REGISTRY_PREFIX}:{self.register(action, args)}"
+    
+    def register(self, action: str, args: List[str]) -> str:
+        """Guarda la acción y devuelve su token"""
+        entry_id = self._entry_id(action, args)
+        self._entries[entry_id] = (time.time() + self.ttl, action, list(args))
+        self._entries.move_to_end(entry_id)
+        
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        
+        self._dirty = True
+        
+        if self._secret:
+            return entry_id + self._signature(entry_id)
+        return entry_id
+    
+    def resolve(self, token: str) -> Optional[Tuple[str, List[str]]]:
+        """(acción, argumentos) de un token, o None si no existe, caducó o la firma no coincide"""
+        entry_id = self._split_token(token)
+        if entry_id is None:
+            logger.warning(f"[CALLBACKS] Firma inválida: {token}")
+            return None
+        
+        entry = self._entries.get(entry_id)
+        if entry is None:
+            return None
+        
+        expires, action, args = entry
+        if expires < time.time():
+            del self._entries[entry_id]
+            self._dirty = True
+            return None
+        
+        self._entries.move_to_end(entry_id)
+        return action, list(args)
+    
+    def touch(self, token: str) -> bool:
+        """
+        Renueva la caducidad de un token ya entregado (p. ej. en un teclado
+        guardado en caché). False si ya no existe.
+        """
+        entry_id = self._split_token(token)
+        entry = self._entries.get(entry_id) if entry_id is not None else None
+        if entry is None or entry[0] < time.time():
+            return False
+        
+        self._entries[entry_id] = (time.time() + self.ttl, entry[1], entry[2])
+        self._entries.move_to_end(entry_id)
+        self._dirty = True
+        return True
+    
+    def stats(self) -> Dict[str, Any]:
+        """Entradas registradas, para diagnóstico"""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "signed": self._secret is not None
+        }
+    
+    # ================= PERSISTENCIA ================= #
+    def _load(self):
+        """Carga el registro guardado, sin las entradas caducadas"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.error(f"Error cargando registro de callbacks: {str(e)}")
+            return
+        
+        now = time.time()
+        for entry_id, (expires, action, args) in data.get("entries", {}).items():
+            if expires >= now:
+                self._entries[entry_id] = (expires, action, args)
+        
+        logger.info(f"[CALLBACKS] {len(self._entries)} callbacks cargados de {self.path}")
+    
+    def _serialize(self) -> Dict[str, Any]:
+        """Entradas vigentes listas para escribir; marca el registro como guardado"""
+        now = time.time()
+        self._dirty = False
+        return {
+            "entries": {
+                entry_id: [expires, action, args]
+                for entry_id, (expires, action, args) in self._entries.items()
+                if expires >= now
+            }
+        }
+    
+    def _write(self, data: Dict[str, Any]) -> bool:
+        """Escribe el registro en disco; puede ejecutarse en otro hilo"""
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            
+            # Escritura atómica: un reinicio a mitad no deja el fichero corrupto
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            return True
+        except Exception as e:
+            logger.error(f"Error guardando registro de callbacks: {str(e)}")
+            return False
+    
+    def save(self):
+        """Escribe el registro en disco si ha cambiado (al detener el bot)"""
+        if not self.path or not self._dirty:
+            return
+        
+        if not self._write(self._serialize()):
+            self._dirty = True
+    
+    def save_later(self):
+        """
+        Programa una escritura dentro de save_delay segundos.
+        
+        Se llama después de cada callback: las pantallas que registran
+        botones en ese intervalo comparten una sola escritura, que se hace
+        fuera del event loop.
+        """
+        if not self.path or not self._dirty:
+            return
+        if self._save_task is not None and not self._save_task.done():
+            return
+        self._save_task = asyncio.create_task(self._save_after_delay())
+    
+    async def _save_after_delay(self):
+        await asyncio.sleep(self.save_delay)
+        if not self._dirty:
+            return
+        
+        # La copia se hace en el event loop (los handlers modifican _entries);
+        # solo la escritura va al hilo
+        self._writing = True
+        try:
+            if not await asyncio.to_thread(self._write, self._serialize()):
+                self._dirty = True
+        finally:
+            self._writing = False
+    
+    async def flush(self):
+        """Escritura final al detener el bot, sin pisar una que esté en curso"""
+        task = self._save_task
+        if task is not None and not task.done():
+            if self._writing:
+                await task
+            else:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self.save()
+
+# Instancia global del registro
+callback_registry = CallbackRegistry(
+    CALLBACK_REGISTRY_FILE,
+    ttl=CALLBACK_TTL,
+    secret=CALLBACK_SECRET,
+    max_entries=CALLBACK_MAX_ENTRIES,
+    save_delay=CALLBACK_SAVE_DELAY
+)
@@ -0,0 +1,101 @@
+"""
+Circuit breaker para las peticiones a WGDashboard
+"""
+
+import logging
+import time
+from typing import Dict, Any, Callable
+
+logger = logging.getLogger(__name__)
+
+# Estados del circuito
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitBreaker:
+    """
+    Circuit breaker con tres estados.
+    
+    - closed: las peticiones pasan; tras failure_threshold fallos
+      consecutivos el circuito se abre
+    - open: las peticiones fallan al momento durante reset_timeout segundos
+    - half_open: se deja pasar una única petición de prueba; si tiene éxito
+      el circuito se cierra y si falla vuelve a abrirse
+    """
+    
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started_at = 0.0
+    
+    @property
+    def state(self) -> str:
+        """Estado actual; pasa a half_open cuando vence reset_timeout"""
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+            logger.info(f"[CIRCUIT] {self.name}: half-open, probando el servidor")
+        return self._state
+    
+    @property
+    def retry_after(self) -> float:
+        """Segundos que faltan para volver a probar (0 si no está abierto)"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (self._clock() - self._opened_at))
+    
+    def allow_request(self) -> bool:
+        """Indica si una petición puede enviarse ahora"""
+        state = self.state
+        
+        if state == CLOSED:
+            return True
+        
+        # Si la prueba anterior nunca terminó (p. ej. se canceló), se permite otra
+        probe_expired = self._clock() - self._probe_started_at >= self.reset_timeout
+        if state == HALF_OPEN and (not self._probe_in_flight or probe_expired):
+            self._probe_in_flight = True
+            self._probe_started_at = self._clock()
+            return True
+        
+        return False
+    
+    def record_success(self):
+        """Registra una petición correcta y cierra el circuito"""
+        if self._state != CLOSED:
+            logger.info(f"[CIRCUIT] {self.name}: cerrado, el servidor responde")
+        self._state = CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+    
+    def record_failure(self):
+        """Registra un fallo; abre el circuito al llegar al umbral o si falla la prueba"""
+        self._failures += 1
+        self._probe_in_flight = False
+        
+        if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != OPEN:
+                logger.warning(
+                    f"[CIRCUIT] {self.name}: abierto tras {self._failures} fallos, "
+                    f"reintento en {self.reset_timeout:.0f}s"
+                )
+            self._state = OPEN
+            self._opened_at = self._clock()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Estado del circuito para diagnóstico"""
+        return {
+            "name": self.name,
+            "state": self.state,
+            "failures": self._failures,
+            "retry_after": self.retry_after
+        }
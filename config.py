@@ -20,6 +20,64 @@ API_TIMEOUT = int(os.getenv("API_TIMEOUT", "10"))
 # Opcional: Prefijo para la URL del dashboard
 WG_API_PREFIX = os.getenv("WG_API_PREFIX", "")
 
+# Pool de conexiones HTTP con WGDashboard
+API_POOL_MAX_CONNECTIONS = int(os.getenv("API_POOL_MAX_CONNECTIONS", "10"))
+API_POOL_MAX_KEEPALIVE = int(os.getenv("API_POOL_MAX_KEEPALIVE", "5"))
+API_KEEPALIVE_EXPIRY = float(os.getenv("API_KEEPALIVE_EXPIRY", "120"))  # segundos
+# HTTP/2 requiere el paquete h2 (pip install "httpx[http2]") y soporte en el servidor
+API_HTTP2 = os.getenv("API_HTTP2", "false").lower() == "true"
+# Conexiones a abrir al iniciar el bot
+API_WARMUP_CONNECTIONS = int(os.getenv("API_WARMUP_CONNECTIONS", "2"))
+# Ping periódico para mantener conexiones abiertas (0 = desactivado); debe ser
+# menor que el keep-alive del servidor
+API_KEEPALIVE_PING_INTERVAL = int(os.getenv("API_KEEPALIVE_PING_INTERVAL", "0"))  # segundos
+
+# Decodificar la lista de peers de forma incremental (requiere el paquete ijson)
+API_STREAM_JSON = os.getenv("API_STREAM_JSON", "true").lower() == "true"
+
+# Reintentos de peticiones GET ante fallos transitorios (backoff exponencial con jitter)
+API_RETRY_ATTEMPTS = int(os.getenv("API_RETRY_ATTEMPTS", "2"))
+API_RETRY_BACKOFF = float(os.getenv("API_RETRY_BACKOFF", "0.5"))  # segundos
+API_RETRY_MAX_BACKOFF = float(os.getenv("API_RETRY_MAX_BACKOFF", "4"))  # segundos
+
+# Circuit breaker: fallos consecutivos para abrirlo y segundos hasta probar de nuevo
+API_BREAKER_THRESHOLD = int(os.getenv("API_BREAKER_THRESHOLD", "5"))
+API_BREAKER_RESET_TIMEOUT = int(os.getenv("API_BREAKER_RESET_TIMEOUT", "30"))
+
+# Máximo de peers por petición en las acciones masivas
+API_BULK_CHUNK_SIZE = int(os.getenv("API_BULK_CHUNK_SIZE", "50"))
+
+# Grabar (record) o reproducir (replay) las respuestas de WGDashboard en un
+# cassette JSON Lines, sin API key ni claves privadas. Vacío = red normal
+API_TRANSPORT_MODE = os.getenv("API_TRANSPORT_MODE", "").strip().lower()
+API_CASSETTE_FILE = os.getenv("API_CASSETTE_FILE", os.path.join("data", "cassette.jsonl"))
+# Latencia en replay: 0 = sin espera, 1 = la grabada, 2 = el doble...
+API_REPLAY_LATENCY = float(os.getenv("API_REPLAY_LATENCY", "0"))
+
+# ================= CACHE API ================= #
+API_CACHE_TTL = int(os.getenv("API_CACHE_TTL", "30"))  # segundos
+# Servir datos vencidos mientras se refrescan en segundo plano
+API_CACHE_STALE_WHILE_REVALIDATE = os.getenv("API_CACHE_STALE_WHILE_REVALIDATE", "true").lower() == "true"
+API_CACHE_MAX_STALENESS = int(os.getenv("API_CACHE_MAX_STALENESS", "300"))  # segundos
+API_CACHE_MAX_ENTRIES = int(os.getenv("API_CACHE_MAX_ENTRIES", "256"))
+# Antigüedad máxima de los datos mostrados cuando el servidor no responde
+API_STALE_FALLBACK_TTL = int(os.getenv("API_STALE_FALLBACK_TTL", "3600"))  # segundos
+# Cada cuánto se vuelven a comprobar los endpoints que soporta WGDashboard
+API_CAPABILITY_TTL = int(os.getenv("API_CAPABILITY_TTL", "3600"))  # segundos
+# Versiones de cada configuración que se conservan para las listas abiertas por los usuarios
+API_SNAPSHOT_RETENTION = int(os.getenv("API_SNAPSHOT_RETENTION", "3"))
+
+# ================= DIRECCIONES IP ================= #
+# Direcciones de cada prefijo que gestiona el asignador (los prefijos IPv6
+# grandes se limitan a las primeras)
+IP_ALLOCATOR_WINDOW = int(os.getenv("IP_ALLOCATOR_WINDOW", "65536"))
+# Tiempo que una dirección entregada espera a que el peer aparezca en WGDashboard
+IP_RESERVATION_TTL = int(os.getenv("IP_RESERVATION_TTL", "300"))  # segundos
+
+# ================= CLAVES WIREGUARD ================= #
+# Pares de claves y pre-shared keys que se mantienen generados (0 = sin pool)
+WG_KEY_POOL_SIZE = int(os.getenv("WG_KEY_POOL_SIZE", "32"))
+
 # ================= SEGURIDAD ================= #
 # Roles
 ROLE_ADMIN = "admin"
@@ -37,6 +95,14 @@ ALLOWED_USERS: Dict[int, Dict] = {
 # ================= RUTAS ================= #
 DATA_DIR = "data"
 OPERATORS_DB = os.path.join(DATA_DIR, "operator_peers.json")
+# Callbacks que no caben en los 64 bytes de Telegram
+CALLBACK_REGISTRY_FILE = os.getenv("CALLBACK_REGISTRY_FILE", os.path.join(DATA_DIR, "callbacks.json"))
+CALLBACK_TTL = int(os.getenv("CALLBACK_TTL", "604800"))  # segundos
+# Con un secreto, los identificadores se firman con HMAC y no se pueden inventar
+CALLBACK_SECRET = os.getenv("CALLBACK_SECRET", "")
+CALLBACK_MAX_ENTRIES = int(os.getenv("CALLBACK_MAX_ENTRIES", "10000"))
+# Espera antes de escribir el registro en disco (agrupa varias pantallas)
+CALLBACK_SAVE_DELAY = float(os.getenv("CALLBACK_SAVE_DELAY", "5"))  # segundos
 
 # ================= LOGGING ================= #
 LOG_FILE = os.getenv("LOG_FILE", "wg_bot.log")
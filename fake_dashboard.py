@@ -0,0 +1,396 @@
+"""
+Servidor WGDashboard simulado para pruebas locales sin red
+
+Implementa los endpoints que usa wg_api.py con peers sintéticos en memoria
+y permite inyectar latencia, errores 500 y 404 por endpoint.
+
+Uso:
+    python fake_dashboard.py --configs 2 --peers 8000 --latency 50
+    WG_API_BASE_URL=http://127.0.0.1:10086/api python main.py
+"""
+
+import argparse
+import base64
+import json
+import logging
+import random
+import threading
+import time
+from datetime import timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Any, Optional, Set
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger("fake_dashboard")
+
+# Endpoints que solo aceptan POST (un GET responde 405, como Flask)
+POST_ENDPOINTS = {
+    "addPeers", "restrictPeers", "allowAccessPeers", "deletePeers",
+    "resetPeerData", "savePeerScheduleJob", "deletePeerScheduleJob"
+}
+GET_ENDPOINTS = {
+    "handshake", "getWireguardConfigurations", "getWireguardConfigurationInfo",
+    "systemStatus", "protocols"
+}
+
+def _fake_key(rng: random.Random) -> str:
+    """Clave con el mismo formato que una clave WireGuard (base64 de 32 bytes)"""
+    return base64.b64encode(bytes(rng.getrandbits(8) for _ in range(32))).decode()
+
+def _make_peer(rng: random.Random, index: int, subnet: int) -> Dict[str, Any]:
+    """Peer sintético con los campos que devuelve WGDashboard"""
+    online = rng.random() < 0.3
+    if online:
+        latest_handshake = str(timedelta(seconds=rng.randint(1, 180)))
+    elif rng.random() < 0.5:
+        latest_handshake = str(timedelta(days=rng.randint(1, 30), hours=rng.randint(0, 23)))
+    else:
+        latest_handshake = "No Handshake"
+    
+    return {
+        "id": _fake_key(rng),
+        "name": f"peer-{index}",
+        "private_key": _fake_key(rng),
+        "preshared_key": "",
+        "allowed_ip": f"10.{subnet}.{index // 250}.{index % 250 + 2}/32",
+        "endpoint_allowed_ip": "0.0.0.0/0",
+        "endpoint": f"203.0.113.{rng.randint(1, 254)}:{rng.randint(1024, 65535)}" if online else "N/A",
+        "remote_endpoint": "vpn.example.com",
+        "status": "running" if online else "stopped",
+        "latest_handshake": latest_handshake,
+        "total_receive": round(rng.random() * 5, 4),
+        "total_sent": round(rng.random() * 2, 4),
+        "total_data": 0,
+        "cumu_receive": 0,
+        "cumu_sent": 0,
+        "cumu_data": 0,
+        "DNS": "1.1.1.1",
+        "mtu": 1420,
+        "keepalive": 21,
+        "jobs": [],
+        "ShareLink": []
+    }
+
+class FakeDashboard:
+    """Estado en memoria del dashboard simulado y opciones de inyección de fallos"""
+    
+    def __init__(self, configs: int = 1, peers: int = 100, restricted: int = 0,
+                 latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 not_found: Optional[Set[str]] = None, api_key: str = "", seed: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.not_found = not_found or set()
+        self.api_key = api_key
+        self.lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        
+        # nombre -> {"info": {...}, "peers": [...], "restricted": [...]}
+        self.configs: Dict[str, Dict[str, Any]] = {}
+        for c in range(configs):
+            name = f"wg{c}"
+            peer_list = [_make_peer(self._rng, i, c) for i in range(peers)]
+            self.configs[name] = {
+                "info": {
+                    "Name": name,
+                    "Address": f"10.{c}.0.1/16",
+                    "ListenPort": 51820 + c,
+                    "PublicKey": _fake_key(self._rng),
+                    "PrivateKey": _fake_key(self._rng),
+                    "Status": True
+                },
+                "peers": peer_list[restricted:],
+                "restricted": peer_list[:restricted]
+            }
+    
+    def random(self) -> float:
+        with self._rng_lock:
+            return self._rng.random()
+    
+    def config_info(self, name: str) -> Dict[str, Any]:
+        config = self.configs[name]
+        connected = sum(1 for peer in config["peers"] if peer["status"] == "running")
+        return dict(
+            config["info"],
+            TotalPeers=len(config["peers"]) + len(config["restricted"]),
+            ConnectedPeers=connected
+        )
+    
+    def find_peer(self, name: str, public_key: str) -> Optional[Dict[str, Any]]:
+        config = self.configs.get(name)
+        if config is None:
+            return None
+        for peer in config["peers"] + config["restricted"]:
+            if peer["id"] == public_key:
+                return peer
+        return None
+    
+    def move_peers(self, name: str, keys: List[str], source: str, target: str) -> int:
+        """Mueve peers entre las listas normal y restringida"""
+        config = self.configs[name]
+        keys_set = set(keys)
+        moving = [peer for peer in config[source] if peer["id"] in keys_set]
+        config[source] = [peer for peer in config[source] if peer["id"] not in keys_set]
+        config[target].extend(moving)
+        return len(moving)
+
+class FakeDashboardHandler(BaseHTTPRequestHandler):
+    """Peticiones HTTP del dashboard simulado"""
+    
+    protocol_version = "HTTP/1.1"  # keep-alive, como un servidor real
+    prefix = "/api"
+    
+    @property
+    def dashboard(self) -> FakeDashboard:
+        return self.server.dashboard
+    
+    def log_message(self, format: str, *args):
+        logger.debug(format % args)
+    
+    def _send(self, code: int, payload: Any):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _ok(self, data: Any = None, message: Optional[str] = None):
+        self._send(200, {"status": True, "message": message, "data": data})
+    
+    def _fail(self, message: str):
+        self._send(200, {"status": False, "message": message, "data": None})
+    
+    def _route(self, method: str):
+        url = urlparse(self.path)
+        
+        if not url.path.startswith(self.prefix + "/"):
+            return self._send(404, {"status": False, "message": "Not found"})
+        
+        parts = url.path[len(self.prefix) + 1:].split("/")
+        name, args = parts[0], parts[1:]
+        
+        body = None
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            try:
+                body = json.loads(self.rfile.read(length))
+            except ValueError:
+                return self._send(400, {"status": False, "message": "Invalid JSON"})
+        
+        dashboard = self.dashboard
+        
+        # Inyección de fallos
+        delay = dashboard.latency + dashboard.jitter * dashboard.random()
+        if delay > 0:
+            time.sleep(delay / 1000)
+        
+        if dashboard.api_key and self.headers.get("wg-dashboard-apikey") != dashboard.api_key:
+            return self._send(401, {"status": False, "message": "Unauthorized"})
+        
+        if name in dashboard.not_found or name not in POST_ENDPOINTS | GET_ENDPOINTS:
+            return self._send(404, {"status": False, "message": "Not found"})
+        
+        if dashboard.error_rate and dashboard.random() < dashboard.error_rate:
+            return self._send(500, {"status": False, "message": "Injected error"})
+        
+        if (method == "GET") != (name in GET_ENDPOINTS):
+            return self._send(405, {"status": False, "message": "Method not allowed"})
+        
+        try:
+            with dashboard.lock:
+                handler = getattr(self, f"_api_{name}")
+                return handler(args, parse_qs(url.query), body or {})
+        except Exception as e:
+            logger.exception(f"Error en {name}")
+            return self._send(500, {"status": False, "message": str(e)})
+    
+    def do_GET(self):
+        self._route("GET")
+    
+    def do_POST(self):
+        self._route("POST")
+    
+    # ================= ENDPOINTS GET ================= #
+    
+    def _api_handshake(self, args, query, body):
+        self._ok()
+    
+    def _api_getWireguardConfigurations(self, args, query, body):
+        self._ok([self.dashboard.config_info(name) for name in self.dashboard.configs])
+    
+    def _api_getWireguardConfigurationInfo(self, args, query, body):
+        name = (query.get("configurationName") or [""])[0]
+        if name not in self.dashboard.configs:
+            return self._fail("Configuration does not exist")
+        
+        config = self.dashboard.configs[name]
+        self._ok({
+            "configurationInfo": self.dashboard.config_info(name),
+            "configurationPeers": config["peers"],
+            "configurationRestrictedPeers": config["restricted"]
+        })
+    
+    def _api_systemStatus(self, args, query, body):
+        self._ok({
+            "CPU": {"cpu_percent": round(self.dashboard.random() * 100, 1)},
+            "Memory": {"VirtualMemory": {"percent": 42.0, "total": 8 * 1024 ** 3, "available": 4 * 1024 ** 3}},
+            "Disks": [],
+            "NetworkInterfaces": {}
+        })
+    
+    def _api_protocols(self, args, query, body):
+        self._ok(["wg"])
+    
+    # ================= ENDPOINTS POST ================= #
+    
+    def _config_arg(self, args) -> Optional[str]:
+        name = args[0] if args else ""
+        if name not in self.dashboard.configs:
+            self._fail("Configuration does not exist")
+            return None
+        return name
+    
+    def _api_addPeers(self, args, query, body):
+        name = self._config_arg(args)
+        if name is None:
+            return
+        
+        public_key = body.get("public_key") or ""
+        if not public_key or self.dashboard.find_peer(name, public_key):
+            return self._fail("Invalid or duplicated public key")
+        
+        config = self.dashboard.configs[name]
+        peer = _make_peer(random.Random(public_key), len(config["peers"]) + len(config["restricted"]), 0)
+        peer.update({
+            "id": public_key,
+            "name": body.get("name") or "",
+            "private_key": body.get("private_key") or "",
+            "preshared_key": body.get("preshared_key") or "",
+            "allowed_ip": ",".join(body.get("allowed_ips") or []),
+            "DNS": body.get("DNS") or peer["DNS"],
+            "status": "stopped",
+            "latest_handshake": "No Handshake",
+            "total_receive": 0,
+            "total_sent": 0,
+            "endpoint": "N/A"
+        })
+        config["peers"].append(peer)
+        self._ok([peer], "Peer added")
+    
+    def _api_restrictPeers(self, args, query, body):
+        name = self._config_arg(args)
+        if name is not None:
+            moved = self.dashboard.move_peers(name, body.get("peers") or [], "peers", "restricted")
+            self._ok(None, f"{moved} peers restricted")
+    
+    def _api_allowAccessPeers(self, args, query, body):
+        name = self._config_arg(args)
+        if name is not None:
+            moved = self.dashboard.move_peers(name, body.get("peers") or [], "restricted", "peers")
+            self._ok(None, f"{moved} peers allowed")
+    
+    def _api_deletePeers(self, args, query, body):
+        name = self._config_arg(args)
+        if name is None:
+            return
+        
+        keys = set(body.get("peers") or [])
+        config = self.dashboard.configs[name]
+        before = len(config["peers"]) + len(config["restricted"])
+        config["peers"] = [peer for peer in config["peers"] if peer["id"] not in keys]
+        config["restricted"] = [peer for peer in config["restricted"] if peer["id"] not in keys]
+        deleted = before - len(config["peers"]) - len(config["restricted"])
+        self._ok(None, f"{deleted} peers deleted")
+    
+    def _api_resetPeerData(self, args, query, body):
+        name = self._config_arg(args)
+        if name is None:
+            return
+        
+        peer = self.dashboard.find_peer(name, body.get("id") or "")
+        if peer is None:
+            return self._fail("Peer does not exist")
+        
+        peer["total_receive"] = 0
+        peer["total_sent"] = 0
+        self._ok(None, "Peer data reset")
+    
+    def _job_peer(self, job: Dict) -> Optional[Dict]:
+        return self.dashboard.find_peer(job.get("Configuration") or "", job.get("Peer") or "")
+    
+    def _api_savePeerScheduleJob(self, args, query, body):
+        job = body.get("Job") or {}
+        peer = self._job_peer(job)
+        if peer is None:
+            return self._fail("Peer does not exist")
+        
+        peer["jobs"] = [j for j in peer["jobs"] if j.get("JobID") != job.get("JobID")]
+        if job.get("Action") != "delete":
+            peer["jobs"].append(job)
+        self._ok(peer["jobs"], "Job saved")
+    
+    def _api_deletePeerScheduleJob(self, args, query, body):
+        job = body.get("Job") or {}
+        peer = self._job_peer(job)
+        if peer is None:
+            return self._fail("Peer does not exist")
+        
+        peer["jobs"] = [j for j in peer["jobs"] if j.get("JobID") != job.get("JobID")]
+        self._ok(peer["jobs"], "Job deleted")
+
+def start_server(dashboard: FakeDashboard, host: str = "127.0.0.1", port: int = 10086,
+                 prefix: str = "/api") -> ThreadingHTTPServer:
+    """Arranca el servidor en un hilo en segundo plano (para pruebas desde Python)"""
+    handler = type("Handler", (FakeDashboardHandler,), {"prefix": prefix.rstrip("/")})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.dashboard = dashboard
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor WGDashboard simulado")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=10086)
+    parser.add_argument("--prefix", default="/api", help="Prefijo de la API (por defecto /api)")
+    parser.add_argument("--configs", type=int, default=1, help="Número de configuraciones (wg0, wg1...)")
+    parser.add_argument("--peers", type=int, default=100, help="Peers por configuración")
+    parser.add_argument("--restricted", type=int, default=0, help="Peers restringidos por configuración")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latencia fija por petición (ms)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Latencia aleatoria adicional (ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de peticiones con HTTP 500 (0-1)")
+    parser.add_argument("--not-found", default="", help="Endpoints que responden 404, separados por comas")
+    parser.add_argument("--api-key", default="", help="Exigir esta API key en wg-dashboard-apikey")
+    parser.add_argument("--seed", type=int, default=1, help="Semilla de los datos sintéticos")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+    
+    dashboard = FakeDashboard(
+        configs=args.configs,
+        peers=args.peers,
+        restricted=args.restricted,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        not_found={name for name in args.not_found.split(",") if name},
+        api_key=args.api_key,
+        seed=args.seed
+    )
+    server = start_server(dashboard, args.host, args.port, args.prefix)
+    
+    logger.info(
+        f"WGDashboard simulado en http://{args.host}:{args.port}{args.prefix} "
+        f"({args.configs} configs x {args.peers} peers)"
+    )
+    
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        logger.info("Deteniendo servidor")
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ Manejadores de comandos y callbacks del bot WGDashboard
 """
 
 import logging
+import asyncio
 import json
 import datetime
 import secrets
@@ -10,11 +11,11 @@ import html
 import base64
 import ipaddress
 import re
-import subprocess
 import hashlib
 import time
 import urllib.parse
-from typing import Dict, List, Any, Optional
+from functools import partial
+from typing import Dict, List, Any, Optional, Sequence
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
 from telegram.ext import ContextTypes, CallbackContext
 from datetime import datetime 
@@ -23,30 +24,39 @@ from datetime import datetime, timedelta
 from config import ROLE_OPERATOR, ALLOWED_USERS
 import hashlib
 from telegram.error import BadRequest
-from config import ROLE_ADMIN, ROLE_OPERATOR, OPERATOR_DATA_LIMIT_GB, OPERATOR_TIME_LIMIT_HOURS
+from config import ROLE_ADMIN, ROLE_OPERATOR, OPERATOR_DATA_LIMIT_GB, OPERATOR_TIME_LIMIT_HOURS, ITEMS_PER_PAGE
 from operators import operators_db
 from utils import is_allowed, is_admin, is_operator, can_operator_create_peer, log_command_with_role
 
 from config import ALLOWED_USERS
 from wg_api import api_client
+from cache import get_all_stats
+from snapshot_store import snapshot_store, SnapshotRef, peer_token
+from ip_allocator import ip_allocator
+from wg_keys import key_pool
 from keyboards import (
     main_menu, config_menu, paginated_configs_menu, restrictions_menu,
     paginated_restricted_peers_menu, paginated_unrestricted_peers_menu,
     paginated_reset_traffic_menu, confirmation_menu, back_button,
-    refresh_button, operator_main_menu,
-    InlineKeyboardMarkup, decode_callback_data
+    refresh_button, operator_main_menu, multi_select_peers_menu,
+    InlineKeyboardMarkup
 )
 from utils import (
     is_allowed, get_user_name, format_peer_info,
-    format_system_status, format_config_summary,
+    format_system_status, format_config_summary, format_cache_stats,
     send_large_message, log_command, log_callback, log_error,
-    format_bytes_human, format_time_ago,
+    format_bytes_human, format_time_ago, stale_notice,
     log_callback_with_role, log_command_with_role,
-    is_admin, is_operator, can_operator_create_peer
+    is_admin, is_operator, can_operator_create_peer, get_user_role
 )
+from router import CallbackRouter, CallbackForbidden, UnknownCallback, BadCallbackArgs, ExpiredCallback
+from callback_registry import callback_registry, REGISTRY_PREFIX
 
 logger = logging.getLogger(__name__)
 
+# Respuesta cuando la lista que vio el usuario ya no está en snapshot_store
+EXPIRED_LIST_MESSAGE = "⌛ La lista de peers ha cambiado. Vuelve a abrirla para continuar."
+
 # ================= FUNCIONES AUXILIARES ================= #
 def format_peer_for_list(peer: Dict) -> str:
     """Formatea un peer para la lista básica"""
@@ -253,52 +263,12 @@ def format_schedule_job_for_list(job: Dict) -> str:
 
 # ================= GENERACIÓN DE CLAVES ================= #
 def generate_wireguard_keys():
-    """Genera un par de claves WireGuard válidas"""
-    try:
-        # Intentar usar el comando wg si está disponible
-        private_key = subprocess.run(
-            ["wg", "genkey"],
-            capture_output=True,
-            text=True,
-            check=True
-        ).stdout.strip()
-        
-        public_key = subprocess.run(
-            ["wg", "pubkey"],
-            input=private_key,
-            capture_output=True,
-            text=True,
-            check=True
-        ).stdout.strip()
-        
-        return private_key, public_key
-        
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        # Fallback: generar claves base64 válidas (32 bytes)
-        private_key = base64.b64encode(secrets.token_bytes(32)).decode('utf-8')
-        # Para WireGuard, la clave pública se calcula de forma criptográfica
-        # Como no tenemos la librería criptográfica, generamos otra clave
-        # En producción real, usaría cryptography o wg nativo
-        public_key = base64.b64encode(secrets.token_bytes(32)).decode('utf-8')
-        logger.warning("Usando claves simuladas (wg no disponible)")
-        return private_key, public_key
+    """Genera un par de claves WireGuard válidas (privada, pública)"""
+    return key_pool.keypair()
 
 def generate_preshared_key():
     """Genera una pre-shared key para WireGuard"""
-    try:
-        # Usar wg genpsk si está disponible
-        preshared_key = subprocess.run(
-            ["wg", "genpsk"],
-            capture_output=True,
-            text=True,
-            check=True
-        ).stdout.strip()
-        return preshared_key
-        
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        # Fallback: generar clave base64 válida (32 bytes)
-        preshared_key = base64.b64encode(secrets.token_bytes(32)).decode('utf-8')
-        return preshared_key
+    return key_pool.psk()
 
 def create_peer_hash(config_name: str, public_key: str, peer_name: str) -> str:
     """Crea un hash único y corto para identificar un peer (versión simplificada)"""
@@ -378,6 +348,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /help - Mostrar esta ayuda
 /stats - Estadísticas del sistema
 /configs - Listar configuraciones
+/cache - Métricas de la cache
+/find <texto> - Buscar peers por nombre, IP o clave
 
 *Funciones completas:*
 • Gestionar todas las configuraciones WireGuard
@@ -419,6 +391,63 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode="Markdown"
     )
 
+async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Manejador del comando /cancel: abandona la operación en curso"""
+    if not is_allowed(update):
+        return
+    
+    log_command(update, "cancel")
+    user_id = update.effective_user.id
+    
+    # Las selecciones múltiples a medias se descartan siempre
+    for key in [key for key in context.user_data if key.startswith("bulk_")]:
+        del context.user_data[key]
+    
+    # Limpiar estado de creación de peer para operador/admin
+    if context.user_data.get('waiting_for_operator_peer_name', False) or \
+       context.user_data.get('waiting_for_operator_peer_endpoint', False):
+        for key in ['waiting_for_operator_peer_name', 'config_name_for_operator_peer',
+                   'operator_peer_name', 'waiting_for_operator_peer_endpoint']:
+            if key in context.user_data:
+                del context.user_data[key]
+        
+        await update.message.reply_text(
+            "✅ Creación de peer cancelada.",
+            reply_markup=operator_main_menu() if is_operator(user_id) else main_menu(is_admin(user_id), is_operator(user_id))
+        )
+        return
+    
+    # Limpiar estado de schedule job si está activo
+    if context.user_data.get('waiting_for_schedule_job_value', False):
+        for key in ['configuring_schedule_job', 'schedule_job_config_name', 'schedule_job_peer_token',
+                   'schedule_job_public_key', 'schedule_job_type', 
+                   'waiting_for_schedule_job_value']:
+            if key in context.user_data:
+                del context.user_data[key]
+        
+        await update.message.reply_text(
+            "✅ Configuración de Schedule Job cancelada.",
+            reply_markup=operator_main_menu() if is_operator(user_id) else main_menu(is_admin(user_id), is_operator(user_id))
+        )
+        return
+    
+    # Limpiar estado de agregar peer normal y de búsqueda
+    for key in ['waiting_for_peer_name', 'config_name_for_peer', 'waiting_for_peer_data',
+                'waiting_for_peer_search', 'peer_search_config', 'peer_search_target']:
+        if key in context.user_data:
+            del context.user_data[key]
+    
+    if is_operator(user_id):
+        await update.message.reply_text(
+            "✅ Operación cancelada.",
+            reply_markup=operator_main_menu()
+        )
+    else:
+        await update.message.reply_text(
+            "✅ Operación cancelada. Usa /start para volver al menú principal.",
+            reply_markup=main_menu(is_admin(user_id), is_operator(user_id))
+        )
+
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Manejador del comando /stats"""
     if not is_allowed(update):
@@ -432,7 +461,7 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     
     # Obtener datos
-    result = api_client.get_system_status()
+    result = await api_client.get_system_status()
     
     if not result.get("status"):
         await update.message.reply_text(
@@ -458,9 +487,59 @@ async def configs_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     log_command(update, "configs")
     await show_configurations(update)
 
+async def cache_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Manejador del comando /cache"""
+    if not is_allowed(update):
+        return
+    
+    log_command(update, "cache")
+    
+    message = format_cache_stats(get_all_stats())
+    
+    store = snapshot_store.stats()
+    message += (
+        f"\n\n📦 <b>Snapshots</b>: {store['snapshots']} versiones de {store['configs']} configs, "
+        f"{store['views']} vistas, {store['pages']} páginas renderizadas "
+        f"(se conservan {store['retention']} versiones por config)\n"
+        f"🔍 <b>Peers indexados para búsqueda</b>: {store['indexed_peers']}"
+    )
+    
+    callbacks = callback_registry.stats()
+    message += (
+        f"\n🎫 <b>Callbacks registrados</b>: {callbacks['entries']}/{callbacks['max_entries']}"
+        f"{' (firmados)' if callbacks['signed'] else ''}"
+    )
+    
+    allocator = ip_allocator.stats()
+    if allocator['configs']:
+        free = ", ".join(f"{html.escape(name)}: {count}" for name, count in allocator['free'].items())
+        message += f"\n🧮 <b>IPs libres</b>: {free} ({allocator['reservations']} reservadas)"
+    
+    keys = key_pool.stats()
+    message += (
+        f"\n🔑 <b>Pool de claves</b>: {keys['keypairs']}/{keys['size']} pares, {keys['psks']} PSK "
+        f"({keys['misses']} generadas sin pool)"
+    )
+    
+    # Endpoints con el circuit breaker abierto o en prueba
+    circuits = api_client.circuit_status()
+    if circuits:
+        message += "\n\n⚡ <b>Circuitos abiertos</b>\n"
+        message += "\n".join(
+            f"<code>{html.escape(circuit['name'])}</code>: {circuit['state']}, reintento en {circuit['retry_after']:.0f}s"
+            for circuit in circuits
+        )
+    
+    await update.message.reply_text(
+        message,
+        parse_mode="HTML"
+    )
+
 # ================= CALLBACK HANDLERS ================= #
+router = CallbackRouter(callback_registry)
+
 async def callback_handler(update: Update, context: CallbackContext):
-    """Manejador central de callbacks"""
+    """Manejador central de callbacks: despacha según la tabla de rutas (ver final del módulo)"""
     if not is_allowed(update):
         return
     
@@ -474,301 +553,38 @@ async def callback_handler(update: Update, context: CallbackContext):
     
     logger.debug(f"CALLBACK DEBUG: {callback_data}")
     
-    # ================= VERIFICACIÓN DE ROLES ================= #
-    # Lista de acciones permitidas solo para admins
-    admin_only_actions = [
-        "handshake", "configs", "configs_summary", "page_configs:",
-        "system_status", "protocols", "stats",
-        "cfg:", "peers:", "peers_detailed:", "peers_detailed_paginated:",
-        "delete_peer:", "page_delete_peer:", "delete_peer_confirm:", "delete_peer_execute:",
-        "schedule_jobs_menu:", "schedule_job_peer:", "add_schedule_job_data:", "add_schedule_job_date:",
-        "delete_schedule_job_confirm:", "delete_schedule_job_execute:",
-        "restrictions:", "restricted_peers:", "restrict_peer_menu:",
-        "unrestrict:", "restrict:", "page_res:", "page_unres:",
-        "reset_traffic:", "reset_traffic_confirm:", "reset_traffic_execute:"  # AGREGADOS
-    ]
-    
-    # Verificar si es operador intentando acceder a funciones de admin
-    if is_operator(user_id):
-        for admin_action in admin_only_actions:
-            if callback_data.startswith(admin_action):
-                await query.edit_message_text(
-                    "❌ *Acceso restringido*\n\n"
-                    "Esta función solo está disponible para administradores.\n\n"
-                    "Como operador solo puedes crear peers temporales.",
-                    reply_markup=operator_main_menu(),
-                    parse_mode="Markdown"
-                )
-                return
+    # Pulsar cualquier botón abandona una búsqueda pendiente (el botón de
+    # buscar la vuelve a activar): el texto siguiente ya no es una consulta
+    for key in ('waiting_for_peer_search', 'peer_search_config', 'peer_search_target'):
+        context.user_data.pop(key, None)
     
     try:
-        # ================= MANEJO DE ACCIONES DE OPERADORES ================= #
-        if callback_data == "main_menu":
-            if is_operator(user_id):
-                await handle_operator_main_menu(query)
-            else:
-                await handle_main_menu(query)
-        
-        elif callback_data == "operator_main_menu":
-            await handle_operator_main_menu(query)
-        
-        elif callback_data == "operator_create_peer_menu":
-            await handle_operator_create_peer(query, context)
-        
-        # ================= MANEJO DE ACCIONES PRINCIPALES ================= #
-        elif callback_data == "handshake":
-            await handle_handshake(query)
-        
-        elif callback_data == "configs":
-            await handle_configs(query)
-        
-        elif callback_data.startswith("configs_summary"):
-            await handle_configs_summary(query)
-        
-        elif callback_data == "system_status":
-            await handle_system_status(query)
-        
-        elif callback_data == "protocols":
-            await handle_protocols(query)
-        
-        elif callback_data == "stats":
-            await handle_stats(query)
-        
-        elif callback_data == "help":
-            await handle_help(query)
-        
-        elif callback_data == "operators_list":
-            await handle_operators_list(query, context)
-
-        elif callback_data == "operators_detailed":
-            await handle_operators_detailed(query, context)        
-
-        # ================= MANEJO DE RESTRICCIONES ================= #
-        elif callback_data.startswith("restrictions:"):
-            parts = callback_data.split(":")
-            if len(parts) > 1:
-                await handle_restrictions_menu(query, parts[1])
-        
-        elif callback_data.startswith("restricted_peers:"):
-            parts = callback_data.split(":")
-            if len(parts) >= 3:
-                config_name = parts[1]
-                page = int(parts[2])
-                await handle_restricted_peers_list(query, context, config_name, page)
-        
-        elif callback_data.startswith("restrict_peer_menu:"):
-            parts = callback_data.split(":")
-            if len(parts) >= 3:
-                config_name = parts[1]
-                page = int(parts[2])
-                await handle_unrestricted_peers_list(query, context, config_name, page)
-        
-        elif callback_data.startswith("unrestrict:"):
-            parts = callback_data.split(":")
-            if len(parts) >= 3:
-                config_name = parts[1]
-                peer_index = int(parts[2])
-                await handle_unrestrict_simple(query, context, config_name, peer_index)
-        
-        elif callback_data.startswith("restrict:"):
-            parts = callback_data.split(":")
-            if len(parts) >= 3:
-                config_name = parts[1]
-                peer_index = int(parts[2])
-                await handle_restrict_simple(query, context, config_name, peer_index)
-        
-        # ================= PAGINACIÓN DE RESTRICCIONES ================= #
-        elif callback_data.startswith("page_res:"):
-            parts = callback_data.split(":")
-            if len(parts) >= 3:
-                config_name = parts[1]
-                page = int(parts[2])
-                await handle_restricted_peers_list(query, context, config_name, page)
-        
-        elif callback_data.startswith("page_unres:"):
-            parts = callback_data.split(":")
-            if len(parts) >= 3:
-                config_name = parts[1]
-                page = int(parts[2])
-                await handle_unrestricted_peers_list(query, context, config_name, page)
-        
-        # ================= MANEJO DE LIMPIAR TRÁFICO ================= #
-        elif callback_data.startswith("reset_traffic:"):
-            parts = callback_data.split(":")
-            if len(parts) >= 3:
-                config_name = parts[1]
-                page = int(parts[2])
-                await handle_reset_traffic_menu(query, context, config_name, page)
-        
-        elif callback_data.startswith("reset_traffic_confirm:"):
-            parts = callback_data.split(":")
-            if len(parts) >= 4:
-                config_name = parts[1]
-                peer_index = int(parts[2])
-                page = int(parts[3])
-                await handle_reset_traffic_confirm(query, config_name, peer_index, page)
-
-        elif callback_data.startswith("reset_traffic_final:"):
-            parts = callback_data.split(":")
-            if len(parts) >= 4:
-                config_name = parts[1]
-                peer_index = parts[2]
-                page = parts[3]
-                await handle_reset_traffic_final(query, context, config_name, peer_index, page)
-        
-        # ================= MANEJO DE PAGINACIÓN ================= #
-        elif callback_data.startswith("page_configs:"):
-            parts = callback_data.split(":")
-            page = int(parts[1]) if len(parts) > 1 else 0
-            await handle_configs(query, page)
-        
-        elif callback_data.startswith("page_delete_peer:"):
-            parts = callback_data.split(":")
-            if len(parts) >= 3:
-                config_name = parts[1]
-                page = int(parts[2])
-                await handle_delete_peer_menu(query, config_name, page)
-        
-        elif callback_data.startswith("page_schedule_jobs:"):
-            parts = callback_data.split(":")
-            if len(parts) >= 4:
-                config_name = parts[1]
-                peer_index = parts[2]
-                page = int(parts[3])
-                await handle_schedule_jobs_list(query, context, config_name, peer_index, page)
-        
-        # ================= MANEJO DE CONFIGURACIONES ESPECÍFICAS ================= #
-        elif callback_data.startswith("cfg:"):
-            parts = callback_data.split(":")
-            if len(parts) > 1:
-                await handle_config_detail(query, parts[1])
-        
-        elif callback_data.startswith("peers_detailed:"):
-            parts = callback_data.split(":")
-            if len(parts) > 1:
-                config_name = parts[1]
-                await handle_peers_detailed(query, config_name)
-        
-        elif callback_data.startswith("peers_detailed_full:"):
-            parts = callback_data.split(":")
-            if len(parts) >= 2:
-                config_name = parts[1]
-                await handle_peers_detailed_full(query, config_name)
-        
-        elif callback_data.startswith("peers_detailed_paginated:"):
-            parts = callback_data.split(":")
-            if len(parts) >= 3:
-                config_name = parts[1]
-                page = int(parts[2])
-                await handle_peers_detailed_paginated(query, config_name, page)
-        
-        # ================= MANEJO DE ELIMINACIÓN DE PEERS ================= #
-        elif callback_data.startswith("delete_peer:"):
-            parts = callback_data.split(":")
-            if len(parts) > 1:
-                await handle_delete_peer_menu(query, parts[1], 0)
-        
-        elif callback_data.startswith("delete_peer_confirm:"):
-            parts = callback_data.split(":")
-            if len(parts) >= 3:
-                config_name = parts[1]
-                peer_index = parts[2]
-                await handle_delete_peer_confirm(query, config_name, peer_index)
-        
-        elif callback_data.startswith("delete_peer_execute:"):
-            parts = callback_data.split(":")
-            if len(parts) >= 3:
-                config_name = parts[1]
-                peer_index_encoded = parts[2]
-                peer_index = decode_callback_data(peer_index_encoded)
-                await handle_delete_peer_final(query, config_name, peer_index)
-        
-        # ================= MANEJO DE AGREGAR PEER (AUTOMÁTICO) ================= #
-        elif callback_data.startswith("add_peer:"):
-            parts = callback_data.split(":")
-            if len(parts) > 1:
-                await handle_add_peer(query, context, parts[1])
-        
-        # ================= MANEJO DE DESCARGA DE CONFIGURACIÓN ================= #
-        elif callback_data.startswith("download_config:"):
-            parts = callback_data.split(":")
-            if len(parts) >= 2:
-                peer_hash = parts[1]
-                await handle_download_peer_config(query, context, peer_hash)
-        
-        # ================= MANEJO DE SCHEDULE JOBS ================= #
-        elif callback_data.startswith("schedule_jobs_menu:"):
-            parts = callback_data.split(":")
-            if len(parts) > 1:
-                await handle_schedule_jobs_menu(query, context, parts[1])
-        
-        elif callback_data.startswith("schedule_job_peer:"):
-            parts = callback_data.split(":")
-            if len(parts) >= 3:
-                config_name = parts[1]
-                peer_index = int(parts[2])
-                await handle_schedule_job_peer_selected(query, context, config_name, peer_index)
-        
-        elif callback_data.startswith("add_schedule_job_data:"):
-            parts = callback_data.split(":")
-            if len(parts) >= 3:
-                config_name = parts[1]
-                peer_index = parts[2]
-                await handle_add_schedule_job_data(query, context, config_name, peer_index)
-        
-        elif callback_data.startswith("add_schedule_job_date:"):
-            parts = callback_data.split(":")
-            if len(parts) >= 3:
-                config_name = parts[1]
-                peer_index = parts[2]
-                await handle_add_schedule_job_date(query, context, config_name, peer_index)
-        
-        # ================= MANEJO DE ELIMINACIÓN DE SCHEDULE JOBS ================= #
-        elif callback_data.startswith("delete_schedule_job_final:"):
-            parts = callback_data.split(":")
-            if len(parts) >= 4:
-                config_name = parts[1]
-                peer_index = parts[2]
-                job_index = parts[3]
-                await handle_delete_schedule_job_execute(query, context, config_name, peer_index, job_index)
-        
-        elif callback_data.startswith("delete_schedule_job_all:"):
-            parts = callback_data.split(":")
-            if len(parts) >= 3:
-                config_name = parts[1]
-                peer_index = parts[2]
-                await handle_delete_schedule_job_confirm(query, context, config_name, peer_index, "all")
-        
-        elif callback_data.startswith("delete_schedule_job_confirm:"):
-            parts = callback_data.split(":")
-            if len(parts) >= 4:
-                config_name = parts[1]
-                peer_index = parts[2]
-                job_index = parts[3]
-                await handle_delete_schedule_job_confirm(query, context, config_name, peer_index, job_index)
-        
-        elif callback_data.startswith("delete_schedule_job_execute:"):
-            parts = callback_data.split(":")
-            if len(parts) >= 4:
-                config_name = parts[1]
-                peer_index = parts[2]
-                job_index = parts[3]
-                await handle_delete_schedule_job_execute(query, context, config_name, peer_index, job_index)
-        
-        # ================= ACCIÓN NO RECONOCIDA ================= #
-        else:
-            logger.warning(f"Acción no reconocida: {callback_data}")
-            if is_operator(user_id):
-                await query.edit_message_text(
-                    f"❌ Acción no reconocida: {callback_data}",
-                    reply_markup=operator_main_menu()
-                )
-            else:
-                await query.edit_message_text(
-                    f"❌ Acción no reconocida: {callback_data}",
-                    reply_markup=back_button("main_menu")
-                )
-                
+        await router.dispatch(query, context, callback_data, get_user_role(user_id))
+    
+    except CallbackForbidden:
+        # Operador intentando acceder a funciones de admin
+        await query.edit_message_text(
+            "❌ *Acceso restringido*\n\n"
+            "Esta función solo está disponible para administradores.\n\n"
+            "Como operador solo puedes crear peers temporales.",
+            reply_markup=operator_main_menu(),
+            parse_mode="Markdown"
+        )
+    
+    except ExpiredCallback:
+        logger.info(f"Callback caducado: {callback_data}")
+        await query.edit_message_text(
+            "⌛ Este botón ha caducado. Vuelve a abrir el menú para continuar.",
+            reply_markup=operator_main_menu() if is_operator(user_id) else back_button("main_menu")
+        )
+    
+    except (UnknownCallback, BadCallbackArgs) as e:
+        logger.warning(f"Acción no reconocida: {callback_data} ({e})")
+        await query.edit_message_text(
+            f"❌ Acción no reconocida: {callback_data}",
+            reply_markup=operator_main_menu() if is_operator(user_id) else back_button("main_menu")
+        )
+    
     except BadRequest as e:
         if "Message is not modified" in str(e):
             # Ignorar este error específico - el mensaje ya está actualizado
@@ -800,6 +616,9 @@ async def callback_handler(update: Update, context: CallbackContext):
                     f"❌ Error: {str(e)[:50]}...",
                     show_alert=True
                 )
+    finally:
+        # Los botones registrados al pintar la pantalla sobreviven a un reinicio
+        callback_registry.save_later()
 
 async def handle_operator_main_menu(query):
     """Muestra el menú principal para operadores"""
@@ -853,12 +672,12 @@ async def handle_restricted_peers_list(query, context: CallbackContext, config_n
     """Muestra la lista paginada de peers restringidos - VERSIÓN SIMPLIFICADA"""
     await query.edit_message_text(f"👥 Obteniendo peers restringidos...")
     
-    result = api_client.get_peers(config_name)
+    result = await api_client.get_peers(config_name)
     
     if not result.get("status"):
         await query.edit_message_text(
             f"❌ Error: {result.get('message', 'Error desconocido')}",
-            reply_markup=back_button(f"restrictions:{config_name}")
+            reply_markup=back_button(("restrictions", config_name))
         )
         return
     
@@ -867,14 +686,11 @@ async def handle_restricted_peers_list(query, context: CallbackContext, config_n
     if not restricted_peers:
         await query.edit_message_text(
             f"✅ *No hay peers restringidos*\n\nTodos los peers tienen acceso normal.",
-            reply_markup=back_button(f"restrictions:{config_name}"),
+            reply_markup=back_button(("restrictions", config_name)),
             parse_mode="Markdown"
         )
         return
     
-    # Guardar en el contexto para uso posterior
-    context.user_data[f'restricted_peers_{config_name}'] = restricted_peers
-    
     total_peers = len(restricted_peers)
     total_pages = (total_peers - 1) // 6 + 1  # Cambiado a 6
     
@@ -883,7 +699,8 @@ async def handle_restricted_peers_list(query, context: CallbackContext, config_n
     
     keyboard = paginated_restricted_peers_menu(restricted_peers, config_name, page)
     
-    message = f"🚫 *Peers Restringidos - {config_name}*\n\n"
+    message = stale_notice(result)
+    message += f"🚫 *Peers Restringidos - {config_name}*\n\n"
     message += f"📊 Total: {total_peers}\n"
     message += f"📄 Página {page + 1} de {total_pages}\n\n"
     message += "Selecciona un peer para quitar restricción:"
@@ -898,38 +715,34 @@ async def handle_unrestricted_peers_list(query, context: CallbackContext, config
     """Muestra la lista paginada de peers NO restringidos - VERSIÓN SIMPLIFICADA"""
     await query.edit_message_text(f"🔒 Obteniendo peers...")
     
-    result = api_client.get_peers(config_name)
+    result = await api_client.get_peers(config_name)
     
     if not result.get("status"):
         await query.edit_message_text(
             f"❌ Error: {result.get('message', 'Error desconocido')}",
-            reply_markup=back_button(f"restrictions:{config_name}")
+            reply_markup=back_button(("restrictions", config_name))
         )
         return
     
-    all_peers = result.get("data", [])
-    restricted_peers = result.get("restricted_data", [])
-    
-    # Obtener claves de peers restringidos
-    restricted_keys = {peer.get('id') for peer in restricted_peers}
+    # Peers no restringidos: se calculan una vez por snapshot y se comparten
+    ref = SnapshotRef(config_name, result["metadata"]["version"], "unrestricted")
+    unrestricted_peers = snapshot_store.resolve(ref)
     
-    # Filtrar peers no restringidos
-    unrestricted_peers = []
-    for peer in all_peers:
-        if peer.get('id') not in restricted_keys:
-            unrestricted_peers.append(peer)
+    if unrestricted_peers is None:
+        await query.edit_message_text(
+            EXPIRED_LIST_MESSAGE,
+            reply_markup=back_button(("restrictions", config_name))
+        )
+        return
     
     if not unrestricted_peers:
         await query.edit_message_text(
             f"ℹ️ *Todos los peers están restringidos*\n\nNo hay peers disponibles.",
-            reply_markup=back_button(f"restrictions:{config_name}"),
+            reply_markup=back_button(("restrictions", config_name)),
             parse_mode="Markdown"
         )
         return
     
-    # Guardar en el contexto
-    context.user_data[f'unrestricted_peers_{config_name}'] = unrestricted_peers
-    
     total_peers = len(unrestricted_peers)
     total_pages = (total_peers - 1) // 6 + 1  # Cambiado a 6
     
@@ -938,7 +751,8 @@ async def handle_unrestricted_peers_list(query, context: CallbackContext, config
     
     keyboard = paginated_unrestricted_peers_menu(unrestricted_peers, config_name, page)
     
-    message = f"🔒 *Restringir Peer - {config_name}*\n\n"
+    message = stale_notice(result)
+    message += f"🔒 *Restringir Peer - {config_name}*\n\n"
     message += f"📊 Disponibles: {total_peers}\n"
     message += f"📄 Página {page + 1} de {total_pages}\n\n"
     message += "Selecciona un peer para restringir:"
@@ -949,33 +763,33 @@ async def handle_unrestricted_peers_list(query, context: CallbackContext, config
         parse_mode="Markdown"
     )
 
-async def handle_unrestrict_simple(query, context: CallbackContext, config_name: str, peer_index: int):
+async def handle_unrestrict_simple(query, context: CallbackContext, config_name: str, token: str):
     """Quitar restricción de forma simplificada - VERSIÓN SEGURA CON HTML"""
     await query.edit_message_text(f"🔓 Quitando restricción...")
     
-    # Obtener peers del contexto
-    restricted_peers = context.user_data.get(f'restricted_peers_{config_name}', [])
+    # Buscar el peer por su token en el snapshot actual
+    peer_result = await api_client.get_peer(config_name, token)
     
-    if peer_index < 0 or peer_index >= len(restricted_peers):
+    if not peer_result.get("status"):
         await query.edit_message_text(
-            f"❌ Índice de peer inválido",
-            reply_markup=back_button(f"restricted_peers:{config_name}:0")
+            f"❌ {peer_result.get('message', 'Peer no encontrado')}",
+            reply_markup=back_button(("restricted_peers", config_name, 0))
         )
         return
     
-    peer = restricted_peers[peer_index]
+    peer = peer_result["data"]
     public_key = peer.get('id', '')
     peer_name = peer.get('name', 'Desconocido')
     
     if not public_key:
         await query.edit_message_text(
             f"❌ No se pudo obtener la clave pública",
-            reply_markup=back_button(f"restricted_peers:{config_name}:0")
+            reply_markup=back_button(("restricted_peers", config_name, 0))
         )
         return
     
     # Llamar a la API
-    result = api_client.allow_access_peer(config_name, public_key)
+    result = await api_client.allow_access_peer(config_name, public_key)
     
     # Escapar caracteres HTML
     peer_name_safe = html.escape(peer_name)
@@ -987,8 +801,8 @@ async def handle_unrestrict_simple(query, context: CallbackContext, config_name:
             f"Peer: {peer_name_safe}\n"
             f"Ahora puede conectarse.",
             reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("🔄 Actualizar lista", callback_data=f"restricted_peers:{config_name}:0")],
-                [InlineKeyboardButton("⬅️ Volver", callback_data=f"restrictions:{config_name}")]
+                [InlineKeyboardButton("🔄 Actualizar lista", callback_data=callback_registry.pack("restricted_peers", config_name, 0))],
+                [InlineKeyboardButton("⬅️ Volver", callback_data=callback_registry.pack("restrictions", config_name))]
             ]),
             parse_mode="HTML"
         )
@@ -996,37 +810,37 @@ async def handle_unrestrict_simple(query, context: CallbackContext, config_name:
         error_msg = html.escape(result.get('message', 'Error desconocido'))
         await query.edit_message_text(
             f"❌ <b>Error</b>\n\n{error_msg}",
-            reply_markup=back_button(f"restricted_peers:{config_name}:0"),
+            reply_markup=back_button(("restricted_peers", config_name, 0)),
             parse_mode="HTML"
         )
 
-async def handle_restrict_simple(query, context: CallbackContext, config_name: str, peer_index: int):
+async def handle_restrict_simple(query, context: CallbackContext, config_name: str, token: str):
     """Restringir peer de forma simplificada - VERSIÓN SEGURA CON HTML"""
     await query.edit_message_text(f"🔒 Restringiendo peer...")
     
-    # Obtener peers del contexto
-    unrestricted_peers = context.user_data.get(f'unrestricted_peers_{config_name}', [])
+    # Buscar el peer por su token en el snapshot actual
+    peer_result = await api_client.get_peer(config_name, token)
     
-    if peer_index < 0 or peer_index >= len(unrestricted_peers):
+    if not peer_result.get("status"):
         await query.edit_message_text(
-            f"❌ Índice de peer inválido",
-            reply_markup=back_button(f"restrict_peer_menu:{config_name}:0")
+            f"❌ {peer_result.get('message', 'Peer no encontrado')}",
+            reply_markup=back_button(("restrict_peer_menu", config_name, 0))
         )
         return
     
-    peer = unrestricted_peers[peer_index]
+    peer = peer_result["data"]
     public_key = peer.get('id', '')
     peer_name = peer.get('name', 'Desconocido')
     
     if not public_key:
         await query.edit_message_text(
             f"❌ No se pudo obtener la clave pública",
-            reply_markup=back_button(f"restrict_peer_menu:{config_name}:0")
+            reply_markup=back_button(("restrict_peer_menu", config_name, 0))
         )
         return
     
     # Llamar a la API
-    result = api_client.restrict_peer(config_name, public_key)
+    result = await api_client.restrict_peer(config_name, public_key)
     
     # Escapar caracteres HTML
     peer_name_safe = html.escape(peer_name)
@@ -1038,8 +852,8 @@ async def handle_restrict_simple(query, context: CallbackContext, config_name: s
             f"Peer: {peer_name_safe}\n"
             f"Ya no podrá conectarse.",
             reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("🔄 Actualizar lista", callback_data=f"restrict_peer_menu:{config_name}:0")],
-                [InlineKeyboardButton("⬅️ Volver", callback_data=f"restrictions:{config_name}")]
+                [InlineKeyboardButton("🔄 Actualizar lista", callback_data=callback_registry.pack("restrict_peer_menu", config_name, 0))],
+                [InlineKeyboardButton("⬅️ Volver", callback_data=callback_registry.pack("restrictions", config_name))]
             ]),
             parse_mode="HTML"
         )
@@ -1047,96 +861,203 @@ async def handle_restrict_simple(query, context: CallbackContext, config_name: s
         error_msg = html.escape(result.get('message', 'Error desconocido'))
         await query.edit_message_text(
             f"❌ <b>Error</b>\n\n{error_msg}",
-            reply_markup=back_button(f"restrict_peer_menu:{config_name}:0"),
+            reply_markup=back_button(("restrict_peer_menu", config_name, 0)),
             parse_mode="HTML"
         )
 
-async def handle_unrestrict_confirm(query, context: CallbackContext, config_name: str, public_key_short: str, peer_index: str):
-    """Muestra confirmación para quitar restricción a un peer"""
-    await query.edit_message_text(f"🔍 Buscando información del peer...")
+# ================= HANDLERS DE ACCIONES MASIVAS ================= #
+# Código corto de acción -> textos, método de la API y vista de snapshot_store
+BULK_ACTIONS = {
+    "r": {"title": "Restringir varios", "verb": "restringir", "done": "restringidos", "method": "restrict_peers", "view": "unrestricted"},
+    "u": {"title": "Quitar restricción a varios", "verb": "quitar la restricción a", "done": "sin restricción", "method": "allow_access_peers", "view": "restricted"},
+    "d": {"title": "Eliminar varios", "verb": "eliminar", "done": "eliminados", "method": "delete_peers", "view": "peers"}
+}
+
+def _bulk_back_target(action: str, config_name: str) -> tuple:
+    """Vista a la que se vuelve desde una acción masiva"""
+    return ("cfg", config_name) if action == "d" else ("restrictions", config_name)
+
+def _bulk_peers(state: Optional[Dict]) -> Optional[Sequence]:
+    """Peers de una selección múltiple, o None si ha expirado"""
+    return snapshot_store.resolve(state["ref"]) if state else None
+
+def _drop_stale_bulk_states(user_data: Dict):
+    """Quita las selecciones abandonadas cuyo snapshot ya se descartó"""
+    for key in [key for key in user_data if key.startswith("bulk_")]:
+        if _bulk_peers(user_data[key]) is None:
+            del user_data[key]
+
+async def handle_bulk_menu(query, context: CallbackContext, action: str, config_name: str):
+    """Inicia una selección múltiple de peers con la lista actual"""
+    if action not in BULK_ACTIONS:
+        await query.edit_message_text(
+            "❌ Acción no válida",
+            reply_markup=back_button(("cfg", config_name))
+        )
+        return
+    
+    await query.edit_message_text("☑️ Obteniendo peers...")
+    
+    result = await api_client.get_peers(config_name)
     
-    # Obtener información del peer
-    result = api_client.get_peers(config_name)
     if not result.get("status"):
         await query.edit_message_text(
             f"❌ Error: {result.get('message', 'Error desconocido')}",
-            reply_markup=back_button(f"restricted_peers:{config_name}:0")
+            reply_markup=back_button(_bulk_back_target(action, config_name))
         )
         return
     
-    restricted_peers = result.get("restricted_data", [])
+    ref = SnapshotRef(config_name, result["metadata"]["version"], BULK_ACTIONS[action]["view"])
+    peers = snapshot_store.resolve(ref)
     
-    # Buscar el peer específico usando el índice
-    try:
-        idx = int(peer_index)
-        if idx < 0 or idx >= len(restricted_peers):
-            await query.edit_message_text(
-                f"❌ Índice de peer inválido",
-                reply_markup=back_button(f"restricted_peers:{config_name}:0")
-            )
-            return
-        
-        peer_info = restricted_peers[idx]
-        public_key = peer_info.get('id', '')
-        peer_name = peer_info.get('name', 'Desconocido')
-        
-        if not public_key:
-            await query.edit_message_text(
-                f"❌ No se pudo obtener la clave pública del peer",
-                reply_markup=back_button(f"restricted_peers:{config_name}:0")
-            )
-            return
-        
-        allowed_ip = peer_info.get('allowed_ip', 'N/A')
-        
-        message = f"⚠️ *Confirmar Quitar Restricción*\n\n"
-        message += f"¿Estás seguro de que deseas quitar la restricción a este peer?\n\n"
-        message += f"*Peer:* {peer_name}\n"
-        message += f"*Configuración:* {config_name}\n"
-        message += f"*IP:* `{allowed_ip}`\n"
-        message += f"*Clave pública:* `{public_key[:30]}...`\n\n"
-        message += "ℹ️ *Al quitar la restricción, el peer podrá conectarse nuevamente.*"
-        
-        # Codificar la clave pública completa
-        from keyboards import safe_callback_data
-        safe_public_key = safe_callback_data(public_key)
-        
-        keyboard = confirmation_menu(config_name, safe_public_key, "unrestrict", "Quitar Restricción")
-        
+    if not peers:
         await query.edit_message_text(
-            message,
-            reply_markup=keyboard,
-            parse_mode="Markdown"
+            f"ℹ️ No hay peers disponibles para esta acción en {config_name}",
+            reply_markup=back_button(_bulk_back_target(action, config_name))
         )
-        
-    except Exception as e:
-        logger.error(f"Error en confirmación de quitar restricción: {str(e)}")
+        return
+    
+    # Referencia al snapshot: la lista no cambia aunque se refresque la cache
+    _drop_stale_bulk_states(context.user_data)
+    context.user_data[f'bulk_{action}_{config_name}'] = {
+        "ref": ref,
+        "selected": set()
+    }
+    
+    await show_bulk_selection(query, context, action, config_name, 0)
+
+async def show_bulk_selection(query, context: CallbackContext, action: str, config_name: str, page: int = 0):
+    """Muestra la página actual de la selección múltiple"""
+    state = context.user_data.get(f'bulk_{action}_{config_name}')
+    peers = _bulk_peers(state)
+    
+    if peers is None or action not in BULK_ACTIONS:
+        context.user_data.pop(f'bulk_{action}_{config_name}', None)
         await query.edit_message_text(
-            f"❌ Error al procesar la solicitud: {str(e)}",
-            reply_markup=back_button(f"restricted_peers:{config_name}:0")
+            "⌛ La selección ha expirado. Vuelve a abrir el menú.",
+            reply_markup=back_button(_bulk_back_target(action, config_name))
         )
+        return
+    
+    total_pages = (len(peers) - 1) // ITEMS_PER_PAGE + 1
+    page = max(0, min(page, total_pages - 1))
+    
+    message = f"☑️ <b>{BULK_ACTIONS[action]['title']} - {html.escape(config_name)}</b>\n\n"
+    message += f"📊 Peers: {len(peers)}\n"
+    message += f"✅ Seleccionados: {len(state['selected'])}\n"
+    message += f"📄 Página {page + 1} de {total_pages}\n\n"
+    message += "Toca los peers para marcarlos o desmarcarlos:"
+    
+    await query.edit_message_text(
+        message,
+        reply_markup=multi_select_peers_menu(peers, config_name, action, state["selected"], page),
+        parse_mode="HTML"
+    )
 
-async def handle_unrestrict_execute(query, config_name: str, public_key: str):
-    """Ejecuta la acción de quitar restricción a un peer"""
-    await query.edit_message_text(f"🔄 Quitando restricción al peer...")
+async def handle_bulk_toggle(query, context: CallbackContext, action: str, config_name: str, peer_index: int, page: int):
+    """Marca o desmarca un peer de la selección"""
+    state = context.user_data.get(f'bulk_{action}_{config_name}')
+    peers = _bulk_peers(state)
     
-    result = api_client.allow_access_peer(config_name, public_key)
+    if peers is not None and 0 <= peer_index < len(peers):
+        selected = state["selected"]
+        if peer_index in selected:
+            selected.discard(peer_index)
+        else:
+            selected.add(peer_index)
     
-    if result.get("status"):
-        await query.edit_message_text(
-            f"✅ *Restricción quitada correctamente*\n\n"
-            f"El peer ahora puede conectarse a {config_name}.",
-            reply_markup=back_button(f"restricted_peers:{config_name}:0"),
-            parse_mode="Markdown"
-        )
+    await show_bulk_selection(query, context, action, config_name, page)
+
+async def handle_bulk_select_all(query, context: CallbackContext, action: str, config_name: str, page: int, select: bool):
+    """Marca o desmarca todos los peers de la lista"""
+    state = context.user_data.get(f'bulk_{action}_{config_name}')
+    peers = _bulk_peers(state)
+    
+    if peers is not None:
+        state["selected"] = set(range(len(peers))) if select else set()
+    
+    await show_bulk_selection(query, context, action, config_name, page)
+
+async def handle_bulk_confirm(query, context: CallbackContext, action: str, config_name: str):
+    """Pide confirmación antes de aplicar la acción masiva"""
+    state = context.user_data.get(f'bulk_{action}_{config_name}')
+    peers = _bulk_peers(state)
+    
+    if peers is None or not state["selected"] or action not in BULK_ACTIONS:
+        await show_bulk_selection(query, context, action, config_name, 0)
+        return
+    
+    selected_peers = [peers[i] for i in sorted(state["selected"])]
+    names = [html.escape(peer["name"] or peer["id"][:20]) for peer in selected_peers[:20]]
+    
+    message = f"⚠️ <b>Confirmar acción</b>\n\n"
+    message += f"¿Seguro que deseas {BULK_ACTIONS[action]['verb']} {len(selected_peers)} peers de {html.escape(config_name)}?\n\n"
+    message += "\n".join(f"• {name}" for name in names)
+    if len(selected_peers) > len(names):
+        message += f"\n… y {len(selected_peers) - len(names)} más"
+    if action == "d":
+        message += "\n\n⚠️ <b>Esta acción no se puede deshacer.</b>"
+    
+    keyboard = InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton("✅ Sí, aplicar", callback_data=callback_registry.pack("bexec", action, config_name)),
+            InlineKeyboardButton("❌ Cancelar", callback_data=callback_registry.pack("bpage", action, config_name, 0))
+        ]
+    ])
+    
+    await query.edit_message_text(message, reply_markup=keyboard, parse_mode="HTML")
+
+async def handle_bulk_quit(query, context: CallbackContext, action: str, config_name: str):
+    """Abandona la selección múltiple y vuelve al menú de origen"""
+    context.user_data.pop(f'bulk_{action}_{config_name}', None)
+    
+    if action == "d":
+        await handle_config_detail(query, config_name)
     else:
-        error_msg = result.get('message', 'Error desconocido')
+        await handle_restrictions_menu(query, config_name)
+
+async def handle_bulk_execute(query, context: CallbackContext, action: str, config_name: str):
+    """Aplica la acción masiva en una sola llamada a la API por bloque"""
+    state = context.user_data.pop(f'bulk_{action}_{config_name}', None)
+    peers = _bulk_peers(state)
+    
+    if peers is None or not state["selected"] or action not in BULK_ACTIONS:
         await query.edit_message_text(
-            f"❌ *Error al quitar restricción*\n\n"
-            f"*Error:* {error_msg}",
-            reply_markup=back_button(f"restricted_peers:{config_name}:0"),
-            parse_mode="Markdown"
+            "⌛ La selección ha expirado. Vuelve a abrir el menú.",
+            reply_markup=back_button(_bulk_back_target(action, config_name))
+        )
+        return
+    
+    selected_peers = [peers[i] for i in sorted(state["selected"])]
+    names_by_key = {peer["id"]: peer["name"] or peer["id"][:20] for peer in selected_peers}
+    
+    await query.edit_message_text(f"⏳ Procesando {len(selected_peers)} peers...")
+    
+    api_method = getattr(api_client, BULK_ACTIONS[action]["method"])
+    result = await api_method(config_name, list(names_by_key))
+    
+    data = result.get("data") or {}
+    succeeded = data.get("succeeded", [])
+    failed = data.get("failed", [])
+    
+    message = f"{'✅' if not failed else '⚠️'} <b>{BULK_ACTIONS[action]['title']} - {html.escape(config_name)}</b>\n\n"
+    message += f"✅ {BULK_ACTIONS[action]['done'].capitalize()}: {len(succeeded)}\n"
+    message += f"❌ Fallidos: {len(failed)}"
+    
+    if failed:
+        message += "\n\n<b>Errores:</b>\n"
+        message += "\n".join(
+            f"• {html.escape(names_by_key.get(item['id'], item['id'][:20]))}: {html.escape(str(item['message'])[:60])}"
+            for item in failed[:15]
         )
+        if len(failed) > 15:
+            message += f"\n… y {len(failed) - 15} más"
+    
+    await query.edit_message_text(
+        message,
+        reply_markup=back_button(_bulk_back_target(action, config_name)),
+        parse_mode="HTML"
+    )
 
 # Agregar estas funciones nuevas:
 
@@ -1144,12 +1065,12 @@ async def handle_reset_traffic_menu(query, context: CallbackContext, config_name
     """Muestra el menú para seleccionar peer para resetear tráfico"""
     await query.edit_message_text(f"🧹 Obteniendo peers de {config_name}...")
     
-    result = api_client.get_peers(config_name)
+    result = await api_client.get_peers(config_name)
     
     if not result.get("status"):
         await query.edit_message_text(
             f"❌ Error: {result.get('message', 'Error desconocido')}",
-            reply_markup=back_button(f"cfg:{config_name}")
+            reply_markup=back_button(("cfg", config_name))
         )
         return
     
@@ -1158,13 +1079,10 @@ async def handle_reset_traffic_menu(query, context: CallbackContext, config_name
     if not peers:
         await query.edit_message_text(
             f"⚠️ No hay peers en {config_name}",
-            reply_markup=back_button(f"cfg:{config_name}")
+            reply_markup=back_button(("cfg", config_name))
         )
         return
     
-    # Guardar en el contexto para uso posterior
-    context.user_data[f'reset_traffic_peers_{config_name}'] = peers
-    
     total_peers = len(peers)
     total_pages = (total_peers - 1) // 6 + 1
     
@@ -1184,34 +1102,25 @@ async def handle_reset_traffic_menu(query, context: CallbackContext, config_name
         parse_mode="Markdown"
     )
 
-async def handle_reset_traffic_confirm(query, config_name: str, peer_index: int, page: int):
+async def handle_reset_traffic_confirm(query, config_name: str, token: str, page: int):
     """Muestra confirmación para resetear tráfico de un peer - VERSIÓN SEGURA CON HTML"""
-    # Obtener información del peer
-    result = api_client.get_peers(config_name)
+    # Buscar el peer por su token en el snapshot actual
+    result = await api_client.get_peer(config_name, token)
     if not result.get("status"):
         await query.edit_message_text(
             f"❌ Error: {result.get('message', 'Error desconocido')}",
-            reply_markup=back_button(f"reset_traffic:{config_name}:{page}")
-        )
-        return
-    
-    peers = result.get("data", [])
-    
-    if peer_index < 0 or peer_index >= len(peers):
-        await query.edit_message_text(
-            f"❌ Índice de peer inválido",
-            reply_markup=back_button(f"reset_traffic:{config_name}:{page}")
+            reply_markup=back_button(("reset_traffic", config_name, page))
         )
         return
     
-    peer = peers[peer_index]
+    peer = result["data"]
     peer_name = peer.get('name', 'Desconocido')
     public_key = peer.get('id', '')
     
     if not public_key:
         await query.edit_message_text(
             f"❌ No se pudo obtener la clave pública del peer",
-            reply_markup=back_button(f"reset_traffic:{config_name}:{page}")
+            reply_markup=back_button(("reset_traffic", config_name, page))
         )
         return
     
@@ -1245,11 +1154,11 @@ async def handle_reset_traffic_confirm(query, config_name: str, peer_index: int,
         [
             InlineKeyboardButton(
                 "✅ Sí, limpiar tráfico",
-                callback_data=f"reset_traffic_final:{config_name}:{peer_index}:{page}"
+                callback_data=callback_registry.pack("reset_traffic_final", config_name, token, page)
             ),
             InlineKeyboardButton(
                 "❌ Cancelar",
-                callback_data=f"reset_traffic:{config_name}:{page}"
+                callback_data=callback_registry.pack("reset_traffic", config_name, page)
             )
         ]
     ])
@@ -1260,49 +1169,39 @@ async def handle_reset_traffic_confirm(query, config_name: str, peer_index: int,
         parse_mode="HTML"  # CAMBIADO A HTML
     )
 
-async def handle_reset_traffic_final(query, context: CallbackContext, config_name: str, peer_index: str, page: str):
+async def handle_reset_traffic_final(query, context: CallbackContext, config_name: str, token: str, page: str):
     """Ejecuta el reset del tráfico de un peer - VERSIÓN SEGURA CON HTML"""
     try:
-        peer_idx = int(peer_index)
         page_num = int(page)
         
-        logger.info(f"Reset traffic - Config: {config_name}, Peer idx: {peer_idx}, Page: {page_num}")
+        logger.info(f"Reset traffic - Config: {config_name}, Peer: {token}, Page: {page_num}")
         
         await query.edit_message_text(f"🧹 Reseteando contador de datos...")
         
-        # Obtener información del peer para obtener su clave pública
-        result = api_client.get_peers(config_name)
+        # Obtener el peer por su token para obtener su clave pública
+        result = await api_client.get_peer(config_name, token)
         if not result.get("status"):
             await query.edit_message_text(
                 f"❌ Error: {html.escape(result.get('message', 'Error desconocido'))}",
-                reply_markup=back_button(f"reset_traffic:{config_name}:{page_num}")
+                reply_markup=back_button(("reset_traffic", config_name, page_num))
             )
             return
         
-        peers = result.get("data", [])
-        
-        if peer_idx < 0 or peer_idx >= len(peers):
-            await query.edit_message_text(
-                f"❌ Índice de peer inválido",
-                reply_markup=back_button(f"reset_traffic:{config_name}:{page_num}")
-            )
-            return
-        
-        peer = peers[peer_idx]
+        peer = result["data"]
         public_key = peer.get('id', '')
         peer_name = peer.get('name', 'Desconocido')
         
         if not public_key:
             await query.edit_message_text(
                 f"❌ No se pudo obtener la clave pública del peer",
-                reply_markup=back_button(f"reset_traffic:{config_name}:{page_num}")
+                reply_markup=back_button(("reset_traffic", config_name, page_num))
             )
             return
         
         logger.info(f"Enviando petición a API: endpoint=/resetPeerData/{config_name}, public_key={public_key[:30]}...")
         
         # Llamar a la API para resetear datos
-        result = api_client.reset_peer_data(config_name, public_key)
+        result = await api_client.reset_peer_data(config_name, public_key)
         
         logger.info(f"Respuesta de API: status={result.get('status')}, message={result.get('message')}")
         
@@ -1317,8 +1216,8 @@ async def handle_reset_traffic_final(query, context: CallbackContext, config_nam
                 f"<b>Configuración:</b> {config_name_safe}\n\n"
                 f"El contador de datos ha sido puesto a cero.",
                 reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("🔄 Ver lista actualizada", callback_data=f"reset_traffic:{config_name}:{page_num}")],
-                    [InlineKeyboardButton("⬅️ Volver a Configuración", callback_data=f"cfg:{config_name}")]
+                    [InlineKeyboardButton("🔄 Ver lista actualizada", callback_data=callback_registry.pack("reset_traffic", config_name, page_num))],
+                    [InlineKeyboardButton("⬅️ Volver a Configuración", callback_data=callback_registry.pack("cfg", config_name))]
                 ]),
                 parse_mode="HTML"  # CAMBIADO A HTML
             )
@@ -1329,7 +1228,7 @@ async def handle_reset_traffic_final(query, context: CallbackContext, config_nam
                 f"<b>Error:</b> {error_msg}\n\n"
                 f"<b>Endpoint usado:</b> /resetPeerData/{html.escape(config_name)}\n"
                 f"<b>Public key:</b> <code>{html.escape(public_key[:30])}...</code>",
-                reply_markup=back_button(f"reset_traffic:{config_name}:{page_num}"),
+                reply_markup=back_button(("reset_traffic", config_name, page_num)),
                 parse_mode="HTML"  # CAMBIADO A HTML
             )
     
@@ -1338,172 +1237,10 @@ async def handle_reset_traffic_final(query, context: CallbackContext, config_nam
         await query.edit_message_text(
             f"❌ <b>Error interno al procesar la solicitud</b>\n\n"
             f"<b>Error:</b> {html.escape(str(e))}",
-            reply_markup=back_button(f"cfg:{config_name}"),
+            reply_markup=back_button(("cfg", config_name)),
             parse_mode="HTML"  # CAMBIADO A HTML
         )
 
-async def handle_reset_traffic_execute(query, context: CallbackContext, config_name: str, peer_index: str, page: str):
-    """Ejecuta el reset del tráfico de un peer"""
-    from keyboards import decode_callback_data
-    
-    logger.info(f"DEBUG - Reset traffic execute: config={config_name}, peer_index={peer_index}, page={page}")
-
-    # Decodificar el índice
-    try:
-        peer_idx = int(decode_callback_data(peer_index))
-        page_num = int(page)
-        logger.info(f"DEBUG - Decoded: peer_idx={peer_idx}, page_num={page_num}")
-    except Exception as e:
-        logger.error(f"Error decodificando datos: {str(e)}")
-        await query.edit_message_text(
-            f"❌ Error procesando los datos",
-            reply_markup=back_button(f"cfg:{config_name}")
-        )
-        return
-    
-    # Obtener información del peer para obtener su clave pública
-    result = api_client.get_peers(config_name)
-    if not result.get("status"):
-        await query.edit_message_text(
-            f"❌ Error: {result.get('message', 'Error desconocido')}",
-            reply_markup=back_button(f"reset_traffic:{config_name}:{page_num}")
-        )
-        return
-    
-    peers = result.get("data", [])
-    
-    if peer_idx < 0 or peer_idx >= len(peers):
-        await query.edit_message_text(
-            f"❌ Índice de peer inválido",
-            reply_markup=back_button(f"reset_traffic:{config_name}:{page_num}")
-        )
-        return
-    
-    peer = peers[peer_idx]
-    public_key = peer.get('id', '')
-    peer_name = peer.get('name', 'Desconocido')
-    
-    if not public_key:
-        await query.edit_message_text(
-            f"❌ No se pudo obtener la clave pública del peer",
-            reply_markup=back_button(f"reset_traffic:{config_name}:{page_num}")
-        )
-        return
-    
-    # Llamar a la API para resetear datos
-    result = api_client.reset_peer_data(config_name, public_key)
-    
-    if result.get("status"):
-        await query.edit_message_text(
-            f"✅ *Contador de datos reseteado*\n\n"
-            f"Peer: {peer_name}\n"
-            f"Configuración: {config_name}\n\n"
-            f"El contador de datos ha sido puesto a cero.",
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("🔄 Ver lista actualizada", callback_data=f"reset_traffic:{config_name}:{page_num}")],
-                [InlineKeyboardButton("⬅️ Volver a Configuración", callback_data=f"cfg:{config_name}")]
-            ]),
-            parse_mode="Markdown"
-        )
-    else:
-        error_msg = result.get('message', 'Error desconocido')
-        await query.edit_message_text(
-            f"❌ *Error al resetear datos*\n\n"
-            f"*Error:* {error_msg}",
-            reply_markup=back_button(f"reset_traffic:{config_name}:{page_num}"),
-            parse_mode="Markdown"
-        )
-
-async def handle_restrict_confirm(query, context: CallbackContext, config_name: str, public_key_short: str, peer_index: str):
-    """Muestra confirmación para restringir un peer"""
-    await query.edit_message_text(f"🔍 Buscando información del peer...")
-    
-    # Obtener información del peer
-    result = api_client.get_peers(config_name)
-    if not result.get("status"):
-        await query.edit_message_text(
-            f"❌ Error: {result.get('message', 'Error desconocido')}",
-            reply_markup=back_button(f"restrict_peer_menu:{config_name}:0")
-        )
-        return
-    
-    all_peers = result.get("data", [])
-    
-    # Buscar el peer específico usando el índice
-    try:
-        idx = int(peer_index)
-        if idx < 0 or idx >= len(all_peers):
-            await query.edit_message_text(
-                f"❌ Índice de peer inválido",
-                reply_markup=back_button(f"restrict_peer_menu:{config_name}:0")
-            )
-            return
-        
-        peer_info = all_peers[idx]
-        public_key = peer_info.get('id', '')
-        peer_name = peer_info.get('name', 'Desconocido')
-        
-        if not public_key:
-            await query.edit_message_text(
-                f"❌ No se pudo obtener la clave pública del peer",
-                reply_markup=back_button(f"restrict_peer_menu:{config_name}:0")
-            )
-            return
-        
-        allowed_ip = peer_info.get('allowed_ip', 'N/A')
-        status = peer_info.get('status', 'stopped')
-        status_text = "✅ Conectado" if status == 'running' else "❌ Desconectado"
-        
-        message = f"⚠️ *Confirmar Restricción de Peer*\n\n"
-        message += f"¿Estás seguro de que deseas restringir este peer?\n\n"
-        message += f"*Peer:* {peer_name}\n"
-        message += f"*Configuración:* {config_name}\n"
-        message += f"*IP:* `{allowed_ip}`\n"
-        message += f"*Estado:* {status_text}\n"
-        message += f"*Clave pública:* `{public_key[:30]}...`\n\n"
-        message += "⚠️ *Al restringir el peer, no podrá conectarse hasta que se quite la restricción.*"
-        
-        # Codificar la clave pública completa
-        from keyboards import safe_callback_data
-        safe_public_key = safe_callback_data(public_key)
-        
-        keyboard = confirmation_menu(config_name, safe_public_key, "restrict", "Restringir")
-        
-        await query.edit_message_text(
-            message,
-            reply_markup=keyboard,
-            parse_mode="Markdown"
-        )
-        
-    except Exception as e:
-        logger.error(f"Error en confirmación de restricción: {str(e)}")
-        await query.edit_message_text(
-            f"❌ Error al procesar la solicitud: {str(e)}",
-            reply_markup=back_button(f"restrict_peer_menu:{config_name}:0")
-        )
-
-async def handle_restrict_execute(query, config_name: str, public_key: str):
-    """Ejecuta la acción de restringir un peer"""
-    await query.edit_message_text(f"🔄 Restringiendo peer...")
-    
-    result = api_client.restrict_peer(config_name, public_key)
-    
-    if result.get("status"):
-        await query.edit_message_text(
-            f"✅ *Peer restringido correctamente*\n\n"
-            f"El peer ya no podrá conectarse a {config_name}.",
-            reply_markup=back_button(f"restrict_peer_menu:{config_name}:0"),
-            parse_mode="Markdown"
-        )
-    else:
-        error_msg = result.get('message', 'Error desconocido')
-        await query.edit_message_text(
-            f"❌ *Error al restringir peer*\n\n"
-            f"*Error:* {error_msg}",
-            reply_markup=back_button(f"restrict_peer_menu:{config_name}:0"),
-            parse_mode="Markdown"
-        )
-
 # ================= HANDLERS ESPECÍFICOS (EXISTENTES) ================= #
 async def handle_main_menu(query):
     """Muestra el menú principal para administradores"""
@@ -1517,7 +1254,7 @@ async def handle_handshake(query):
     """Verifica la conexión con la API"""
     await query.edit_message_text("🔌 Probando conexión con la API...")
     
-    result = api_client.handshake()
+    result = await api_client.handshake()
     
     if result.get("status"):
         await query.edit_message_text(
@@ -1534,7 +1271,7 @@ async def handle_configs(query, page: int = 0):
     """Muestra la lista de configuraciones"""
     await query.edit_message_text("📡 Obteniendo configuraciones...")
     
-    result = api_client.get_configurations()
+    result = await api_client.get_configurations()
     
     if not result.get("status"):
         await query.edit_message_text(
@@ -1558,7 +1295,8 @@ async def handle_configs(query, page: int = 0):
     total_configs = len(configs)
     total_pages = (total_configs - 1) // 8 + 1
     
-    message = f"📡 *Configuraciones disponibles*\n"
+    message = stale_notice(result)
+    message += f"📡 *Configuraciones disponibles*\n"
     message += f"Página {page + 1} de {total_pages}\n"
     message += f"Total: {total_configs} configuraciones\n\n"
     message += "Selecciona una configuración para ver más opciones:"
@@ -1573,7 +1311,7 @@ async def handle_configs_summary(query):
     """Muestra un resumen de todas las configuraciones"""
     await query.edit_message_text("📊 Generando resumen...")
     
-    result = api_client.get_configurations()
+    result = await api_client.get_configurations()
     
     if not result.get("status"):
         await query.edit_message_text(
@@ -1583,7 +1321,7 @@ async def handle_configs_summary(query):
         return
     
     configs = result.get("data", [])
-    formatted_text = format_config_summary(configs)
+    formatted_text = stale_notice(result) + format_config_summary(configs)
     
     await query.edit_message_text(
         formatted_text,
@@ -1601,7 +1339,7 @@ async def show_configurations(update: Update, context: ContextTypes.DEFAULT_TYPE
         query = update.callback_query
         is_message = False
     
-    result = api_client.get_configurations()
+    result = await api_client.get_configurations()
     
     if not result.get("status"):
         error_msg = f"❌ Error: {result.get('message', 'Error desconocido')}"
@@ -1626,7 +1364,8 @@ async def show_configurations(update: Update, context: ContextTypes.DEFAULT_TYPE
     total_configs = len(configs)
     total_pages = (total_configs - 1) // 8 + 1
     
-    message = f"📡 *Configuraciones disponibles*\n"
+    message = stale_notice(result)
+    message += f"📡 *Configuraciones disponibles*\n"
     message += f"Página {page + 1} de {total_pages}\n"
     message += f"Total: {total_configs} configuraciones\n\n"
     message += "Selecciona una configuración para ver más opciones:"
@@ -1640,7 +1379,7 @@ async def handle_config_detail(query, config_name: str):
     """Muestra el menú de una configuración específica"""
     await query.edit_message_text(f"⚙️ Obteniendo información de {config_name}...")
     
-    result = api_client.get_configuration_detail(config_name)
+    result = await api_client.get_configuration_detail(config_name)
     
     if not result.get("status"):
         await query.edit_message_text(
@@ -1658,13 +1397,14 @@ async def handle_config_detail(query, config_name: str):
     total_peers = config.get('TotalPeers', 0)
     connected_peers = config.get('ConnectedPeers', 0)
     
-    # Obtener información de peers restringidos
-    peers_result = api_client.get_peers(config_name)
+    # Obtener información de peers restringidos (mismo snapshot, sin nueva petición)
+    peers_result = await api_client.get_peers(config_name)
     restricted_count = 0
     if peers_result.get("status"):
         restricted_count = peers_result.get("metadata", {}).get("restricted", 0)
     
-    message = f"⚙️ *Configuración: {config_name}*\n\n"
+    message = stale_notice(result)
+    message += f"⚙️ *Configuración: {config_name}*\n\n"
     message += f"📡 Puerto: `{listen_port}`\n"
     message += f"🔑 Clave pública: `{public_key[:30]}...`\n"
     message += f"👥 Peers: *{connected_peers}/{total_peers}* conectados\n"
@@ -1675,6 +1415,8 @@ async def handle_config_detail(query, config_name: str):
     message += "• ➕ Agregar Peer: Crear un nuevo peer automáticamente\n"
     message += "• ⏰ Schedule Jobs: Gestionar trabajos programados\n"
     message += "• 🚫 Restricciones: Gestionar peers restringidos\n"
+    message += "• 🔀 Cambios recientes: Qué cambió desde la última actualización\n"
+    message += "• 🔍 Buscar peer: Por nombre, IP o clave pública\n"
     message += "• 🔄 Actualizar: Refrescar información"
     
     await query.edit_message_text(
@@ -1683,6 +1425,59 @@ async def handle_config_detail(query, config_name: str):
         parse_mode="Markdown"
     )
 
+async def handle_config_changes(query, config_name: str):
+    """Actualiza una configuración y muestra qué cambió respecto a la versión anterior"""
+    await query.edit_message_text(f"🔀 Comparando {config_name}...")
+    
+    result = await api_client.get_changes(config_name)
+    
+    if not result.get("status"):
+        await query.edit_message_text(
+            f"❌ Error: {result.get('message', 'Error desconocido')}",
+            reply_markup=back_button(("cfg", config_name))
+        )
+        return
+    
+    diff = result.get("data")
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton("🔄 Comparar de nuevo", callback_data=callback_registry.pack("changes", config_name))],
+        [InlineKeyboardButton("⬅️ Volver", callback_data=callback_registry.pack("cfg", config_name))]
+    ])
+    
+    message = stale_notice(result)
+    message += f"🔀 <b>Cambios - {html.escape(config_name)}</b>\n\n"
+    
+    if diff is None:
+        message += "ℹ️ Es la primera lectura de esta configuración. Vuelve a comparar más tarde para ver los cambios."
+    elif diff.is_empty:
+        message += f"✅ Sin cambios desde la última actualización (v{diff.from_version} → v{diff.to_version})."
+    else:
+        message += f"Versión {diff.from_version} → {diff.to_version}\n"
+        
+        sections = [
+            ("➕ Nuevos", diff.added),
+            ("🗑 Eliminados", diff.removed),
+            ("🟢 Conectados", diff.came_online),
+            ("🔴 Desconectados", diff.went_offline),
+            ("🔒 Restringidos", diff.restricted),
+            ("🔓 Sin restricción", diff.unrestricted),
+            ("📶 Con tráfico nuevo", diff.traffic_changed)
+        ]
+        
+        for title, peers in sections:
+            if not peers:
+                continue
+            names = ", ".join(html.escape(peer.get('name') or peer.get('id', '')[:12]) for peer in peers[:10])
+            if len(peers) > 10:
+                names += f" y {len(peers) - 10} más"
+            message += f"\n<b>{title}</b> ({len(peers)}): {names}"
+    
+    await query.edit_message_text(
+        message,
+        reply_markup=keyboard,
+        parse_mode="HTML"
+    )
+
 async def handle_operator_download_template(query, context: CallbackContext, config_name: str, peer_name: str, public_key: str, endpoint: str, user_id: int):
     """Descarga plantilla para operadores (sin claves privadas)"""
     try:
@@ -1694,7 +1489,7 @@ async def handle_operator_download_template(query, context: CallbackContext, con
         server_host = parsed_url.hostname
         
         # Obtener información de la configuración
-        config_result = api_client.get_configuration_detail(config_name)
+        config_result = await api_client.get_configuration_detail(config_name)
         if not config_result.get("status"):
             await query.edit_message_text(
                 f"❌ No se pudo obtener información de la configuración",
@@ -1717,7 +1512,7 @@ async def handle_operator_download_template(query, context: CallbackContext, con
         allowed_ip = "10.21.0.2/32"
         dns = "1.1.1.1"
         
-        peers_result = api_client.get_peers(config_name)
+        peers_result = await api_client.get_peers(config_name)
         if peers_result.get("status"):
             peers = peers_result.get("data", [])
             for peer in peers:
@@ -1800,39 +1595,30 @@ async def handle_peers_detailed(query, config_name: str):
     # Cambio: Ir directamente a la vista paginada
     await handle_peers_detailed_paginated(query, config_name, 0)
 
-async def handle_peers_detailed_paginated(query, config_name: str, page: int = 0):
-    """Muestra información detallada de peers paginada - VERSIÓN SIN FORMATO"""
-    await query.edit_message_text(f"📋 Preparando detalles paginados...")
-    
-    result = api_client.get_peers(config_name)
-    
-    if not result.get("status"):
-        await query.edit_message_text(
-            f"❌ Error: {result.get('message', 'Error desconocido')}",
-            reply_markup=back_button(f"cfg:{config_name}")
-        )
-        return
-    
-    peers = result.get("data", [])
-    
-    if not peers:
-        await query.edit_message_text(
-            f"⚠️ No hay peers en {config_name}",
-            reply_markup=back_button(f"cfg:{config_name}")
-        )
-        return
-    
-    # Mostrar 2 peers por página para no exceder el límite
-    peers_per_page = 2
-    total_pages = (len(peers) + peers_per_page - 1) // peers_per_page
-    
-    if page >= total_pages:
-        page = total_pages - 1
-    if page < 0:
-        page = 0
-    
-    start_idx = page * peers_per_page
-    end_idx = min(start_idx + peers_per_page, len(peers))
+# Peers por página en los detalles (2 para no exceder el límite de Telegram)
+DETAILED_PEERS_PER_PAGE = 2
+
+def registered_callbacks_alive(rendered) -> bool:
+    """
+    Renueva los botones "t:<token>" de una página guardada en caché.
+    
+    False si alguno ya salió del registro: la página se vuelve a pintar.
+    """
+    _, keyboard = rendered
+    alive = True
+    for row in keyboard.inline_keyboard:
+        for button in row:
+            data = button.callback_data or ""
+            if data.startswith(f"{REGISTRY_PREFIX}:") and not callback_registry.touch(data[len(REGISTRY_PREFIX) + 1:]):
+                alive = False
+    return alive
+
+def render_peers_detailed_page(config_name: str, peers: Sequence[Dict], page: int):
+    """Texto y teclado de una página de detalles de peers (sin aviso de datos desactualizados)"""
+    total_pages = (len(peers) + DETAILED_PEERS_PER_PAGE - 1) // DETAILED_PEERS_PER_PAGE
+    
+    start_idx = page * DETAILED_PEERS_PER_PAGE
+    end_idx = min(start_idx + DETAILED_PEERS_PER_PAGE, len(peers))
     page_peers = peers[start_idx:end_idx]
     
     # Construir mensaje para esta página - SIN FORMATO MARKDOWN
@@ -1852,29 +1638,62 @@ async def handle_peers_detailed_paginated(query, config_name: str, page: int = 0
     nav_buttons = []
     if page > 0:
         nav_buttons.append(
-            InlineKeyboardButton("◀️ Anterior", callback_data=f"peers_detailed_paginated:{config_name}:{page-1}")
+            InlineKeyboardButton("◀️ Anterior", callback_data=callback_registry.pack("peers_detailed_paginated", config_name, page-1))
         )
     
     if page < total_pages - 1:
         nav_buttons.append(
-            InlineKeyboardButton("Siguiente ▶️", callback_data=f"peers_detailed_paginated:{config_name}:{page+1}")
+            InlineKeyboardButton("Siguiente ▶️", callback_data=callback_registry.pack("peers_detailed_paginated", config_name, page+1))
         )
     
     if nav_buttons:
         keyboard.append(nav_buttons)
     
-    # ELIMINAR el botón "Ver todo en un mensaje"
-    # keyboard.append([
-    #     InlineKeyboardButton("📋 Ver todo en un mensaje", callback_data=f"peers_detailed_full:{config_name}")
-    # ])
-    
     keyboard.append([
-        InlineKeyboardButton("⬅️ Volver al menú", callback_data=f"cfg:{config_name}")
+        InlineKeyboardButton("⬅️ Volver al menú", callback_data=callback_registry.pack("cfg", config_name))
     ])
     
+    return message, InlineKeyboardMarkup(keyboard)
+
+async def handle_peers_detailed_paginated(query, config_name: str, page: int = 0):
+    """
+    Muestra información detallada de peers paginada - VERSIÓN SIN FORMATO
+    
+    Las páginas se renderizan una vez por versión del snapshot: pasar de
+    página con la lista en cache cuesta solo la edición del mensaje.
+    """
+    result = await api_client.get_peers(config_name)
+    
+    if not result.get("status"):
+        await query.edit_message_text(
+            f"❌ Error: {result.get('message', 'Error desconocido')}",
+            reply_markup=back_button(("cfg", config_name))
+        )
+        return
+    
+    peers = result.get("data", [])
+    
+    if not peers:
+        await query.edit_message_text(
+            f"⚠️ No hay peers en {config_name}",
+            reply_markup=back_button(("cfg", config_name))
+        )
+        return
+    
+    total_pages = (len(peers) + DETAILED_PEERS_PER_PAGE - 1) // DETAILED_PEERS_PER_PAGE
+    page = max(0, min(page, total_pages - 1))
+    
+    render = partial(render_peers_detailed_page, config_name)
+    ref = SnapshotRef(config_name, result["metadata"]["version"], "peers")
+    rendered = snapshot_store.rendered_page(ref, "detailed", page, render, valid=registered_callbacks_alive)
+    if rendered is None:
+        rendered = render(peers, page)
+    
+    message, keyboard = rendered
+    
     await query.edit_message_text(
-        message,
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        stale_notice(result) + message,
+        reply_markup=keyboard,
         parse_mode=None  # SIN FORMATO
     )
 
@@ -1882,12 +1701,12 @@ async def handle_delete_peer_menu(query, config_name: str, page: int = 0):
     """Muestra el menú para seleccionar peer a eliminar"""
     await query.edit_message_text(f"🗑 Obteniendo peers de {config_name}...")
     
-    result = api_client.get_peers(config_name)
+    result = await api_client.get_peers(config_name)
     
     if not result.get("status"):
         await query.edit_message_text(
             f"❌ Error: {result.get('message', 'Error desconocido')}",
-            reply_markup=back_button(f"cfg:{config_name}")
+            reply_markup=back_button(("cfg", config_name))
         )
         return
     
@@ -1896,7 +1715,7 @@ async def handle_delete_peer_menu(query, config_name: str, page: int = 0):
     if not peers:
         await query.edit_message_text(
             f"⚠️ No hay peers para eliminar en {config_name}",
-            reply_markup=back_button(f"cfg:{config_name}")
+            reply_markup=back_button(("cfg", config_name))
         )
         return
     
@@ -1908,7 +1727,7 @@ async def handle_delete_peer_menu(query, config_name: str, page: int = 0):
     for i, peer in enumerate(page_peers, start_idx):
         peer_name = peer.get('name', 'Sin nombre')
         button_text = f"{peer_name}"
-        callback_data = f"delete_peer_confirm:{config_name}:{i}"
+        callback_data = callback_registry.pack("delete_peer_confirm", config_name, peer_token(peer['id']))
         
         keyboard.append([InlineKeyboardButton(button_text, callback_data=callback_data)])
     
@@ -1917,19 +1736,19 @@ async def handle_delete_peer_menu(query, config_name: str, page: int = 0):
     
     if page > 0:
         nav_buttons.append(
-            InlineKeyboardButton("◀️ Anterior", callback_data=f"page_delete_peer:{config_name}:{page-1}")
+            InlineKeyboardButton("◀️ Anterior", callback_data=callback_registry.pack("page_delete_peer", config_name, page-1))
         )
     
     if end_idx < len(peers):
         nav_buttons.append(
-            InlineKeyboardButton("Siguiente ▶️", callback_data=f"page_delete_peer:{config_name}:{page+1}")
+            InlineKeyboardButton("Siguiente ▶️", callback_data=callback_registry.pack("page_delete_peer", config_name, page+1))
         )
     
     if nav_buttons:
         keyboard.append(nav_buttons)
     
     # Botón para cancelar
-    keyboard.append([InlineKeyboardButton("❌ Cancelar", callback_data=f"cfg:{config_name}")])
+    keyboard.append([InlineKeyboardButton("❌ Cancelar", callback_data=callback_registry.pack("cfg", config_name))])
     
     total_peers = len(peers)
     total_pages = (total_peers - 1) // 8 + 1
@@ -1945,116 +1764,62 @@ async def handle_delete_peer_menu(query, config_name: str, page: int = 0):
         parse_mode="Markdown"
     )
 
-async def handle_delete_peer_confirm(query, config_name: str, peer_index: str):
-    """Muestra confirmación para eliminar un peer - CORREGIDO"""
-    try:
-        # Obtener el índice del peer
-        idx = int(peer_index)
-        
-        # Obtener los peers para encontrar el peer específico
-        result = api_client.get_peers(config_name)
-        if not result.get("status"):
-            await query.edit_message_text(
-                f"❌ Error: {result.get('message', 'Error desconocido')}",
-                reply_markup=back_button(f"cfg:{config_name}")
-            )
-            return
-        
-        peers = result.get("data", [])
-        
-        if idx < 0 or idx >= len(peers):
-            await query.edit_message_text(
-                f"❌ Error: Índice de peer inválido",
-                reply_markup=back_button(f"cfg:{config_name}")
-            )
-            return
-        
-        peer = peers[idx]
-        peer_key = peer.get('id', '')
-        peer_name = peer.get('name', 'Sin nombre')
-        
-        if not peer_key:
-            await query.edit_message_text(
-                f"❌ Error: No se pudo obtener la clave pública del peer",
-                reply_markup=back_button(f"cfg:{config_name}")
-            )
-            return
-        
-        message = f"⚠️ *Confirmar eliminación*\n\n"
-        message += f"¿Estás seguro de que deseas eliminar el peer?\n\n"
-        message += f"*Configuración:* {config_name}\n"
-        message += f"*Peer:* {peer_name}\n"
-        message += f"*Clave pública:* `{peer_key[:30]}...`\n\n"
-        message += "⚠️ *Esta acción no se puede deshacer.*"
-        
-        # CORREGIDO: Añadir el cuarto parámetro action_text
+async def handle_delete_peer_confirm(query, config_name: str, token: str):
+    """Muestra confirmación para eliminar un peer"""
+    # Buscar el peer por su token (sin volver a descargar la lista)
+    result = await api_client.get_peer(config_name, token)
+    if not result.get("status"):
+        await query.edit_message_text(
+            f"❌ Error: {result.get('message', 'Error desconocido')}",
+            reply_markup=back_button(("cfg", config_name))
+        )
+        return
+    
+    peer = result["data"]
+    peer_key = peer.get('id', '')
+    peer_name = peer.get('name', 'Sin nombre')
+    
+    message = f"⚠️ *Confirmar eliminación*\n\n"
+    message += f"¿Estás seguro de que deseas eliminar el peer?\n\n"
+    message += f"*Configuración:* {config_name}\n"
+    message += f"*Peer:* {peer_name}\n"
+    message += f"*Clave pública:* `{peer_key[:30]}...`\n\n"
+    message += "⚠️ *Esta acción no se puede deshacer.*"
+    
+    await query.edit_message_text(
+        message,
+        reply_markup=confirmation_menu(config_name, token, "delete_peer", "Eliminar"),
+        parse_mode="Markdown"
+    )
+
+async def handle_delete_peer_final(query, config_name: str, token: str):
+    """Elimina definitivamente el peer"""
+    # El token identifica siempre al mismo peer aunque la lista haya cambiado
+    result = await api_client.get_peer(config_name, token)
+    if not result.get("status"):
         await query.edit_message_text(
-            message,
-            reply_markup=confirmation_menu(config_name, peer_index, "delete_peer", "Eliminar"),
-            parse_mode="Markdown"
+            f"❌ Error: {result.get('message', 'Error desconocido')}",
+            reply_markup=back_button(("cfg", config_name))
         )
-        
-    except ValueError as e:
+        return
+    
+    peer_key = result["data"].get('id', '')
+    
+    await query.edit_message_text("🗑 Eliminando peer...")
+    
+    result = await api_client.delete_peer(config_name, peer_key)
+    
+    if result.get("status"):
         await query.edit_message_text(
-            f"❌ Error: Índice de peer inválido\n{str(e)}",
-            reply_markup=back_button(f"cfg:{config_name}")
+            f"✅ *Peer eliminado correctamente*\n\n"
+            f"El peer ha sido eliminado de {config_name}.",
+            reply_markup=back_button(("cfg", config_name))
         )
-
-async def handle_delete_peer_final(query, config_name: str, peer_index: str):
-    """Elimina definitivamente el peer"""
-    try:
-        # Obtener el índice del peer
-        idx = int(peer_index)
-        
-        # Obtener el peer específico para obtener su clave pública
-        result = api_client.get_peers(config_name)
-        if not result.get("status"):
-            await query.edit_message_text(
-                f"❌ Error: {result.get('message', 'Error desconocido')}",
-                reply_markup=back_button(f"cfg:{config_name}")
-            )
-            return
-        
-        peers = result.get("data", [])
-        
-        if idx < 0 or idx >= len(peers):
-            await query.edit_message_text(
-                f"❌ Error: Índice de peer inválido",
-                reply_markup=back_button(f"cfg:{config_name}")
-            )
-            return
-        
-        peer = peers[idx]
-        peer_key = peer.get('id', '')
-        
-        if not peer_key:
-            await query.edit_message_text(
-                f"❌ Error: No se pudo obtener la clave pública del peer",
-                reply_markup=back_button(f"cfg:{config_name}")
-            )
-            return
-        
-        await query.edit_message_text("🗑 Eliminando peer...")
-        
-        result = api_client.delete_peer(config_name, peer_key)
-        
-        if result.get("status"):
-            await query.edit_message_text(
-                f"✅ *Peer eliminado correctamente*\n\n"
-                f"El peer ha sido eliminado de {config_name}.",
-                reply_markup=back_button(f"cfg:{config_name}")
-            )
-        else:
-            await query.edit_message_text(
-                f"❌ *Error al eliminar peer*\n"
-                f"{result.get('message', 'Error desconocido')}",
-                reply_markup=back_button(f"cfg:{config_name}")
-            )
-            
-    except ValueError as e:
+    else:
         await query.edit_message_text(
-            f"❌ Error al procesar la eliminación: {str(e)}",
-            reply_markup=back_button(f"cfg:{config_name}")
+            f"❌ *Error al eliminar peer*\n"
+            f"{result.get('message', 'Error desconocido')}",
+            reply_markup=back_button(("cfg", config_name))
         )
 
 async def handle_add_peer(query, context: CallbackContext, config_name: str):
@@ -2111,7 +1876,7 @@ async def handle_add_peer(query, context: CallbackContext, config_name: str):
         context.user_data['config_name_for_operator_peer'] = config_name
     
     # Obtener información de la configuración para mostrar detalles
-    result = api_client.get_configuration_detail(config_name)
+    result = await api_client.get_configuration_detail(config_name)
     if result.get("status"):
         config_data = result.get("data", {})
         address = config_data.get('Address', '10.21.0.0/24')
@@ -2134,7 +1899,7 @@ async def handle_add_peer(query, context: CallbackContext, config_name: str):
     if is_operator(user_id):
         keyboard = [[InlineKeyboardButton("⬅️ Cancelar", callback_data="operator_main_menu")]]
     else:
-        keyboard = [[InlineKeyboardButton("⬅️ Cancelar", callback_data=f"cfg:{config_name}")]]
+        keyboard = [[InlineKeyboardButton("⬅️ Cancelar", callback_data=callback_registry.pack("cfg", config_name))]]
     
     await query.edit_message_text(
         message,
@@ -2195,11 +1960,11 @@ async def handle_download_peer_config(query, context: CallbackContext, peer_hash
         server_host = parsed_url.hostname
         
         # Obtener información de la configuración
-        config_result = api_client.get_configuration_detail(config_name)
+        config_result = await api_client.get_configuration_detail(config_name)
         if not config_result.get("status"):
             await query.edit_message_text(
                 f"❌ No se pudo obtener información de la configuración",
-                reply_markup=operator_main_menu() if is_operator(user_id) else back_button(f"cfg:{config_name}")
+                reply_markup=operator_main_menu() if is_operator(user_id) else back_button(("cfg", config_name))
             )
             return
         
@@ -2210,7 +1975,7 @@ async def handle_download_peer_config(query, context: CallbackContext, peer_hash
         if not server_public_key:
             await query.edit_message_text(
                 f"❌ No se pudo obtener la clave pública del servidor",
-                reply_markup=operator_main_menu() if is_operator(user_id) else back_button(f"cfg:{config_name}")
+                reply_markup=operator_main_menu() if is_operator(user_id) else back_button(("cfg", config_name))
             )
             return
         
@@ -2257,7 +2022,7 @@ PersistentKeepalive = 21"""
             # Para operadores: botón para volver al menú
             keyboard = [
                 [InlineKeyboardButton("⬅️ Volver al Menú", callback_data="operator_main_menu")],
-                [InlineKeyboardButton("📥 Descargar de nuevo", callback_data=f"download_config:{peer_hash}")]
+                [InlineKeyboardButton("📥 Descargar de nuevo", callback_data=callback_registry.pack("download_config", peer_hash))]
             ]
             
             await query.edit_message_text(
@@ -2290,8 +2055,8 @@ PersistentKeepalive = 21"""
                 f"3. Conéctate y ¡listo!",
                 reply_markup=InlineKeyboardMarkup([
                     [
-                        InlineKeyboardButton("⬅️ Volver a Configuración", callback_data=f"cfg:{config_name}"),
-                        InlineKeyboardButton("📥 Descargar de nuevo", callback_data=f"download_config:{peer_hash}")
+                        InlineKeyboardButton("⬅️ Volver a Configuración", callback_data=callback_registry.pack("cfg", config_name)),
+                        InlineKeyboardButton("📥 Descargar de nuevo", callback_data=callback_registry.pack("download_config", peer_hash))
                     ]
                 ]),
                 parse_mode="Markdown"
@@ -2307,15 +2072,82 @@ PersistentKeepalive = 21"""
             parse_mode="Markdown"
         )
 
-async def handle_schedule_jobs_menu(query, context: CallbackContext, config_name: str):
-    """Muestra el menú inicial de Schedule Jobs con lista de peers"""
-    await query.edit_message_text(f"⏰ Obteniendo peers de {config_name}...")
+def _name_initial(name: str) -> str:
+    """Letra con la que se agrupa un peer en los saltos A–Z ('#' si no empieza por letra)"""
+    initial = name[:1].upper()
+    return initial if "A" <= initial <= "Z" else "#"
+
+def schedule_jobs_initials(peers: Sequence[Dict]) -> Dict[str, int]:
+    """Inicial -> página donde empieza, para una lista ordenada por nombre"""
+    pages: Dict[str, int] = {}
+    for i, peer in enumerate(peers):
+        pages.setdefault(_name_initial(peer.get('name', '')), i // ITEMS_PER_PAGE)
+    return pages
+
+def render_schedule_jobs_page(config_name: str, initials: Dict[str, int], peers: Sequence[Dict], page: int):
+    """Texto y teclado de una página del selector de peers de Schedule Jobs"""
+    total_pages = (len(peers) + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
+    start_idx = page * ITEMS_PER_PAGE
+    
+    keyboard = []
+    for i, peer in enumerate(peers[start_idx:start_idx + ITEMS_PER_PAGE], start_idx):
+        peer_name = peer.get('name', f'Peer {i+1}')
+        keyboard.append([
+            InlineKeyboardButton(
+                f"👤 {peer_name}",
+                callback_data=callback_registry.pack("schedule_job_peer", config_name, peer_token(peer['id']))
+            )
+        ])
+    
+    # Botones de navegación
+    nav_buttons = []
+    if page > 0:
+        nav_buttons.append(
+            InlineKeyboardButton("◀️", callback_data=callback_registry.pack("schedule_jobs_menu", config_name, page-1))
+        )
+    if page < total_pages - 1:
+        nav_buttons.append(
+            InlineKeyboardButton("▶️", callback_data=callback_registry.pack("schedule_jobs_menu", config_name, page+1))
+        )
+    if nav_buttons:
+        keyboard.append(nav_buttons)
+    
+    # Saltos A–Z, 8 por fila (máximo de Telegram); solo si hay más de una página
+    if total_pages > 1:
+        jumps = [
+            InlineKeyboardButton(
+                f"·{initial}·" if initial_page == page else initial,
+                callback_data=callback_registry.pack("schedule_jobs_menu", config_name, initial_page)
+            )
+            for initial, initial_page in initials.items()
+        ]
+        keyboard.extend(jumps[i:i + 8] for i in range(0, len(jumps), 8))
+    
+    keyboard.append([
+        InlineKeyboardButton("🔍 Buscar", callback_data=callback_registry.pack("search", config_name, "jobs")),
+        InlineKeyboardButton("⬅️ Volver", callback_data=callback_registry.pack("cfg", config_name))
+    ])
+    
+    message = f"⏰ *Schedule Jobs - {config_name}*\n\n"
+    message += f"Total peers: {len(peers)}"
+    if total_pages > 1:
+        message += f" · Página {page + 1} de {total_pages}"
+    message += "\n\nSelecciona un peer para gestionar sus Schedule Jobs:"
+    
+    return message, InlineKeyboardMarkup(keyboard)
+
+async def handle_schedule_jobs_menu(query, context: CallbackContext, config_name: str, page: int = 0):
+    """
+    Muestra el menú inicial de Schedule Jobs con lista de peers
     
-    result = api_client.get_peers(config_name)
+    La lista va ordenada por nombre y paginada, con saltos por inicial y
+    búsqueda; el teclado no crece con el número de peers.
+    """
+    result = await api_client.get_peers(config_name)
     if not result.get("status"):
         await query.edit_message_text(
             f"❌ Error al obtener peers: {result.get('message')}",
-            reply_markup=back_button(f"cfg:{config_name}")
+            reply_markup=back_button(("cfg", config_name))
         )
         return
     
@@ -2324,65 +2156,63 @@ async def handle_schedule_jobs_menu(query, context: CallbackContext, config_name
     if not peers:
         await query.edit_message_text(
             f"⚠️ No hay peers en {config_name}",
-            reply_markup=back_button(f"cfg:{config_name}")
+            reply_markup=back_button(("cfg", config_name))
         )
         return
     
-    # Crear teclado con lista de peers
-    keyboard = []
-    for i, peer in enumerate(peers):
-        peer_name = peer.get('name', f'Peer {i+1}')
-        keyboard.append([
-            InlineKeyboardButton(
-                f"👤 {peer_name}",
-                callback_data=f"schedule_job_peer:{config_name}:{i}"
-            )
-        ])
+    total_pages = (len(peers) + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
+    page = max(0, min(page, total_pages - 1))
     
-    # Botones de navegación
-    keyboard.append([
-        InlineKeyboardButton("⬅️ Volver", callback_data=f"cfg:{config_name}")
-    ])
+    # Vista ordenada, iniciales y páginas se calculan una vez por versión del snapshot
+    ref = SnapshotRef(config_name, result["metadata"]["version"], "by_name")
+    initials = snapshot_store.rendered_page(
+        ref, "schedule_jobs_initials", 0, lambda peers, _page: schedule_jobs_initials(peers)
+    )
+    rendered = initials is not None and snapshot_store.rendered_page(
+        ref, "schedule_jobs", page, partial(render_schedule_jobs_page, config_name, initials),
+        valid=registered_callbacks_alive
+    )
+    if not rendered:
+        await query.edit_message_text(EXPIRED_LIST_MESSAGE, reply_markup=back_button(("cfg", config_name)))
+        return
     
-    message = f"⏰ *Schedule Jobs - {config_name}*\n\n"
-    message += f"Total peers: {len(peers)}\n\n"
-    message += "Selecciona un peer para gestionar sus Schedule Jobs:"
+    message, keyboard = rendered
     
     await query.edit_message_text(
-        message,
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        stale_notice(result) + message,
+        reply_markup=keyboard,
         parse_mode="Markdown"
     )
 
-async def handle_schedule_job_peer_selected(query, context: CallbackContext, config_name: str, peer_index: int):
+def _schedule_peer_data(context: CallbackContext, config_name: str, token: str) -> Optional[Dict]:
+    """Peer seleccionado en Schedule Jobs, si coincide con el token pedido"""
+    peer_data = context.user_data.get(f'schedule_peer_{config_name}')
+    if peer_data and peer_data.get('token') == token:
+        return peer_data
+    return None
+
+async def handle_schedule_job_peer_selected(query, context: CallbackContext, config_name: str, token: str):
     """Muestra el menú de Schedule Jobs para un peer específico"""
     await query.edit_message_text(f"⏰ Obteniendo información del peer...")
     
-    # Obtener información del peer usando el índice
-    result = api_client.get_peers(config_name)
+    # Obtener información del peer usando su token
+    result = await api_client.get_peer(config_name, token)
     if not result.get("status"):
         await query.edit_message_text(
             f"❌ Error al obtener información del peer: {result.get('message')}",
-            reply_markup=back_button(f"schedule_jobs_menu:{config_name}")
-        )
-        return
-    
-    peers = result.get("data", [])
-    
-    if peer_index < 0 or peer_index >= len(peers):
-        await query.edit_message_text(
-            f"❌ Índice de peer inválido",
-            reply_markup=back_button(f"schedule_jobs_menu:{config_name}")
+            reply_markup=back_button(("schedule_jobs_menu", config_name))
         )
         return
     
-    peer = peers[peer_index]
+    peer = result["data"]
     public_key = peer.get('id', '')
     peer_name = peer.get('name', 'Desconocido')
     jobs = peer.get('jobs', [])
     
     # Guardar en el contexto para uso posterior
-    context.user_data[f'schedule_peer_{config_name}_{peer_index}'] = {
+    # Una sola entrada por configuración: el peer que se está gestionando
+    context.user_data[f'schedule_peer_{config_name}'] = {
+        'token': token,
         'public_key': public_key,
         'peer_name': peer_name
     }
@@ -2417,20 +2247,20 @@ async def handle_schedule_job_peer_selected(query, context: CallbackContext, con
     
     # Botones para agregar jobs
     keyboard.append([
-        InlineKeyboardButton("📊 Límite de datos (GB)", callback_data=f"add_schedule_job_data:{config_name}:{peer_index}"),
-        InlineKeyboardButton("📅 Fecha de expiración", callback_data=f"add_schedule_job_date:{config_name}:{peer_index}")
+        InlineKeyboardButton("📊 Límite de datos (GB)", callback_data=callback_registry.pack("add_schedule_job_data", config_name, token)),
+        InlineKeyboardButton("📅 Fecha de expiración", callback_data=callback_registry.pack("add_schedule_job_date", config_name, token))
     ])
     
     # Si hay jobs, mostrar botones para eliminarlos
     if jobs:
         keyboard.append([
-            InlineKeyboardButton("🗑 Eliminar Job", callback_data=f"delete_schedule_job_all:{config_name}:{peer_index}")
+            InlineKeyboardButton("🗑 Eliminar Job", callback_data=callback_registry.pack("delete_schedule_job_all", config_name, token))
         ])
     
     # Botones de navegación
     keyboard.append([
-        InlineKeyboardButton("⬅️ Volver a Lista", callback_data=f"schedule_jobs_menu:{config_name}"),
-        InlineKeyboardButton("🔄 Actualizar", callback_data=f"schedule_job_peer:{config_name}:{peer_index}")
+        InlineKeyboardButton("⬅️ Volver a Lista", callback_data=callback_registry.pack("schedule_jobs_menu", config_name)),
+        InlineKeyboardButton("🔄 Actualizar", callback_data=callback_registry.pack("schedule_job_peer", config_name, token))
     ])
     
     await query.edit_message_text(
@@ -2439,42 +2269,33 @@ async def handle_schedule_job_peer_selected(query, context: CallbackContext, con
         parse_mode="HTML"  # CAMBIADO de "Markdown" a "HTML"
     )
 
-async def handle_add_schedule_job_data(query, context: CallbackContext, config_name: str, peer_index: str):
+async def handle_add_schedule_job_data(query, context: CallbackContext, config_name: str, token: str):
     """Pide el valor para agregar un límite de datos en GB"""
-    idx = int(peer_index)
-    
     # Obtener información del peer
-    peer_data = context.user_data.get(f'schedule_peer_{config_name}_{idx}')
+    peer_data = _schedule_peer_data(context, config_name, token)
     if not peer_data:
-        result = api_client.get_peers(config_name)
+        result = await api_client.get_peer(config_name, token)
         if not result.get("status"):
             await query.edit_message_text(
                 f"❌ Error al obtener información del peer: {result.get('message')}",
-                reply_markup=back_button(f"schedule_job_peer:{config_name}:{idx}")
+                reply_markup=back_button(("schedule_job_peer", config_name, token))
             )
             return
         
-        peers = result.get("data", [])
-        if idx < 0 or idx >= len(peers):
-            await query.edit_message_text(
-                f"❌ Índice de peer inválido",
-                reply_markup=back_button(f"schedule_job_peer:{config_name}:{idx}")
-            )
-            return
-        
-        peer = peers[idx]
+        peer = result["data"]
         peer_data = {
+            'token': token,
             'public_key': peer.get('id', ''),
             'peer_name': peer.get('name', 'Desconocido')
         }
-        context.user_data[f'schedule_peer_{config_name}_{idx}'] = peer_data
+        context.user_data[f'schedule_peer_{config_name}'] = peer_data
     
     peer_name = peer_data['peer_name']
     
     # Guardar en el contexto
     context.user_data['configuring_schedule_job'] = True
     context.user_data['schedule_job_config_name'] = config_name
-    context.user_data['schedule_job_peer_index'] = idx
+    context.user_data['schedule_job_peer_token'] = token
     context.user_data['schedule_job_public_key'] = peer_data['public_key']
     context.user_data['schedule_job_type'] = 'data'  # Tipo: data (total_data)
     
@@ -2488,7 +2309,7 @@ async def handle_add_schedule_job_data(query, context: CallbackContext, config_n
     # Guardar en el contexto que estamos esperando el valor
     context.user_data['waiting_for_schedule_job_value'] = True
     
-    keyboard = [[InlineKeyboardButton("⬅️ Cancelar", callback_data=f"schedule_job_peer:{config_name}:{idx}")]]
+    keyboard = [[InlineKeyboardButton("⬅️ Cancelar", callback_data=callback_registry.pack("schedule_job_peer", config_name, token))]]
     
     await query.edit_message_text(
         message,
@@ -2496,42 +2317,33 @@ async def handle_add_schedule_job_data(query, context: CallbackContext, config_n
         parse_mode="HTML"
     )
 
-async def handle_add_schedule_job_date(query, context: CallbackContext, config_name: str, peer_index: str):
+async def handle_add_schedule_job_date(query, context: CallbackContext, config_name: str, token: str):
     """Pide la fecha para agregar una fecha de expiración"""
-    idx = int(peer_index)
-    
     # Obtener información del peer
-    peer_data = context.user_data.get(f'schedule_peer_{config_name}_{idx}')
+    peer_data = _schedule_peer_data(context, config_name, token)
     if not peer_data:
-        result = api_client.get_peers(config_name)
+        result = await api_client.get_peer(config_name, token)
         if not result.get("status"):
             await query.edit_message_text(
                 f"❌ Error al obtener información del peer: {result.get('message')}",
-                reply_markup=back_button(f"schedule_job_peer:{config_name}:{idx}")
-            )
-            return
-        
-        peers = result.get("data", [])
-        if idx < 0 or idx >= len(peers):
-            await query.edit_message_text(
-                f"❌ Índice de peer inválido",
-                reply_markup=back_button(f"schedule_job_peer:{config_name}:{idx}")
+                reply_markup=back_button(("schedule_job_peer", config_name, token))
             )
             return
         
-        peer = peers[idx]
+        peer = result["data"]
         peer_data = {
+            'token': token,
             'public_key': peer.get('id', ''),
             'peer_name': peer.get('name', 'Desconocido')
         }
-        context.user_data[f'schedule_peer_{config_name}_{idx}'] = peer_data
+        context.user_data[f'schedule_peer_{config_name}'] = peer_data
     
     peer_name = peer_data['peer_name']
     
     # Guardar en el contexto
     context.user_data['configuring_schedule_job'] = True
     context.user_data['schedule_job_config_name'] = config_name
-    context.user_data['schedule_job_peer_index'] = idx
+    context.user_data['schedule_job_peer_token'] = token
     context.user_data['schedule_job_public_key'] = peer_data['public_key']
     context.user_data['schedule_job_type'] = 'date'  # Tipo: date
     
@@ -2545,7 +2357,7 @@ async def handle_add_schedule_job_date(query, context: CallbackContext, config_n
     # Guardar en el contexto que estamos esperando el valor
     context.user_data['waiting_for_schedule_job_value'] = True
     
-    keyboard = [[InlineKeyboardButton("⬅️ Cancelar", callback_data=f"schedule_job_peer:{config_name}:{idx}")]]
+    keyboard = [[InlineKeyboardButton("⬅️ Cancelar", callback_data=callback_registry.pack("schedule_job_peer", config_name, token))]]
     
     await query.edit_message_text(
         message,
@@ -2553,30 +2365,20 @@ async def handle_add_schedule_job_date(query, context: CallbackContext, config_n
         parse_mode="Markdown"
     )
 
-async def handle_schedule_jobs_list(query, context: CallbackContext, config_name: str, peer_index: str, page: int = 0):
+async def handle_schedule_jobs_list(query, context: CallbackContext, config_name: str, token: str, page: int = 0):
     """Muestra la lista paginada de Schedule Jobs"""
     await query.edit_message_text(f"⏰ Obteniendo jobs del peer...")
     
     # Obtener información del peer
-    result = api_client.get_peers(config_name)
+    result = await api_client.get_peer(config_name, token)
     if not result.get("status"):
         await query.edit_message_text(
             f"❌ Error al obtener información del peer: {result.get('message')}",
-            reply_markup=back_button(f"schedule_jobs_menu:{config_name}")
-        )
-        return
-    
-    peers = result.get("data", [])
-    
-    idx = int(peer_index)
-    if idx < 0 or idx >= len(peers):
-        await query.edit_message_text(
-            f"❌ Índice de peer inválido",
-            reply_markup=back_button(f"schedule_jobs_menu:{config_name}")
+            reply_markup=back_button(("schedule_jobs_menu", config_name))
         )
         return
     
-    peer = peers[idx]
+    peer = result["data"]
     peer_name = peer.get('name', 'Desconocido')
     jobs = peer.get('jobs', [])
     
@@ -2596,7 +2398,7 @@ async def handle_schedule_jobs_list(query, context: CallbackContext, config_name
         keyboard.append([
             InlineKeyboardButton(
                 f"🗑 Eliminar este Job", 
-                callback_data=f"delete_schedule_job_confirm:{config_name}:{idx}:{i}"
+                callback_data=callback_registry.pack("delete_schedule_job_confirm", config_name, token, i)
             )
         ])
     
@@ -2605,12 +2407,12 @@ async def handle_schedule_jobs_list(query, context: CallbackContext, config_name
     
     if page > 0:
         nav_buttons.append(
-            InlineKeyboardButton("◀️ Anterior", callback_data=f"page_schedule_jobs:{config_name}:{idx}:{page-1}")
+            InlineKeyboardButton("◀️ Anterior", callback_data=callback_registry.pack("page_schedule_jobs", config_name, token, page-1))
         )
     
     if end_idx < len(jobs):
         nav_buttons.append(
-            InlineKeyboardButton("Siguiente ▶️", callback_data=f"page_schedule_jobs:{config_name}:{idx}:{page+1}")
+            InlineKeyboardButton("Siguiente ▶️", callback_data=callback_registry.pack("page_schedule_jobs", config_name, token, page+1))
         )
     
     if nav_buttons:
@@ -2618,11 +2420,11 @@ async def handle_schedule_jobs_list(query, context: CallbackContext, config_name
     
     # Botones de acción
     keyboard.append([
-        InlineKeyboardButton("➕ Agregar Nuevo Job", callback_data=f"add_schedule_job_data:{config_name}:{idx}"),
-        InlineKeyboardButton("🗑 Eliminar un Job", callback_data=f"delete_schedule_job_all:{config_name}:{idx}")
+        InlineKeyboardButton("➕ Agregar Nuevo Job", callback_data=callback_registry.pack("add_schedule_job_data", config_name, token)),
+        InlineKeyboardButton("🗑 Eliminar un Job", callback_data=callback_registry.pack("delete_schedule_job_all", config_name, token))
     ])
     keyboard.append([
-        InlineKeyboardButton("⬅️ Volver", callback_data=f"schedule_job_peer:{config_name}:{idx}")
+        InlineKeyboardButton("⬅️ Volver", callback_data=callback_registry.pack("schedule_job_peer", config_name, token))
     ])
     
     total_jobs = len(jobs)
@@ -2639,38 +2441,28 @@ async def handle_schedule_jobs_list(query, context: CallbackContext, config_name
         parse_mode="Markdown"
     )
 
-async def handle_delete_schedule_job_confirm(query, context: CallbackContext, config_name: str, peer_index: str, job_index: str = None):
+async def handle_delete_schedule_job_confirm(query, context: CallbackContext, config_name: str, token: str, job_index: str = None):
     """Muestra confirmación para eliminar un Schedule Job individual - CORREGIDO"""
     try:
-        idx = int(peer_index)
-        
         # Obtener información actualizada del peer
         await query.edit_message_text("🔄 Obteniendo información del job...")
         
-        result = api_client.get_peers(config_name)
+        result = await api_client.get_peer(config_name, token)
         if not result.get("status"):
             await query.edit_message_text(
                 f"❌ Error al obtener información del peer: {result.get('message')}",
-                reply_markup=back_button(f"schedule_job_peer:{config_name}:{idx}")
+                reply_markup=back_button(("schedule_job_peer", config_name, token))
             )
             return
         
-        peers = result.get("data", [])
-        if idx < 0 or idx >= len(peers):
-            await query.edit_message_text(
-                f"❌ Índice de peer inválido",
-                reply_markup=back_button(f"schedule_job_peer:{config_name}:{idx}")
-            )
-            return
-        
-        peer = peers[idx]
+        peer = result["data"]
         peer_name = peer.get('name', 'Desconocido')
         jobs = peer.get('jobs', [])
         
         if not jobs:
             await query.edit_message_text(
                 f"ℹ️ No hay jobs programados en {peer_name}.",
-                reply_markup=back_button(f"schedule_job_peer:{config_name}:{idx}")
+                reply_markup=back_button(("schedule_job_peer", config_name, token))
             )
             return
         
@@ -2682,12 +2474,12 @@ async def handle_delete_schedule_job_confirm(query, context: CallbackContext, co
                 keyboard.append([
                     InlineKeyboardButton(
                         f"{i+1}. {job_text}", 
-                        callback_data=f"delete_schedule_job_final:{config_name}:{idx}:{i}"
+                        callback_data=callback_registry.pack("delete_schedule_job_final", config_name, token, i)
                     )
                 ])
             
             keyboard.append([
-                InlineKeyboardButton("⬅️ Volver", callback_data=f"schedule_job_peer:{config_name}:{idx}")
+                InlineKeyboardButton("⬅️ Volver", callback_data=callback_registry.pack("schedule_job_peer", config_name, token))
             ])
             
             message = f"🗑 *Eliminar Schedule Job de {peer_name}*\n\n"
@@ -2705,7 +2497,7 @@ async def handle_delete_schedule_job_confirm(query, context: CallbackContext, co
         if job_idx < 0 or job_idx >= len(jobs):
             await query.edit_message_text(
                 f"❌ Índice de job inválido",
-                reply_markup=back_button(f"schedule_job_peer:{config_name}:{idx}")
+                reply_markup=back_button(("schedule_job_peer", config_name, token))
             )
             return
         
@@ -2715,7 +2507,7 @@ async def handle_delete_schedule_job_confirm(query, context: CallbackContext, co
         if not job_id:
             await query.edit_message_text(
                 f"❌ No se pudo obtener el JobID",
-                reply_markup=back_button(f"schedule_job_peer:{config_name}:{idx}")
+                reply_markup=back_button(("schedule_job_peer", config_name, token))
             )
             return
         
@@ -2742,8 +2534,8 @@ async def handle_delete_schedule_job_confirm(query, context: CallbackContext, co
         # CORREGIDO: Usar el formato simplificado en lugar de confirmation_menu
         keyboard = [
             [
-                InlineKeyboardButton("✅ Sí, eliminar", callback_data=f"delete_schedule_job_execute:{config_name}:{idx}:{job_idx}"),
-                InlineKeyboardButton("❌ Cancelar", callback_data=f"schedule_job_peer:{config_name}:{idx}")
+                InlineKeyboardButton("✅ Sí, eliminar", callback_data=callback_registry.pack("delete_schedule_job_execute", config_name, token, job_idx)),
+                InlineKeyboardButton("❌ Cancelar", callback_data=callback_registry.pack("schedule_job_peer", config_name, token))
             ]
         ]
         
@@ -2757,42 +2549,33 @@ async def handle_delete_schedule_job_confirm(query, context: CallbackContext, co
         logger.error(f"Error en confirmación de eliminación: {str(e)}")
         await query.edit_message_text(
             f"❌ Error al procesar la solicitud: {str(e)}",
-            reply_markup=back_button(f"schedule_job_peer:{config_name}:{peer_index}")
+            reply_markup=back_button(("schedule_job_peer", config_name, token))
         )
 
-async def handle_delete_schedule_job_execute(query, context: CallbackContext, config_name: str, peer_index: str, job_index: str):
+async def handle_delete_schedule_job_execute(query, context: CallbackContext, config_name: str, token: str, job_index: str):
     """Ejecuta la eliminación de un Schedule Job individual"""
     try:
-        idx = int(peer_index)
         job_idx = int(job_index)
         
         await query.edit_message_text("🗑 Eliminando Schedule Job...")
         
         # Obtener información actualizada del peer
-        result = api_client.get_peers(config_name)
+        result = await api_client.get_peer(config_name, token)
         if not result.get("status"):
             await query.edit_message_text(
                 f"❌ Error al obtener información del peer: {result.get('message')}",
-                reply_markup=back_button(f"schedule_job_peer:{config_name}:{idx}")
-            )
-            return
-        
-        peers = result.get("data", [])
-        if idx < 0 or idx >= len(peers):
-            await query.edit_message_text(
-                f"❌ Índice de peer inválido",
-                reply_markup=back_button(f"schedule_job_peer:{config_name}:{idx}")
+                reply_markup=back_button(("schedule_job_peer", config_name, token))
             )
             return
         
-        peer = peers[idx]
+        peer = result["data"]
         peer_name = peer.get('name', 'Desconocido')
         jobs = peer.get('jobs', [])
         
         if job_idx < 0 or job_idx >= len(jobs):
             await query.edit_message_text(
                 f"❌ Índice de job inválido",
-                reply_markup=back_button(f"schedule_job_peer:{config_name}:{idx}")
+                reply_markup=back_button(("schedule_job_peer", config_name, token))
             )
             return
         
@@ -2803,7 +2586,7 @@ async def handle_delete_schedule_job_execute(query, context: CallbackContext, co
         if not job_id or not public_key:
             await query.edit_message_text(
                 f"❌ No se pudo obtener la información necesaria",
-                reply_markup=back_button(f"schedule_job_peer:{config_name}:{idx}")
+                reply_markup=back_button(("schedule_job_peer", config_name, token))
             )
             return
         
@@ -2811,7 +2594,7 @@ async def handle_delete_schedule_job_execute(query, context: CallbackContext, co
         job_info = format_schedule_job_for_list(job)
         
         # Intentar eliminar el job
-        result = api_client.delete_schedule_job(config_name, public_key, job_id, job_data=job)
+        result = await api_client.delete_schedule_job(config_name, public_key, job_id, job_data=job)
         
         if result.get("status"):
             # ESCAPAR CARACTERES HTML
@@ -2824,7 +2607,7 @@ async def handle_delete_schedule_job_execute(query, context: CallbackContext, co
                 f"<b>Peer:</b> {peer_name_escaped}\n"
                 f"<b>Job eliminado:</b> {job_info_escaped}\n\n"
                 f"El job ha sido eliminado permanentemente.",
-                reply_markup=back_button(f"schedule_job_peer:{config_name}:{idx}"),
+                reply_markup=back_button(("schedule_job_peer", config_name, token)),
                 parse_mode="HTML"  # CAMBIADO A HTML
             )
         else:
@@ -2833,8 +2616,8 @@ async def handle_delete_schedule_job_execute(query, context: CallbackContext, co
             # Ofrecer opciones alternativas
             keyboard = [
                 [
-                    InlineKeyboardButton("🔄 Intentar de nuevo", callback_data=f"delete_schedule_job_execute:{config_name}:{idx}:{job_idx}"),
-                    InlineKeyboardButton("📋 Ver jobs", callback_data=f"schedule_job_peer:{config_name}:{idx}")
+                    InlineKeyboardButton("🔄 Intentar de nuevo", callback_data=callback_registry.pack("delete_schedule_job_execute", config_name, token, job_idx)),
+                    InlineKeyboardButton("📋 Ver jobs", callback_data=callback_registry.pack("schedule_job_peer", config_name, token))
                 ],
                 [
                     InlineKeyboardButton("🆘 Ayuda", callback_data="help"),
@@ -2861,7 +2644,7 @@ async def handle_delete_schedule_job_execute(query, context: CallbackContext, co
             f"❌ <b>Error al eliminar Schedule Job</b>\n\n"
             f"<b>Error:</b> {error_msg}\n\n"
             f"Intenta eliminar manualmente desde el dashboard web.",
-            reply_markup=back_button(f"schedule_job_peer:{config_name}:{peer_index}"),
+            reply_markup=back_button(("schedule_job_peer", config_name, token)),
             parse_mode="HTML"  # CAMBIADO A HTML
         )
 
@@ -2869,7 +2652,7 @@ async def handle_system_status(query):
     """Muestra el estado del sistema"""
     await query.edit_message_text("🖥 Obteniendo estado del sistema...")
     
-    result = api_client.get_system_status()
+    result = await api_client.get_system_status()
     
     if not result.get("status"):
         await query.edit_message_text(
@@ -2891,7 +2674,7 @@ async def handle_protocols(query):
     """Muestra los protocolos habilitados"""
     await query.edit_message_text("⚡ Obteniendo protocolos...")
     
-    result = api_client.get_protocols()
+    result = await api_client.get_protocols()
     
     if not result.get("status"):
         await query.edit_message_text(
@@ -2930,7 +2713,7 @@ async def handle_stats(query):
     await query.edit_message_text("📊 Obteniendo estadísticas de WireGuard...")
     
     # Obtener todas las configuraciones para calcular estadísticas
-    configs_result = api_client.get_configurations()
+    configs_result = await api_client.get_configurations()
     
     if not configs_result.get("status"):
         await query.edit_message_text(
@@ -3077,6 +2860,7 @@ async def handle_help(query):
 /help - Mostrar ayuda
 /stats - Estadísticas del sistema
 /configs - Listar configuraciones
+/cache - Métricas de la cache
 /cancel - Cancelar operación en curso"""
         
         await query.edit_message_text(
@@ -3203,6 +2987,181 @@ async def handle_operators_list(query, context: CallbackContext):
         parse_mode="Markdown"
     )
 
+# ================= BÚSQUEDA DE PEERS ================= #
+# Resultados que se muestran como botones
+SEARCH_RESULTS_LIMIT = 10
+
+# Pantalla que abre cada resultado según desde dónde se buscó
+SEARCH_TARGETS = {
+    "peer": "peer",
+    "jobs": "schedule_job_peer"
+}
+
+def render_search_results(text: str, matches: List[tuple], total: int, config_name: str = None, target: str = "peer"):
+    """
+    Mensaje y teclado con los resultados de una búsqueda.
+    
+    matches son tuplas (configuración, peer, restringido); config_name es
+    la configuración buscada, o None si se buscó en todas.
+    """
+    scope = f"en {config_name}" if config_name else "en todas las configuraciones"
+    
+    if not matches:
+        message = f"🔍 Sin resultados para \"{text}\" {scope}"
+    else:
+        message = f"🔍 {total} resultado(s) para \"{text}\" {scope}"
+        if total > len(matches):
+            message += f"\nMostrando los {len(matches)} primeros; afina la búsqueda para ver el resto."
+    
+    keyboard = []
+    for match_config, peer, restricted in matches:
+        label = f"{'🔒 ' if restricted else ''}{peer.get('name') or 'Sin nombre'} · {peer.get('allowed_ip', 'N/A')}"
+        if not config_name:
+            label += f" · {match_config}"
+        keyboard.append([
+            InlineKeyboardButton(label, callback_data=callback_registry.pack(SEARCH_TARGETS[target], match_config, peer_token(peer['id'])))
+        ])
+    
+    if config_name:
+        keyboard.append([
+            InlineKeyboardButton("🔍 Nueva búsqueda", callback_data=callback_registry.pack("search", config_name, target)),
+            InlineKeyboardButton("⬅️ Volver", callback_data=callback_registry.pack(*_search_back(config_name, target)))
+        ])
+    else:
+        keyboard.append([InlineKeyboardButton("🏠 Menú Principal", callback_data="main_menu")])
+    
+    return message, InlineKeyboardMarkup(keyboard)
+
+async def search_peers_in_config(config_name: str, text: str):
+    """Busca en una configuración; devuelve (resultado de la API, coincidencias)"""
+    result = await api_client.search_peers(config_name, text, SEARCH_RESULTS_LIMIT)
+    if not result.get("status"):
+        return result, []
+    
+    restricted_keys = result["restricted_keys"]
+    return result, [(config_name, peer, peer.id in restricted_keys) for peer in result["data"]]
+
+async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Manejador del comando /find <texto>: busca peers en todas las configuraciones"""
+    if not is_allowed(update):
+        return
+    
+    log_command(update, "find")
+    
+    text = " ".join(context.args or []).strip()
+    if not text:
+        await update.message.reply_text(
+            "🔍 Uso: /find <texto>\n\n"
+            "Busca peers por nombre, IP o clave pública en todas las configuraciones.",
+            parse_mode=None
+        )
+        return
+    
+    result = await api_client.get_configurations()
+    if not result.get("status"):
+        await update.message.reply_text(f"❌ Error: {result.get('message', 'Error desconocido')}")
+        return
+    
+    config_names = [config.get("Name") for config in result.get("data", []) if config.get("Name")]
+    
+    started = time.perf_counter()
+    searches = await asyncio.gather(*(search_peers_in_config(name, text) for name in config_names))
+    
+    matches, total, notice = [], 0, ""
+    for name, (config_result, config_matches) in zip(config_names, searches):
+        if not config_result.get("status"):
+            logger.warning(f"[SEARCH] Error buscando en {name}: {config_result.get('message')}")
+            continue
+        matches.extend(config_matches)
+        total += config_result["total"]
+        notice = notice or stale_notice(config_result)
+    
+    logger.debug(f"[SEARCH] '{text}' en {len(config_names)} configs: {total} resultados en {(time.perf_counter() - started) * 1000:.1f}ms")
+    
+    message, keyboard = render_search_results(text, matches[:SEARCH_RESULTS_LIMIT], total)
+    await update.message.reply_text(notice + message, reply_markup=keyboard, parse_mode=None)
+
+def _search_back(config_name: str, target: str) -> tuple:
+    """Callback de 'Volver' desde una búsqueda"""
+    return ("schedule_jobs_menu", config_name) if target == "jobs" else ("cfg", config_name)
+
+async def handle_search_prompt(query, context: CallbackContext, config_name: str, target: str = "peer"):
+    """Pide el texto a buscar en una configuración"""
+    if target not in SEARCH_TARGETS:
+        target = "peer"
+    
+    context.user_data['waiting_for_peer_search'] = True
+    context.user_data['peer_search_config'] = config_name
+    context.user_data['peer_search_target'] = target
+    
+    await query.edit_message_text(
+        f"🔍 Buscar peer en {config_name}\n\n"
+        "Envía parte del nombre, la IP o la clave pública.\n"
+        "Escribe /cancel para cancelar.",
+        reply_markup=back_button(_search_back(config_name, target)),
+        parse_mode=None
+    )
+
+async def handle_search_text(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    """Responde al texto enviado tras pulsar '🔍 Buscar peer'"""
+    config_name = context.user_data.pop('peer_search_config', None)
+    target = context.user_data.pop('peer_search_target', "peer")
+    context.user_data.pop('waiting_for_peer_search', None)
+    
+    if not config_name:
+        return
+    
+    result, matches = await search_peers_in_config(config_name, text)
+    if not result.get("status"):
+        await update.message.reply_text(
+            f"❌ Error: {result.get('message', 'Error desconocido')}",
+            reply_markup=back_button(("cfg", config_name))
+        )
+        return
+    
+    message, keyboard = render_search_results(text, matches, result["total"], config_name, target)
+    await update.message.reply_text(stale_notice(result) + message, reply_markup=keyboard, parse_mode=None)
+
+async def handle_peer_detail(query, config_name: str, token: str):
+    """Detalle de un peer con accesos directos a sus acciones"""
+    result = await api_client.get_peer(config_name, token)
+    
+    if not result.get("status"):
+        await query.edit_message_text(
+            f"❌ {result.get('message', 'Error desconocido')}",
+            reply_markup=back_button(("cfg", config_name))
+        )
+        return
+    
+    peer = result["data"]
+    restricted = result["restricted"]
+    
+    message = stale_notice(result)
+    message += f"👤 Peer de {config_name}{' (🔒 restringido)' if restricted else ''}\n\n"
+    message += format_peer_for_detail_plain(peer)
+    
+    if restricted:
+        restriction_button = InlineKeyboardButton("🔓 Quitar restricción", callback_data=callback_registry.pack("unrestrict", config_name, token))
+    else:
+        restriction_button = InlineKeyboardButton("🔒 Restringir", callback_data=callback_registry.pack("restrict", config_name, token))
+    
+    keyboard = [
+        [restriction_button],
+        [InlineKeyboardButton("🧹 Limpiar Tráfico", callback_data=callback_registry.pack("reset_traffic_confirm", config_name, token, 0))],
+        [InlineKeyboardButton("⏰ Schedule Jobs", callback_data=callback_registry.pack("schedule_job_peer", config_name, token))],
+        [InlineKeyboardButton("🗑 Eliminar Peer", callback_data=callback_registry.pack("delete_peer_confirm", config_name, token))],
+        [
+            InlineKeyboardButton("🔍 Buscar otro", callback_data=callback_registry.pack("search", config_name)),
+            InlineKeyboardButton("⬅️ Volver", callback_data=callback_registry.pack("cfg", config_name))
+        ]
+    ]
+    
+    await query.edit_message_text(
+        message,
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode=None
+    )
+
 # ================= MANEJO DE MENSAJES DE TEXTO ================= #
 async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Maneja mensajes de texto"""
@@ -3212,53 +3171,6 @@ async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYP
     message_text = update.message.text.strip()
     user_id = update.effective_user.id
     
-    # Comando /cancel (mantener funcionalidad pero no mencionarlo en ayuda)
-    if message_text.lower() == '/cancel':
-        # Limpiar estado de creación de peer para operador/admin
-        if context.user_data.get('waiting_for_operator_peer_name', False) or \
-           context.user_data.get('waiting_for_operator_peer_endpoint', False):
-            for key in ['waiting_for_operator_peer_name', 'config_name_for_operator_peer',
-                       'operator_peer_name', 'waiting_for_operator_peer_endpoint']:
-                if key in context.user_data:
-                    del context.user_data[key]
-            
-            await update.message.reply_text(
-                "✅ Creación de peer cancelada.",
-                reply_markup=operator_main_menu() if is_operator(user_id) else main_menu(is_admin(user_id), is_operator(user_id))
-            )
-            return
-        
-        # Limpiar estado de schedule job si está activo
-        if context.user_data.get('waiting_for_schedule_job_value', False):
-            for key in ['configuring_schedule_job', 'schedule_job_config_name', 'schedule_job_peer_index',
-                       'schedule_job_public_key', 'schedule_job_type', 
-                       'waiting_for_schedule_job_value']:
-                if key in context.user_data:
-                    del context.user_data[key]
-            
-            await update.message.reply_text(
-                "✅ Configuración de Schedule Job cancelada.",
-                reply_markup=operator_main_menu() if is_operator(user_id) else main_menu(is_admin(user_id), is_operator(user_id))
-            )
-            return
-        
-        # Limpiar estado de agregar peer normal
-        for key in ['waiting_for_peer_name', 'config_name_for_peer', 'waiting_for_peer_data']:
-            if key in context.user_data:
-                del context.user_data[key]
-        
-        if is_operator(user_id):
-            await update.message.reply_text(
-                "✅ Operación cancelada.",
-                reply_markup=operator_main_menu()
-            )
-        else:
-            await update.message.reply_text(
-                "✅ Operación cancelada. Usa /start para volver al menú principal.",
-                reply_markup=main_menu(is_admin(user_id), is_operator(user_id))
-            )
-        return
-    
     # Si es operador, solo permitir flujos específicos
     if is_operator(user_id):
         # Permitir el comando /help
@@ -3277,7 +3189,8 @@ async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYP
     if (context.user_data.get('waiting_for_operator_peer_name', False) or 
         context.user_data.get('waiting_for_operator_peer_endpoint', False) or  # ¡NUEVA CONDICIÓN!
         context.user_data.get('waiting_for_schedule_job_value', False) or
-        context.user_data.get('waiting_for_peer_name', False)):
+        context.user_data.get('waiting_for_peer_name', False) or
+        context.user_data.get('waiting_for_peer_search', False)):
     # Continuar con el flujo normal
         pass
     else:
@@ -3293,10 +3206,10 @@ async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYP
     # Verificar si estamos esperando un valor para un Schedule Job
     if context.user_data.get('waiting_for_schedule_job_value', False):
         config_name = context.user_data.get('schedule_job_config_name')
-        peer_index = context.user_data.get('schedule_job_peer_index')
+        peer_token_value = context.user_data.get('schedule_job_peer_token')
         job_type = context.user_data.get('schedule_job_type')  # 'data' o 'date'
         
-        if not all([config_name, peer_index, job_type]):
+        if not all([config_name, peer_token_value, job_type]):
             await update.message.reply_text(
                 "❌ Error en la configuración del Schedule Job. Por favor, cancela e intenta nuevamente.",
                 parse_mode=None
@@ -3306,7 +3219,7 @@ async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYP
         value = message_text.strip()
         
         # Obtener información del peer
-        peer_data = context.user_data.get(f'schedule_peer_{config_name}_{peer_index}')
+        peer_data = _schedule_peer_data(context, config_name, peer_token_value)
         if not peer_data:
             await update.message.reply_text(
                 "❌ No se pudo encontrar la información del peer",
@@ -3375,10 +3288,10 @@ async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.message.reply_text(f"⏰ Creando Schedule Job...")
         
         # Enviar a la API
-        result = api_client.create_schedule_job(config_name, public_key, job_data)
+        result = await api_client.create_schedule_job(config_name, public_key, job_data)
         
         # Limpiar el contexto
-        for key in ['configuring_schedule_job', 'schedule_job_config_name', 'schedule_job_peer_index',
+        for key in ['configuring_schedule_job', 'schedule_job_config_name', 'schedule_job_peer_token',
                    'schedule_job_public_key', 'schedule_job_type', 'waiting_for_schedule_job_value']:
             if key in context.user_data:
                 del context.user_data[key]
@@ -3406,8 +3319,8 @@ async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYP
                 **message_data,
                 reply_markup=InlineKeyboardMarkup([
                     [
-                        InlineKeyboardButton("⬅️ Volver a Schedule Jobs", callback_data=f"schedule_job_peer:{config_name}:{peer_index}"),
-                        InlineKeyboardButton("➕ Agregar otro Job", callback_data=f"schedule_job_peer:{config_name}:{peer_index}")
+                        InlineKeyboardButton("⬅️ Volver a Schedule Jobs", callback_data=callback_registry.pack("schedule_job_peer", config_name, peer_token_value)),
+                        InlineKeyboardButton("➕ Agregar otro Job", callback_data=callback_registry.pack("schedule_job_peer", config_name, peer_token_value))
                     ]
                 ])
             )
@@ -3539,6 +3452,11 @@ async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYP
         await generate_peer_automatically(update, context, config_name, peer_name, user_id)
         return
     
+    # Verificar si estamos esperando el texto de una búsqueda de peers
+    elif context.user_data.get('waiting_for_peer_search', False):
+        await handle_search_text(update, context, message_text)
+        return
+    
     # Si no es ninguno de los casos anteriores y es operador, mostrar mensaje específico
     elif is_operator(user_id):
         await update.message.reply_text(
@@ -3558,6 +3476,58 @@ async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYP
             parse_mode=None
         )
 
+class StepTimer:
+    """Duración de cada paso de una operación, para el log"""
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.steps: Dict[str, float] = {}
+    
+    async def measure(self, step: str, awaitable):
+        """Espera awaitable y guarda cuánto tardó"""
+        step_started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.steps[step] = time.perf_counter() - step_started
+    
+    def summary(self) -> str:
+        parts = [f"{step} {elapsed * 1000:.0f}ms" for step, elapsed in self.steps.items()]
+        parts.append(f"total {(time.perf_counter() - self.started) * 1000:.0f}ms")
+        return ", ".join(parts)
+
+class ProgressMessage:
+    """
+    Mensaje de progreso que se envía y edita en segundo plano.
+    
+    update() no espera a Telegram; las actualizaciones se aplican en orden
+    sobre un único mensaje. flush() espera a la última antes de enviar el
+    resultado final.
+    """
+    
+    def __init__(self, message):
+        self._message = message
+        self._status = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def update(self, text: str):
+        self._task = asyncio.create_task(self._send(self._task, text))
+    
+    async def _send(self, previous: Optional[asyncio.Task], text: str):
+        if previous is not None:
+            await previous
+        try:
+            if self._status is None:
+                self._status = await self._message.reply_text(text)
+            else:
+                await self._status.edit_text(text)
+        except Exception as e:
+            logger.debug(f"No se pudo actualizar el mensaje de progreso: {e}")
+    
+    async def flush(self):
+        if self._task is not None:
+            await self._task
+
 async def generate_peer_automatically(update: Update, context: ContextTypes.DEFAULT_TYPE, config_name: str, peer_name: str, user_id: int, endpoint: str = None):
     """Genera un peer automáticamente con el nombre y endpoint proporcionado"""
     
@@ -3595,15 +3565,22 @@ async def generate_peer_automatically(update: Update, context: ContextTypes.DEFA
                 )
                 return
     
-    await update.message.reply_text(f"⚙️ Generando peer '{peer_name}' para {config_name}...")
-    
-    # 1. Generar claves WireGuard y pre-shared key
-    private_key, public_key = generate_wireguard_keys()
-    preshared_key = generate_preshared_key()
+    timer = StepTimer()
+    progress = ProgressMessage(update.message)
+    progress.update(f"⚙️ Generando peer '{peer_name}' para {config_name}...")
+    
+    # 1-3. Claves (en hilos por si el pool está vacío y hay que calcularlas),
+    # información de la configuración y peers actuales, todo a la vez; las
+    # dos consultas comparten el mismo snapshot
+    (private_key, public_key), preshared_key, result, snapshot_result = await asyncio.gather(
+        timer.measure("keys", asyncio.to_thread(generate_wireguard_keys)),
+        timer.measure("psk", asyncio.to_thread(generate_preshared_key)),
+        timer.measure("config", api_client.get_configuration_detail(config_name)),
+        timer.measure("peers", api_client.get_snapshot(config_name))
+    )
     
-    # 2. Obtener información de la configuración para la IP
-    result = api_client.get_configuration_detail(config_name)
     if not result.get("status"):
+        await progress.flush()
         await update.message.reply_text(
             f"❌ Error al obtener información de {config_name}: {result.get('message')}",
             parse_mode=None
@@ -3613,55 +3590,48 @@ async def generate_peer_automatically(update: Update, context: ContextTypes.DEFA
     config_data = result.get("data", {})
     address = config_data.get('Address', '10.21.0.0/24')
     
-    # 3. Obtener IPs usadas
-    peers_result = api_client.get_peers(config_name)
-    used_ips = []
-    if peers_result.get("status"):
-        peers = peers_result.get("data", [])
-        for peer in peers:
-            allowed_ip = peer.get('allowed_ip', '')
-            if allowed_ip and '/' in allowed_ip:
-                ip_part = allowed_ip.split('/')[0]
-                used_ips.append(ip_part)
-    
-    # 4. Encontrar IP disponible
-    try:
-        network = ipaddress.ip_network(address, strict=False)
-        ip_found = None
-        
-        # Empezar desde .2 (.1 suele ser el servidor)
-        start_ip = 2
-        for i in range(start_ip, 255):
-            ip = f"{network.network_address + i}"
-            if ip not in used_ips:
-                ip_found = ip
-                break
-        
-        if not ip_found:
-            ip_found = f"{network.network_address + start_ip}"
-            
-        allowed_ip = f"{ip_found}/32"
-        
-    except Exception as e:
-        logger.error(f"Error calculando IP: {e}")
-        allowed_ip = "10.21.0.2/32"
-    
-    # 5. Preparar datos para la API - FORMATO EXACTO
-    peer_data = {
-        "name": peer_name,
-        "public_key": public_key,
-        "private_key": private_key,
-        "allowed_ips": allowed_ip,
-        "dns": "1.1.1.1",
-        "persistent_keepalive": 21,
-        "mtu": 1420,
-        "preshared_key": preshared_key
-    }
+    # 4. Reservar la siguiente IP libre (IPv4 y/o IPv6 según Address)
+    allowed_ip = None
+    error_msg = f"No quedan direcciones IP libres en {address}"
+    if snapshot_result.get("status"):
+        try:
+            allowed_ip = ip_allocator.allocate(snapshot_result["data"], address)
+        except ValueError as e:
+            logger.error(f"Error calculando IP: {e}")
+            error_msg = f"Address inválido ({address})"
+    else:
+        error_msg = snapshot_result.get("message") or "No se pudo obtener la lista de peers"
     
-    # 6. Enviar a la API
-    await update.message.reply_text("📡 Enviando datos a WGDashboard...")
+    if not allowed_ip:
+        await progress.flush()
+        await update.message.reply_text(
+            f"❌ Error al asignar IP en {config_name}: {error_msg}",
+            parse_mode=None
+        )
+        return
     
-    result = api_client.add_peer(config_name, peer_data)
+    # La IP queda reservada: si algo falla antes de que add_peer responda,
+    # se libera en lugar de esperar a que caduque la reserva
+    try:
+        # 5. Preparar datos para la API - FORMATO EXACTO
+        peer_data = {
+            "name": peer_name,
+            "public_key": public_key,
+            "private_key": private_key,
+            "allowed_ips": allowed_ip,
+            "dns": "1.1.1.1",
+            "persistent_keepalive": 21,
+            "mtu": 1420,
+            "preshared_key": preshared_key
+        }
+        
+        # 6. Enviar a la API
+        progress.update("📡 Enviando datos a WGDashboard...")
+        
+        result = await timer.measure("add_peer", api_client.add_peer(config_name, peer_data))
+    except (Exception, asyncio.CancelledError):
+        ip_allocator.release(config_name, allowed_ip)
+        raise
     
     if result.get("status"):
         # Generar un hash para identificar el peer
@@ -3698,11 +3668,13 @@ async def generate_peer_automatically(update: Update, context: ContextTypes.DEFA
                 "Operator": "lgt"
             }
             
-            # Enviar jobs a la API
-            await update.message.reply_text("⏰ Configurando límites automáticos...")
+            # Enviar jobs a la API (independientes entre sí)
+            progress.update("⏰ Configurando límites automáticos...")
             
-            result_gb = api_client.create_schedule_job(config_name, public_key, job_data_gb)
-            result_date = api_client.create_schedule_job(config_name, public_key, job_data_date)
+            result_gb, result_date = await timer.measure("schedule_jobs", asyncio.gather(
+                api_client.create_schedule_job(config_name, public_key, job_data_gb),
+                api_client.create_schedule_job(config_name, public_key, job_data_date)
+            ))
             
             jobs_status = ""
             if result_gb.get("status") and result_date.get("status"):
@@ -3735,7 +3707,7 @@ async def generate_peer_automatically(update: Update, context: ContextTypes.DEFA
             
             # Para operadores, mostrar solo botón de descarga
             keyboard = [
-                [InlineKeyboardButton("📥 Descargar Configuración", callback_data=f"download_config:{peer_hash}")],
+                [InlineKeyboardButton("📥 Descargar Configuración", callback_data=callback_registry.pack("download_config", peer_hash))],
                 [InlineKeyboardButton("⬅️ Volver", callback_data="operator_main_menu")]
             ]
             
@@ -3757,28 +3729,32 @@ async def generate_peer_automatically(update: Update, context: ContextTypes.DEFA
             # Para admins, mostrar botones normales
             keyboard = [
                 [
-                    InlineKeyboardButton("⬅️ Volver a Configuración", callback_data=f"cfg:{config_name}"),
-                    InlineKeyboardButton("📥 Descargar Configuración", callback_data=f"download_config:{peer_hash}")
+                    InlineKeyboardButton("⬅️ Volver a Configuración", callback_data=callback_registry.pack("cfg", config_name)),
+                    InlineKeyboardButton("📥 Descargar Configuración", callback_data=callback_registry.pack("download_config", peer_hash))
                 ]
             ]
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         
+        await progress.flush()
         await update.message.reply_text(
             message,
             parse_mode="Markdown",
             reply_markup=reply_markup
         )
+        logger.info(f"[PROVISION] Peer '{peer_name}' en {config_name}: {timer.summary()}")
     else:
         error_msg = result.get('message', 'Error desconocido')
         
         if is_operator(user_id):
             keyboard = [[InlineKeyboardButton("⬅️ Volver", callback_data="operator_main_menu")]]
         else:
-            keyboard = [[InlineKeyboardButton("⬅️ Volver a Configuración", callback_data=f"cfg:{config_name}")]]
+            keyboard = [[InlineKeyboardButton("⬅️ Volver a Configuración", callback_data=callback_registry.pack("cfg", config_name))]]
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         
+        await progress.flush()
+        logger.info(f"[PROVISION] Error creando '{peer_name}' en {config_name}: {timer.summary()}")
         await update.message.reply_text(
             f"❌ *Error al agregar peer*\n\n*Error:* {error_msg}\n\n"
             f"Intenta nuevamente o contacta al administrador.",
@@ -3837,7 +3813,7 @@ async def handle_operator_create_peer(query, context: CallbackContext):
             return
     
     # Obtener la primera configuración disponible
-    result = api_client.get_configurations()
+    result = await api_client.get_configurations()
     if not result.get("status"):
         await query.edit_message_text(
             f"❌ Error: {result.get('message', 'Error desconocido')} ({timestamp})",
@@ -4015,3 +3991,89 @@ async def handle_operators_detailed(query, context: CallbackContext):
             reply_markup=InlineKeyboardMarkup(keyboard),
             parse_mode="Markdown"
         )
+
+# ================= RUTAS DE CALLBACKS ================= #
+async def handle_main_menu_for_role(query):
+    """Menú principal según el rol del usuario"""
+    if is_operator(query.from_user.id):
+        await handle_operator_main_menu(query)
+    else:
+        await handle_main_menu(query)
+
+async def handle_noop(query):
+    """Botones informativos: no hacen nada"""
+    pass
+
+# prefijo, handler, tipos de los argumentos; role=ROLE_ADMIN deja fuera a los operadores
+# Menús y acciones abiertas a operadores
+router.add("main_menu", handle_main_menu_for_role)
+router.add("operator_main_menu", handle_operator_main_menu)
+router.add("operator_create_peer_menu", handle_operator_create_peer)
+router.add("help", handle_help)
+router.add("noop", handle_noop)
+router.add("operators_list", handle_operators_list)
+router.add("operators_detailed", handle_operators_detailed)
+router.add("add_peer", handle_add_peer, str)
+router.add("download_config", handle_download_peer_config, str)
+
+# Acciones principales
+router.add("handshake", handle_handshake, role=ROLE_ADMIN)
+router.add("configs", handle_configs, role=ROLE_ADMIN)
+router.add("configs_summary", handle_configs_summary, role=ROLE_ADMIN)
+router.add("system_status", handle_system_status, role=ROLE_ADMIN)
+router.add("protocols", handle_protocols, role=ROLE_ADMIN)
+router.add("stats", handle_stats, role=ROLE_ADMIN)
+
+# Restricciones
+router.add("restrictions", handle_restrictions_menu, str, role=ROLE_ADMIN)
+router.add("restricted_peers", handle_restricted_peers_list, str, int, role=ROLE_ADMIN)
+router.add("page_res", handle_restricted_peers_list, str, int, role=ROLE_ADMIN)
+router.add("restrict_peer_menu", handle_unrestricted_peers_list, str, int, role=ROLE_ADMIN)
+router.add("page_unres", handle_unrestricted_peers_list, str, int, role=ROLE_ADMIN)
+router.add("unrestrict", handle_unrestrict_simple, str, str, role=ROLE_ADMIN)
+router.add("restrict", handle_restrict_simple, str, str, role=ROLE_ADMIN)
+
+# Acciones masivas
+router.add("bulk", handle_bulk_menu, str, str, role=ROLE_ADMIN)
+router.add("bsel", handle_bulk_toggle, str, str, int, int, role=ROLE_ADMIN)
+router.add("bpage", show_bulk_selection, str, str, int, role=ROLE_ADMIN)
+router.add("ball", partial(handle_bulk_select_all, select=True), str, str, int, role=ROLE_ADMIN)
+router.add("bnone", partial(handle_bulk_select_all, select=False), str, str, int, role=ROLE_ADMIN)
+router.add("bconf", handle_bulk_confirm, str, str, role=ROLE_ADMIN)
+router.add("bexec", handle_bulk_execute, str, str, role=ROLE_ADMIN)
+router.add("bquit", handle_bulk_quit, str, str, role=ROLE_ADMIN)
+
+# Limpiar tráfico
+router.add("reset_traffic", handle_reset_traffic_menu, str, int, role=ROLE_ADMIN)
+router.add("reset_traffic_confirm", handle_reset_traffic_confirm, str, str, int, role=ROLE_ADMIN)
+router.add("reset_traffic_final", handle_reset_traffic_final, str, str, str, role=ROLE_ADMIN)
+
+# Paginación
+router.add("page_configs", handle_configs, int, optional=1, role=ROLE_ADMIN)
+router.add("page_delete_peer", handle_delete_peer_menu, str, int, role=ROLE_ADMIN)
+router.add("page_schedule_jobs", handle_schedule_jobs_list, str, str, int, role=ROLE_ADMIN)
+
+# Configuraciones específicas
+router.add("cfg", handle_config_detail, str, role=ROLE_ADMIN)
+router.add("changes", handle_config_changes, str, role=ROLE_ADMIN)
+router.add("peers_detailed", handle_peers_detailed, str, role=ROLE_ADMIN)
+router.add("peers_detailed_paginated", handle_peers_detailed_paginated, str, int, role=ROLE_ADMIN)
+
+# Búsqueda de peers
+router.add("search", handle_search_prompt, str, str, optional=1, role=ROLE_ADMIN)
+router.add("peer", handle_peer_detail, str, str, role=ROLE_ADMIN)
+
+# Eliminación de peers
+router.add("delete_peer", handle_delete_peer_menu, str, role=ROLE_ADMIN)
+router.add("delete_peer_confirm", handle_delete_peer_confirm, str, str, role=ROLE_ADMIN)
+router.add("delete_peer_execute", handle_delete_peer_final, str, str, role=ROLE_ADMIN)
+
+# Schedule jobs
+router.add("schedule_jobs_menu", handle_schedule_jobs_menu, str, int, optional=1, role=ROLE_ADMIN)
+router.add("schedule_job_peer", handle_schedule_job_peer_selected, str, str, role=ROLE_ADMIN)
+router.add("add_schedule_job_data", handle_add_schedule_job_data, str, str, role=ROLE_ADMIN)
+router.add("add_schedule_job_date", handle_add_schedule_job_date, str, str, role=ROLE_ADMIN)
+router.add("delete_schedule_job_all", partial(handle_delete_schedule_job_confirm, job_index="all"), str, str, role=ROLE_ADMIN)
+router.add("delete_schedule_job_confirm", handle_delete_schedule_job_confirm, str, str, str, role=ROLE_ADMIN)
+router.add("delete_schedule_job_final", handle_delete_schedule_job_execute, str, str, str, role=ROLE_ADMIN)
+router.add("delete_schedule_job_execute", handle_delete_schedule_job_execute, str, str, str, role=ROLE_ADMIN)
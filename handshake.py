@@ -0,0 +1,102 @@
+"""
+Conversión de latest_handshake de WGDashboard a segundos
+"""
+
+import re
+from functools import lru_cache
+
+# str(timedelta): "0:01:12", "2 days, 3:04:05", "1 day, 0:00:05.123456"
+# Algunas versiones envían solo "MM:SS"
+_HANDSHAKE_RE = re.compile(r"(?:(\d+) days?, )?(?:(\d+):)?(\d+):(\d+)(?:\.\d+)?")
+
+_NO_HANDSHAKE = "no handshake"
+
+@lru_cache(maxsize=4096)
+def _parse(value: str) -> int:
+    """Convierte un latest_handshake ya sin espacios; memoizado por valor"""
+    # Camino rápido: "H:MM:SS", el formato más habitual
+    if len(value) == 7 and value[1] == ':' and value[4] == ':':
+        try:
+            return int(value[0]) * 3600 + int(value[2:4]) * 60 + int(value[5:7])
+        except ValueError:
+            return 0
+    
+    if value.lower() == _NO_HANDSHAKE:
+        return 0
+    
+    match = _HANDSHAKE_RE.fullmatch(value)
+    if match is None:
+        return 0
+    
+    days, hours, minutes, seconds = match.groups()
+    return (
+        int(days or 0) * 86400
+        + int(hours or 0) * 3600
+        + int(minutes) * 60
+        + int(seconds)
+    )
+
+def parse_handshake_seconds(latest_handshake: str) -> int:
+    """Convierte latest_handshake ("2 days, 3:04:05", "0:01:12") a segundos"""
+    if not latest_handshake:
+        return 0
+    return _parse(latest_handshake.strip())
+
+def cache_info():
+    """Estadísticas del memo de valores ya convertidos"""
+    return _parse.cache_info()
+
+if __name__ == "__main__":
+    # Micro-benchmark: python handshake.py
+    import random
+    import timeit
+    
+    def legacy_parse(latest_handshake: str) -> int:
+        """Versión anterior (split/map/int en cada llamada)"""
+        latest_handshake_str = (latest_handshake or '').strip()
+        seconds = 0
+        
+        if latest_handshake_str and latest_handshake_str.lower() != 'no handshake':
+            try:
+                if 'days' in latest_handshake_str:
+                    parts = latest_handshake_str.split(', ')
+                    days = int(parts[0].split(' ')[0])
+                    time_parts = list(map(int, parts[1].split(':')))
+                    seconds = days * 86400 + time_parts[0] * 3600 + time_parts[1] * 60 + time_parts[2]
+                else:
+                    time_parts = list(map(int, latest_handshake_str.split(':')))
+                    if len(time_parts) == 3:
+                        seconds = time_parts[0] * 3600 + time_parts[1] * 60 + time_parts[2]
+                    elif len(time_parts) == 2:
+                        seconds = time_parts[0] * 60 + time_parts[1]
+            except (ValueError, IndexError):
+                pass
+        
+        return seconds
+    
+    # 10k peers: la mayoría sin handshake o inactivos con valores repetidos
+    random.seed(1)
+    samples = []
+    for _ in range(10000):
+        kind = random.random()
+        if kind < 0.5:
+            samples.append("No Handshake")
+        elif kind < 0.8:
+            samples.append(f"{random.randint(2, 30)} days, {random.randint(0, 23)}:00:00")
+        else:
+            samples.append(f"0:{random.randint(0, 59):02d}:{random.randint(0, 59):02d}")
+    
+    # Mismo resultado en todos los formatos que entendía la versión anterior
+    mismatches = [s for s in samples if legacy_parse(s) != parse_handshake_seconds(s)]
+    print(f"Diferencias con la versión anterior: {len(mismatches)}")
+    
+    rounds = 20
+    legacy = timeit.timeit(lambda: [legacy_parse(s) for s in samples], number=rounds) / rounds
+    _parse.cache_clear()
+    cold = timeit.timeit(lambda: [parse_handshake_seconds(s) for s in samples], number=1)
+    warm = timeit.timeit(lambda: [parse_handshake_seconds(s) for s in samples], number=rounds) / rounds
+    
+    print(f"Versión anterior: {legacy * 1000:.2f} ms / 10k peers")
+    print(f"Nueva (memo vacío): {cold * 1000:.2f} ms / 10k peers")
+    print(f"Nueva (memo lleno): {warm * 1000:.2f} ms / 10k peers ({legacy / warm:.1f}x)")
+    print(f"Memo: {cache_info()}")
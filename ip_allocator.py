@@ -0,0 +1,332 @@
+"""
+Asignación de direcciones IP para peers nuevos
+
+Cada configuración tiene un mapa de ocupación (un byte por dirección) de
+los prefijos de su Address, IPv4 o IPv6 y de cualquier tamaño. El mapa se
+construye a partir de los peers del snapshot, se actualiza solo con los
+peers que cambian y busca la siguiente dirección libre desde un cursor,
+así que asignar cuesta O(1) amortizado. Las direcciones entregadas quedan
+reservadas hasta que el peer aparece en un snapshot, para que dos
+creaciones simultáneas no reciban la misma.
+"""
+
+import ipaddress
+import logging
+import socket
+import time
+from typing import Dict, Any, Iterable, List, NamedTuple, Optional, Tuple, Union, TYPE_CHECKING
+
+from config import IP_ALLOCATOR_WINDOW, IP_RESERVATION_TTL
+
+if TYPE_CHECKING:
+    from wg_api import ConfigSnapshot
+
+logger = logging.getLogger(__name__)
+
+# Las dos primeras direcciones (red y .1, que suele ser el servidor) no se asignan
+FIRST_HOST_OFFSET = 2
+
+# Máximo de referencias por dirección en el mapa
+_MAX_REFS = 255
+
+_MAX_PREFIXLEN = {4: 32, 6: 128}
+_FAMILIES = {4: socket.AF_INET, 6: socket.AF_INET6}
+
+class AddressRange(NamedTuple):
+    """Rango de direcciones como enteros (más barato que ip_network con miles de peers)"""
+    version: int
+    first: int
+    last: int
+    
+    @classmethod
+    def host(cls, version: int, value: int) -> "AddressRange":
+        return cls(version, value, value)
+    
+    def __str__(self) -> str:
+        # Solo se formatean direcciones sueltas (las que entrega el asignador)
+        address = ipaddress.IPv4Address(self.first) if self.version == 4 else ipaddress.IPv6Address(self.first)
+        return f"{address}/{_MAX_PREFIXLEN[self.version]}"
+
+def parse_addresses(value: Optional[str]) -> List[AddressRange]:
+    """Rangos de un campo allowed_ip ("10.0.0.2/32, fd00::2/128"), ignorando los inválidos"""
+    ranges = []
+    for part in (value or "").split(","):
+        address, _, prefixlen = part.strip().partition("/")
+        if not address:
+            continue
+        version = 6 if ":" in address else 4
+        max_prefixlen = _MAX_PREFIXLEN[version]
+        try:
+            # inet_pton es bastante más rápido que ipaddress para miles de peers
+            value = int.from_bytes(socket.inet_pton(_FAMILIES[version], address), "big")
+            host_bits = max_prefixlen - int(prefixlen or max_prefixlen)
+            if not 0 <= host_bits <= max_prefixlen:
+                raise ValueError(prefixlen)
+        except (OSError, ValueError):
+            logger.debug(f"[IP] Dirección inválida ignorada: {part.strip()}")
+            continue
+        first = value >> host_bits << host_bits
+        ranges.append(AddressRange(version, first, first + (1 << host_bits) - 1))
+    return ranges
+
+class PrefixMap:
+    """
+    Ocupación de un prefijo.
+    
+    Solo se gestionan las primeras window direcciones: un /64 de IPv6 no
+    cabe en memoria y nunca se llenará. Cada byte cuenta cuántos peers o
+    reservas usan la dirección, de modo que liberar un duplicado no deja
+    libre la dirección del otro.
+    """
+    
+    __slots__ = ("network", "version", "base", "size", "_refs", "_cursor")
+    
+    def __init__(self, interface: Union[ipaddress.IPv4Interface, ipaddress.IPv6Interface], window: int):
+        self.network = interface.network
+        self.version = self.network.version
+        self.base = int(self.network.network_address)
+        self.size = min(self.network.num_addresses, max(1, window))
+        self._refs = bytearray(self.size)
+        self._cursor = 0
+        
+        for offset in range(min(FIRST_HOST_OFFSET, self.size)):
+            self._refs[offset] = 1
+        if self.network.version == 4 and self.network.prefixlen <= 30 and self.size == self.network.num_addresses:
+            # Broadcast
+            self._refs[-1] = 1
+        # Dirección del propio servidor
+        self.mark(AddressRange.host(self.version, int(interface.ip)))
+    
+    def _offsets(self, addresses: AddressRange) -> range:
+        """Posiciones del mapa que ocupa el rango (vacío si no se solapa)"""
+        if addresses.version != self.version:
+            return range(0)
+        start = max(addresses.first - self.base, 0)
+        end = min(addresses.last - self.base + 1, self.size)
+        return range(start, max(start, end))
+    
+    def mark(self, addresses: AddressRange):
+        for offset in self._offsets(addresses):
+            if self._refs[offset] < _MAX_REFS:
+                self._refs[offset] += 1
+    
+    def unmark(self, addresses: AddressRange):
+        for offset in self._offsets(addresses):
+            if self._refs[offset] > 0:
+                self._refs[offset] -= 1
+                if self._refs[offset] == 0 and offset < self._cursor:
+                    self._cursor = offset
+    
+    def take(self) -> Optional[AddressRange]:
+        """Marca y devuelve la primera dirección libre, o None si no queda ninguna"""
+        # Por debajo del cursor no hay huecos: la búsqueda no vuelve a empezar
+        offset = self._refs.find(0, self._cursor)
+        if offset < 0:
+            self._cursor = self.size
+            return None
+        
+        self._refs[offset] = 1
+        self._cursor = offset + 1
+        return AddressRange.host(self.version, self.base + offset)
+    
+    def free(self) -> int:
+        return self._refs.count(0)
+
+class ConfigAllocator:
+    """Mapas de los prefijos de una configuración y sus reservas"""
+    
+    def __init__(self, config_name: str, address: str, window: int):
+        self.config_name = config_name
+        self.address = address
+        self.version = 0
+        self.prefixes: List[PrefixMap] = []
+        for part in address.split(","):
+            if part.strip():
+                self.prefixes.append(PrefixMap(ipaddress.ip_interface(part.strip()), window))
+        if not self.prefixes:
+            raise ValueError(f"Address vacío en {config_name}")
+        # clave pública -> (allowed_ip, redes que ocupa en el mapa)
+        self._peers: Dict[str, Tuple[Optional[str], Tuple[AddressRange, ...]]] = {}
+        # dirección reservada -> caducidad, de la que antes caduca a la última
+        self._reservations: Dict[AddressRange, float] = {}
+        # clave pública -> reservas de peers creados que aún no llegan en un snapshot
+        self._created: Dict[str, Tuple[AddressRange, ...]] = {}
+    
+    def _mark(self, networks: Iterable[AddressRange]):
+        for network in networks:
+            for prefix in self.prefixes:
+                prefix.mark(network)
+    
+    def _unmark(self, networks: Iterable[AddressRange]):
+        for network in networks:
+            for prefix in self.prefixes:
+                prefix.unmark(network)
+    
+    def sync(self, snapshot: "ConfigSnapshot") -> int:
+        """
+        Pone el mapa al día con un snapshot más nuevo.
+        
+        Solo se tocan los peers añadidos, eliminados o con otra IP; las
+        reservas cuyo peer ya aparece se sueltan. Devuelve el número de
+        peers actualizados.
+        """
+        current = {peer.id: peer.allowed_ip for peer in snapshot.peers}
+        current.update((peer.id, peer.allowed_ip) for peer in snapshot.restricted_peers)
+        
+        changed = 0
+        
+        for key in [key for key in self._peers if key not in current]:
+            self._unmark(self._peers.pop(key)[1])
+            changed += 1
+        
+        for key, allowed_ip in current.items():
+            previous = self._peers.get(key)
+            if previous is not None and previous[0] == allowed_ip:
+                continue
+            
+            if previous is not None:
+                self._unmark(previous[1])
+            networks = tuple(parse_addresses(allowed_ip))
+            self._mark(networks)
+            self._peers[key] = (allowed_ip, networks)
+            changed += 1
+            
+            # El peer ya ocupa la dirección reservada para él
+            self._created.pop(key, None)
+            for network in networks:
+                if self._reservations.pop(network, None) is not None:
+                    self._unmark((network,))
+        
+        self.version = snapshot.version
+        return changed
+    
+    def _expire_reservations(self):
+        now = time.time()
+        # Todas usan el mismo TTL: basta mirar las primeras
+        while self._reservations:
+            network, expires = next(iter(self._reservations.items()))
+            if expires >= now:
+                break
+            del self._reservations[network]
+            self._unmark((network,))
+    
+    def allocate(self, ttl: float) -> Optional[List[AddressRange]]:
+        """Una dirección libre de cada prefijo, reservadas; None si alguno está lleno"""
+        self._expire_reservations()
+        
+        taken: List[AddressRange] = []
+        for prefix in self.prefixes:
+            network = prefix.take()
+            if network is None:
+                self._unmark(taken)
+                return None
+            taken.append(network)
+        
+        expires = time.time() + ttl
+        for network in taken:
+            self._reservations[network] = expires
+        return taken
+    
+    def renew(self, public_key: str, networks: Tuple[AddressRange, ...], ttl: float):
+        """Alarga las reservas de un peer ya creado hasta que llegue en un snapshot"""
+        self._created[public_key] = networks
+        expires = time.time() + ttl
+        for network in networks:
+            if self._reservations.pop(network, None) is not None:
+                # Al final, para mantener el orden por caducidad
+                self._reservations[network] = expires
+    
+    def release(self, networks: Iterable[AddressRange]):
+        """Suelta reservas que no llegaron a usarse"""
+        for network in networks:
+            if self._reservations.pop(network, None) is not None:
+                self._unmark((network,))
+    
+    def remove_peers(self, public_keys: Iterable[str]) -> int:
+        """Libera las direcciones de peers eliminados"""
+        removed = 0
+        for key in public_keys:
+            created = self._created.pop(key, None)
+            if created is not None:
+                self.release(created)
+                removed += 1
+            previous = self._peers.pop(key, None)
+            if previous is not None:
+                self._unmark(previous[1])
+                removed += 1
+        return removed
+    
+    def free(self) -> int:
+        """Direcciones libres en el prefijo más lleno"""
+        return min(prefix.free() for prefix in self.prefixes)
+    
+    @property
+    def reserved(self) -> int:
+        return len(self._reservations)
+
+class IpAllocator:
+    """Asignadores por configuración, creados con la primera asignación"""
+    
+    def __init__(self, window: int = 65536, reservation_ttl: float = 300):
+        self.window = window
+        self.reservation_ttl = reservation_ttl
+        self._configs: Dict[str, ConfigAllocator] = {}
+    
+    def _for_snapshot(self, snapshot: "ConfigSnapshot", address: Optional[str]) -> ConfigAllocator:
+        address = address or snapshot.config_info.get("Address") or ""
+        allocator = self._configs.get(snapshot.config_name)
+        
+        if allocator is None or allocator.address != address:
+            # Configuración nueva o Address cambiado: se construye desde cero
+            allocator = ConfigAllocator(snapshot.config_name, address, self.window)
+            self._configs[snapshot.config_name] = allocator
+        
+        if snapshot.version > allocator.version:
+            allocator.sync(snapshot)
+        return allocator
+    
+    def allocate(self, snapshot: "ConfigSnapshot", address: Optional[str] = None) -> Optional[str]:
+        """
+        allowed_ips para un peer nuevo ("10.0.0.5/32" o
+        "10.0.0.5/32, fd00::5/128" con varios prefijos).
+        
+        La dirección queda reservada hasta que el peer aparece en un
+        snapshot, se libera con release() o pasa IP_RESERVATION_TTL.
+        None si no quedan direcciones; ValueError si Address no es válido.
+        """
+        allocator = self._for_snapshot(snapshot, address)
+        networks = allocator.allocate(self.reservation_ttl)
+        
+        if networks is None:
+            logger.warning(f"[IP] Sin direcciones libres en {snapshot.config_name} ({allocator.address})")
+            return None
+        return ", ".join(str(network) for network in networks)
+    
+    def confirm(self, config_name: str, public_key: str, allowed_ips: str):
+        """El peer se creó: la reserva se mantiene hasta verlo en un snapshot"""
+        allocator = self._configs.get(config_name)
+        if allocator is not None:
+            allocator.renew(public_key, tuple(parse_addresses(allowed_ips)), self.reservation_ttl)
+    
+    def release(self, config_name: str, allowed_ips: str):
+        """La creación falló: la dirección vuelve a estar libre"""
+        allocator = self._configs.get(config_name)
+        if allocator is not None:
+            allocator.release(parse_addresses(allowed_ips))
+    
+    def remove_peers(self, config_name: str, public_keys: Iterable[str]):
+        """Peers eliminados: sus direcciones quedan libres sin esperar al snapshot"""
+        allocator = self._configs.get(config_name)
+        if allocator is not None:
+            allocator.remove_peers(public_keys)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Direcciones libres y reservas, para diagnóstico"""
+        return {
+            "configs": len(self._configs),
+            "free": {name: allocator.free() for name, allocator in self._configs.items()},
+            "reservations": sum(allocator.reserved for allocator in self._configs.values())
+        }
+
+# Instancia global del asignador
+ip_allocator = IpAllocator(IP_ALLOCATOR_WINDOW, IP_RESERVATION_TTL)
@@ -2,25 +2,12 @@
 Módulo para generar teclados inline
 """
 
-import base64
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Sequence, Union
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
 from config import ITEMS_PER_PAGE
-
-def safe_callback_data(text: str) -> str:
-    """Codifica texto para hacerlo seguro para callback_data"""
-    # Codificar en base64 y luego reemplazar caracteres problemáticos
-    encoded = base64.urlsafe_b64encode(text.encode()).decode()
-    return encoded
-
-def decode_callback_data(encoded: str) -> str:
-    """Decodifica texto de callback_data seguro"""
-    try:
-        decoded = base64.urlsafe_b64decode(encoded.encode()).decode()
-        return decoded
-    except:
-        return encoded
+from snapshot_store import peer_token
+from callback_registry import callback_registry
 
 def main_menu(is_admin: bool = True, is_operator: bool = False) -> InlineKeyboardMarkup:
     """Teclado del menú principal según rol"""
@@ -113,19 +100,19 @@ def operator_my_peers_menu(peers: List[Dict], page: int = 0) -> InlineKeyboardMa
         ).hexdigest()[:12]
         
         keyboard.append([
-            InlineKeyboardButton(button_text, callback_data=f"operator_download:{peer_hash}")
+            InlineKeyboardButton(button_text, callback_data=callback_registry.pack("operator_download", peer_hash))
         ])
     
     # Botones de navegación
     nav_buttons = []
     if page > 0:
         nav_buttons.append(
-            InlineKeyboardButton("◀️", callback_data=f"operator_peers_page:{page-1}")
+            InlineKeyboardButton("◀️", callback_data=callback_registry.pack("operator_peers_page", page-1))
         )
     
     if end_idx < len(peers):
         nav_buttons.append(
-            InlineKeyboardButton("▶️", callback_data=f"operator_peers_page:{page+1}")
+            InlineKeyboardButton("▶️", callback_data=callback_registry.pack("operator_peers_page", page+1))
         )
     
     if nav_buttons:
@@ -148,7 +135,7 @@ def operator_choose_config_menu(configs: List[Dict]) -> InlineKeyboardMarkup:
         
         button_text = f"{config_name} ({connected}/{total_peers})"
         keyboard.append([
-            InlineKeyboardButton(button_text, callback_data=f"operator_add_peer:{config_name}")
+            InlineKeyboardButton(button_text, callback_data=callback_registry.pack("operator_add_peer", config_name))
         ])
     
     keyboard.append([
@@ -160,13 +147,16 @@ def operator_choose_config_menu(configs: List[Dict]) -> InlineKeyboardMarkup:
 def config_menu(config_name: str) -> InlineKeyboardMarkup:
     """Menú para una configuración específica"""
     keyboard = [
-        [InlineKeyboardButton("📋 Detalles Peers", callback_data=f"peers_detailed_paginated:{config_name}:0")],
-        [InlineKeyboardButton("🗑 Eliminar Peer", callback_data=f"delete_peer:{config_name}")],
-        [InlineKeyboardButton("➕ Agregar Peer", callback_data=f"add_peer:{config_name}")],
-        [InlineKeyboardButton("⏰ Schedule Jobs", callback_data=f"schedule_jobs_menu:{config_name}")],
-        [InlineKeyboardButton("🚫 Restricciones", callback_data=f"restrictions:{config_name}")],
-        [InlineKeyboardButton("🧹 Limpiar Tráfico", callback_data=f"reset_traffic:{config_name}:0")],  # NUEVO BOTÓN
-        [InlineKeyboardButton("🔄 Actualizar", callback_data=f"cfg:{config_name}")],
+        [InlineKeyboardButton("📋 Detalles Peers", callback_data=callback_registry.pack("peers_detailed_paginated", config_name, 0))],
+        [InlineKeyboardButton("🔍 Buscar Peer", callback_data=callback_registry.pack("search", config_name))],
+        [InlineKeyboardButton("🗑 Eliminar Peer", callback_data=callback_registry.pack("delete_peer", config_name))],
+        [InlineKeyboardButton("🗑 Eliminar varios", callback_data=callback_registry.pack("bulk", "d", config_name))],
+        [InlineKeyboardButton("➕ Agregar Peer", callback_data=callback_registry.pack("add_peer", config_name))],
+        [InlineKeyboardButton("⏰ Schedule Jobs", callback_data=callback_registry.pack("schedule_jobs_menu", config_name))],
+        [InlineKeyboardButton("🚫 Restricciones", callback_data=callback_registry.pack("restrictions", config_name))],
+        [InlineKeyboardButton("🧹 Limpiar Tráfico", callback_data=callback_registry.pack("reset_traffic", config_name, 0))],  # NUEVO BOTÓN
+        [InlineKeyboardButton("🔀 Cambios recientes", callback_data=callback_registry.pack("changes", config_name))],
+        [InlineKeyboardButton("🔄 Actualizar", callback_data=callback_registry.pack("cfg", config_name))],
         [InlineKeyboardButton("⬅️ Volver", callback_data="configs")]
     ]
     return InlineKeyboardMarkup(keyboard)
@@ -184,7 +174,7 @@ def paginated_reset_traffic_menu(peers: List[Dict], config_name: str, page: int)
         keyboard.append([
             InlineKeyboardButton(
                 button_text,
-                callback_data=f"reset_traffic_confirm:{config_name}:{i}:{page}"
+                callback_data=callback_registry.pack("reset_traffic_confirm", config_name, peer_token(peer['id']), page)
             )
         ])
     
@@ -193,12 +183,12 @@ def paginated_reset_traffic_menu(peers: List[Dict], config_name: str, page: int)
     
     if page > 0:
         nav_buttons.append(
-            InlineKeyboardButton("◀️", callback_data=f"reset_traffic:{config_name}:{page-1}")
+            InlineKeyboardButton("◀️", callback_data=callback_registry.pack("reset_traffic", config_name, page-1))
         )
     
     if end_idx < len(peers):
         nav_buttons.append(
-            InlineKeyboardButton("▶️", callback_data=f"reset_traffic:{config_name}:{page+1}")
+            InlineKeyboardButton("▶️", callback_data=callback_registry.pack("reset_traffic", config_name, page+1))
         )
     
     if nav_buttons:
@@ -206,7 +196,7 @@ def paginated_reset_traffic_menu(peers: List[Dict], config_name: str, page: int)
     
     # Botones de acción
     keyboard.append([
-        InlineKeyboardButton("⬅️ Volver", callback_data=f"cfg:{config_name}")
+        InlineKeyboardButton("⬅️ Volver", callback_data=callback_registry.pack("cfg", config_name))
     ])
     
     return InlineKeyboardMarkup(keyboard)
@@ -214,9 +204,11 @@ def paginated_reset_traffic_menu(peers: List[Dict], config_name: str, page: int)
 def restrictions_menu(config_name: str) -> InlineKeyboardMarkup:
     """Menú de restricciones para una configuración"""
     keyboard = [
-        [InlineKeyboardButton("👥 Restringidos", callback_data=f"restricted_peers:{config_name}:0")],
-        [InlineKeyboardButton("🔒 Restringir Peer", callback_data=f"restrict_peer_menu:{config_name}:0")],
-        [InlineKeyboardButton("⬅️ Volver", callback_data=f"cfg:{config_name}")]
+        [InlineKeyboardButton("👥 Restringidos", callback_data=callback_registry.pack("restricted_peers", config_name, 0))],
+        [InlineKeyboardButton("🔒 Restringir Peer", callback_data=callback_registry.pack("restrict_peer_menu", config_name, 0))],
+        [InlineKeyboardButton("☑️ Restringir varios", callback_data=callback_registry.pack("bulk", "r", config_name))],
+        [InlineKeyboardButton("☑️ Quitar restricción a varios", callback_data=callback_registry.pack("bulk", "u", config_name))],
+        [InlineKeyboardButton("⬅️ Volver", callback_data=callback_registry.pack("cfg", config_name))]
     ]
     return InlineKeyboardMarkup(keyboard)
 
@@ -229,12 +221,12 @@ def paginated_restricted_peers_menu(peers: List[Dict], config_name: str, page: i
     
     for i, peer in enumerate(page_peers, start_idx):
         peer_name = peer.get('name', f'Peer {i+1}')
-        # Usar solo el índice en callback_data - MUY CORTO
+        # Token corto derivado de la clave pública
         button_text = f"🔓 {peer_name[:15]}"
         keyboard.append([
             InlineKeyboardButton(
                 button_text,
-                callback_data=f"unrestrict:{config_name}:{i}"
+                callback_data=callback_registry.pack("unrestrict", config_name, peer_token(peer['id']))
             )
         ])
     
@@ -243,12 +235,12 @@ def paginated_restricted_peers_menu(peers: List[Dict], config_name: str, page: i
     
     if page > 0:
         nav_buttons.append(
-            InlineKeyboardButton("◀️", callback_data=f"page_res:{config_name}:{page-1}")
+            InlineKeyboardButton("◀️", callback_data=callback_registry.pack("page_res", config_name, page-1))
         )
     
     if end_idx < len(peers):
         nav_buttons.append(
-            InlineKeyboardButton("▶️", callback_data=f"page_res:{config_name}:{page+1}")
+            InlineKeyboardButton("▶️", callback_data=callback_registry.pack("page_res", config_name, page+1))
         )
     
     if nav_buttons:
@@ -256,7 +248,7 @@ def paginated_restricted_peers_menu(peers: List[Dict], config_name: str, page: i
     
     # Botones de acción
     keyboard.append([
-        InlineKeyboardButton("⬅️ Volver", callback_data=f"restrictions:{config_name}")
+        InlineKeyboardButton("⬅️ Volver", callback_data=callback_registry.pack("restrictions", config_name))
     ])
     
     return InlineKeyboardMarkup(keyboard)
@@ -271,12 +263,12 @@ def paginated_unrestricted_peers_menu(peers: List[Dict], config_name: str, page:
     
     for i, peer in enumerate(page_peers, start_idx):
         peer_name = peer.get('name', f'Peer {i+1}')
-        # Usar solo el índice en callback_data - MUY CORTO
+        # Token corto derivado de la clave pública
         button_text = f"🔒 {peer_name[:15]}"
         keyboard.append([
             InlineKeyboardButton(
                 button_text,
-                callback_data=f"restrict:{config_name}:{i}"
+                callback_data=callback_registry.pack("restrict", config_name, peer_token(peer['id']))
             )
         ])
     
@@ -285,12 +277,12 @@ def paginated_unrestricted_peers_menu(peers: List[Dict], config_name: str, page:
     
     if page > 0:
         nav_buttons.append(
-            InlineKeyboardButton("◀️", callback_data=f"page_unres:{config_name}:{page-1}")
+            InlineKeyboardButton("◀️", callback_data=callback_registry.pack("page_unres", config_name, page-1))
         )
     
     if end_idx < len(peers):
         nav_buttons.append(
-            InlineKeyboardButton("▶️", callback_data=f"page_unres:{config_name}:{page+1}")
+            InlineKeyboardButton("▶️", callback_data=callback_registry.pack("page_unres", config_name, page+1))
         )
     
     if nav_buttons:
@@ -298,7 +290,70 @@ def paginated_unrestricted_peers_menu(peers: List[Dict], config_name: str, page:
     
     # Botones de acción
     keyboard.append([
-        InlineKeyboardButton("⬅️ Volver", callback_data=f"restrictions:{config_name}")
+        InlineKeyboardButton("⬅️ Volver", callback_data=callback_registry.pack("restrictions", config_name))
+    ])
+    
+    return InlineKeyboardMarkup(keyboard)
+
+def multi_select_peers_menu(peers: List[Dict], config_name: str, action: str, selected: set, page: int = 0) -> InlineKeyboardMarkup:
+    """
+    Teclado paginado para marcar varios peers y aplicar una acción masiva.
+    
+    action es el código corto de la acción ("r", "u" o "d"); los callbacks
+    solo llevan índices para no superar los 64 bytes de Telegram.
+    """
+    action_text_map = {
+        "r": "🔒 Restringir",
+        "u": "🔓 Quitar restricción",
+        "d": "🗑 Eliminar"
+    }
+    keyboard = []
+    start_idx = page * ITEMS_PER_PAGE
+    end_idx = start_idx + ITEMS_PER_PAGE
+    page_peers = peers[start_idx:end_idx]
+    
+    for i, peer in enumerate(page_peers, start_idx):
+        peer_name = peer.get('name') or f'Peer {i+1}'
+        mark = "✅" if i in selected else "⬜"
+        keyboard.append([
+            InlineKeyboardButton(
+                f"{mark} {peer_name[:25]}",
+                callback_data=callback_registry.pack("bsel", action, config_name, i, page)
+            )
+        ])
+    
+    # Botones de navegación
+    nav_buttons = []
+    
+    if page > 0:
+        nav_buttons.append(
+            InlineKeyboardButton("◀️", callback_data=callback_registry.pack("bpage", action, config_name, page-1))
+        )
+    
+    if end_idx < len(peers):
+        nav_buttons.append(
+            InlineKeyboardButton("▶️", callback_data=callback_registry.pack("bpage", action, config_name, page+1))
+        )
+    
+    if nav_buttons:
+        keyboard.append(nav_buttons)
+    
+    keyboard.append([
+        InlineKeyboardButton("☑️ Todos", callback_data=callback_registry.pack("ball", action, config_name, page)),
+        InlineKeyboardButton("⬜ Ninguno", callback_data=callback_registry.pack("bnone", action, config_name, page))
+    ])
+    
+    if selected:
+        keyboard.append([
+            InlineKeyboardButton(
+                f"{action_text_map.get(action, 'Aplicar')} ({len(selected)})",
+                callback_data=callback_registry.pack("bconf", action, config_name)
+            )
+        ])
+    
+    keyboard.append([
+        # Volver descarta la selección
+        InlineKeyboardButton("⬅️ Volver", callback_data=callback_registry.pack("bquit", action, config_name))
     ])
     
     return InlineKeyboardMarkup(keyboard)
@@ -319,7 +374,7 @@ def paginated_configs_menu(configs: List[Dict], page: int = 0) -> InlineKeyboard
         
         button_text = f"{config_name} ({connected}/{total_peers})"
         keyboard.append([
-            InlineKeyboardButton(button_text, callback_data=f"cfg:{config_name}")
+            InlineKeyboardButton(button_text, callback_data=callback_registry.pack("cfg", config_name))
         ])
     
     # Botones de navegación
@@ -327,12 +382,12 @@ def paginated_configs_menu(configs: List[Dict], page: int = 0) -> InlineKeyboard
     
     if page > 0:
         nav_buttons.append(
-            InlineKeyboardButton("◀️ Anterior", callback_data=f"page_configs:{page-1}")
+            InlineKeyboardButton("◀️ Anterior", callback_data=callback_registry.pack("page_configs", page-1))
         )
     
     if end_idx < len(configs):
         nav_buttons.append(
-            InlineKeyboardButton("Siguiente ▶️", callback_data=f"page_configs:{page+1}")
+            InlineKeyboardButton("Siguiente ▶️", callback_data=callback_registry.pack("page_configs", page+1))
         )
     
     if nav_buttons:
@@ -360,14 +415,12 @@ def peers_selection_menu(peers: List[Dict], config_name: str, action: str, page:
     for peer in page_peers:
         peer_name = peer.get('name', 'Sin nombre')
         peer_key = peer.get('id', '')  # 'id' es la clave pública
-        # Codificar la clave pública para callback_data seguro
-        safe_peer_key = safe_callback_data(peer_key)
         
         button_text = f"{peer_name}"
         keyboard.append([
             InlineKeyboardButton(
                 button_text,
-                callback_data=f"{action}_confirm:{config_name}:{safe_peer_key}"
+                callback_data=callback_registry.pack(f"{action}_confirm", config_name, peer_token(peer_key))
             )
         ])
     
@@ -376,12 +429,12 @@ def peers_selection_menu(peers: List[Dict], config_name: str, action: str, page:
     
     if page > 0:
         nav_buttons.append(
-            InlineKeyboardButton("◀️ Anterior", callback_data=f"page_{action}:{config_name}:{page-1}")
+            InlineKeyboardButton("◀️ Anterior", callback_data=callback_registry.pack(f"page_{action}", config_name, page-1))
         )
     
     if end_idx < len(peers):
         nav_buttons.append(
-            InlineKeyboardButton("Siguiente ▶️", callback_data=f"page_{action}:{config_name}:{page+1}")
+            InlineKeyboardButton("Siguiente ▶️", callback_data=callback_registry.pack(f"page_{action}", config_name, page+1))
         )
     
     if nav_buttons:
@@ -389,7 +442,7 @@ def peers_selection_menu(peers: List[Dict], config_name: str, action: str, page:
     
     # Botón para cancelar/volver
     keyboard.append([
-        InlineKeyboardButton("❌ Cancelar", callback_data=f"cfg:{config_name}")
+        InlineKeyboardButton("❌ Cancelar", callback_data=callback_registry.pack("cfg", config_name))
     ])
     
     return InlineKeyboardMarkup(keyboard)
@@ -407,14 +460,11 @@ def confirmation_menu(config_name: str, peer_identifier: str, action_type: str,
         }
         action_text = action_text_map.get(action_type, "Confirmar")
     
-    # Codificar el identificador si es necesario
-    safe_identifier = safe_callback_data(peer_identifier)
-    
     # Para reset_traffic, necesitamos pasar también la página
     if action_type == "reset_traffic" and extra_data:
-        callback_data = f"{action_type}_execute:{config_name}:{safe_identifier}:{extra_data}"
+        callback_data = callback_registry.pack(f"{action_type}_execute", config_name, peer_identifier, extra_data)
     else:
-        callback_data = f"{action_type}_execute:{config_name}:{safe_identifier}"
+        callback_data = callback_registry.pack(f"{action_type}_execute", config_name, peer_identifier)
     
     keyboard = [
         [
@@ -424,14 +474,20 @@ def confirmation_menu(config_name: str, peer_identifier: str, action_type: str,
             ),
             InlineKeyboardButton(
                 f"❌ Cancelar",
-                callback_data=f"cfg:{config_name}"
+                callback_data=callback_registry.pack("cfg", config_name)
             )
         ]
     ]
     
     return InlineKeyboardMarkup(keyboard)
 
-def back_button(target: str = "main_menu", user_id: int = None) -> InlineKeyboardMarkup:
+def _target_data(target: Union[str, Sequence]) -> str:
+    """callback_data de un destino: "acción" o (acción, arg1, arg2...)"""
+    if isinstance(target, str):
+        return callback_registry.pack(target)
+    return callback_registry.pack(*target)
+
+def back_button(target: Union[str, Sequence] = "main_menu", user_id: int = None) -> InlineKeyboardMarkup:
     """Botón simple para volver - VERSIÓN CON ROL"""
     from utils import is_admin, is_operator
     
@@ -443,14 +499,14 @@ def back_button(target: str = "main_menu", user_id: int = None) -> InlineKeyboar
             return InlineKeyboardMarkup(keyboard)
     
     # Para otros casos o sin user_id, usar el target normal
-    keyboard = [[InlineKeyboardButton("⬅️ Volver", callback_data=target)]]
+    keyboard = [[InlineKeyboardButton("⬅️ Volver", callback_data=_target_data(target))]]
     return InlineKeyboardMarkup(keyboard)
 
-def refresh_button(target: str) -> InlineKeyboardMarkup:
+def refresh_button(target: Union[str, Sequence]) -> InlineKeyboardMarkup:
     """Botón para refrescar la vista actual"""
     keyboard = [
         [
-            InlineKeyboardButton("🔄 Actualizar", callback_data=target),
+            InlineKeyboardButton("🔄 Actualizar", callback_data=_target_data(target)),
             InlineKeyboardButton("⬅️ Volver", callback_data="main_menu")
         ]
     ]
@@ -19,10 +19,10 @@ from telegram.ext import (
 import config
 from setup_logging import logger
 from handlers import (
-    start_command, help_command, stats_command, configs_command,
+    start_command, help_command, cancel_command, stats_command, configs_command, cache_command, find_command,
     callback_handler, text_message_handler
 )
-from utils import is_allowed
+from utils import is_allowed, admin_only
 
 # ================= FUNCIONES DE UTILIDAD ================= #
 def validate_environment():
@@ -48,11 +48,36 @@ async def post_init(application):
     logger.info(f"🤖 Nombre del bot: {bot.first_name}")
     logger.info(f"🤖 Username: @{bot.username}")
     logger.info(f"🤖 ID: {bot.id}")
+    
+    # Abrir conexiones con WGDashboard antes de empezar el polling
+    from wg_api import api_client
+    handshake = await api_client.warm_up()
+    if handshake.get("status"):
+        logger.info("🔌 Conexión con WGDashboard establecida")
+    else:
+        logger.warning(f"⚠️ WGDashboard no responde: {handshake.get('message')}")
+    api_client.start_keepalive()
+    
+    # Empezar a generar claves para los peers nuevos
+    from wg_keys import key_pool
+    key_pool.start()
+    
+    # Detectar qué endpoints soporta el WGDashboard conectado
+    capabilities = await api_client.discover_capabilities()
+    for capability, endpoint in capabilities.items():
+        logger.info(f"🔎 {capability}: {endpoint or 'no disponible'}")
 
 async def post_stop(application):
     """Tareas a ejecutar al detener el bot"""
     logger.info("🛑 Bot deteniéndose...")
-    # Aquí puedes agregar cleanup si es necesario
+    
+    # Cerrar el pool de conexiones con WGDashboard
+    from wg_api import api_client
+    await api_client.close()
+    
+    # Guardar los callbacks registrados que aún no se han escrito
+    from callback_registry import callback_registry
+    await callback_registry.flush()
 
 # ================= HANDLERS ================= #
 def setup_handlers(application):
@@ -61,31 +86,13 @@ def setup_handlers(application):
     # Comandos principales
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("cancel", cancel_command))
     
     # Comandos solo para administradores
-    from utils import is_admin
-    async def stats_command_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        if not is_admin(update.effective_user.id):
-            await update.message.reply_text(
-                "❌ *Acceso restringido*\n\n"
-                "Este comando solo está disponible para administradores.",
-                parse_mode="Markdown"
-            )
-            return
-        await stats_command(update, context)
-    
-    async def configs_command_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        if not is_admin(update.effective_user.id):
-            await update.message.reply_text(
-                "❌ *Acceso restringido*\n\n"
-                "Este comando solo está disponible para administradores.",
-                parse_mode="Markdown"
-            )
-            return
-        await configs_command(update, context)
-    
-    application.add_handler(CommandHandler("stats", stats_command_admin))
-    application.add_handler(CommandHandler("configs", configs_command_admin))
+    application.add_handler(CommandHandler("stats", admin_only(stats_command)))
+    application.add_handler(CommandHandler("configs", admin_only(configs_command)))
+    application.add_handler(CommandHandler("cache", admin_only(cache_command)))
+    application.add_handler(CommandHandler("find", admin_only(find_command)))
     
     # Callbacks (botones inline)
     application.add_handler(CallbackQueryHandler(callback_handler))
@@ -0,0 +1,139 @@
+"""
+Búsqueda de peers por nombre, IP o clave pública
+
+Índice de trigramas en memoria por configuración. Al llegar una versión
+nueva del snapshot solo se reindexan los peers añadidos, eliminados o
+cuyo nombre o IP cambiaron.
+"""
+
+from typing import Dict, List, Optional, Set, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from wg_api import ConfigSnapshot, Peer
+
+# Consultas más cortas que un trigrama se resuelven recorriendo los peers
+TRIGRAM = 3
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+def trigrams(text: str) -> Set[str]:
+    """Trigramas de un texto ya normalizado"""
+    return {text[i:i + TRIGRAM] for i in range(len(text) - TRIGRAM + 1)}
+
+def _searchable(peer: "Peer") -> str:
+    """Texto indexado de un peer: nombre, IPs y clave pública, una por línea"""
+    return "\n".join(normalize(field) for field in (peer.name, peer.allowed_ip or "", peer.id))
+
+def _rank(query: str, text: str) -> int:
+    """0 = nombre o IP exactos, 1 = algún campo empieza por query, 2 = contiene query"""
+    name, allowed_ip, public_key = text.split("\n")
+    addresses = [ip.strip().split("/")[0] for ip in allowed_ip.split(",")]
+    
+    if query == name or query == allowed_ip or query in addresses:
+        return 0
+    if any(field.startswith(query) for field in (name, public_key, *addresses)):
+        return 1
+    return 2
+
+class PeerIndex:
+    """
+    Índice de trigramas de los peers (normales y restringidos) de una
+    configuración, asociado a una versión de su snapshot.
+    """
+    
+    __slots__ = ("config_name", "version", "_docs", "_postings")
+    
+    def __init__(self, config_name: str):
+        self.config_name = config_name
+        self.version = 0
+        # clave pública -> (peer, texto indexado)
+        self._docs: Dict[str, Tuple["Peer", str]] = {}
+        # trigrama -> claves públicas
+        self._postings: Dict[str, Set[str]] = {}
+    
+    def __len__(self) -> int:
+        return len(self._docs)
+    
+    def _add(self, key: str, text: str):
+        for gram in trigrams(text):
+            self._postings.setdefault(gram, set()).add(key)
+    
+    def _remove(self, key: str, text: str):
+        for gram in trigrams(text):
+            keys = self._postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
+    
+    def update(self, snapshot: "ConfigSnapshot") -> int:
+        """
+        Sincroniza el índice con un snapshot.
+        
+        Devuelve el número de peers reindexados; los que no cambiaron solo
+        apuntan al Peer nuevo.
+        """
+        current: Dict[str, "Peer"] = {peer.id: peer for peer in snapshot.peers}
+        current.update((peer.id, peer) for peer in snapshot.restricted_peers)
+        
+        changed = 0
+        
+        for key in [key for key in self._docs if key not in current]:
+            self._remove(key, self._docs.pop(key)[1])
+            changed += 1
+        
+        for key, peer in current.items():
+            text = _searchable(peer)
+            previous = self._docs.get(key)
+            
+            if previous is not None and previous[1] == text:
+                self._docs[key] = (peer, text)
+                continue
+            
+            if previous is not None:
+                self._remove(key, previous[1])
+            self._add(key, text)
+            self._docs[key] = (peer, text)
+            changed += 1
+        
+        self.version = snapshot.version
+        return changed
+    
+    def search(self, query: str, limit: Optional[int] = None) -> List["Peer"]:
+        """
+        Peers cuyo nombre, IP o clave pública contienen query (sin
+        distinguir mayúsculas).
+        
+        Primero los que coinciden exactamente con el nombre o la IP, después
+        los que empiezan por query y luego el resto, por nombre.
+        """
+        query = normalize(query)
+        if not query:
+            return []
+        
+        if len(query) < TRIGRAM:
+            candidates = self._docs.keys()
+        else:
+            # Intersección empezando por el trigrama menos frecuente
+            postings = sorted(
+                (self._postings.get(gram, ()) for gram in trigrams(query)),
+                key=len
+            )
+            if not postings or not postings[0]:
+                return []
+            candidates = set(postings[0])
+            for keys in postings[1:]:
+                candidates &= keys
+                if not candidates:
+                    return []
+        
+        matches = []
+        for key in candidates:
+            peer, text = self._docs[key]
+            if query in text:
+                matches.append((_rank(query, text), peer.name.lower(), peer))
+        
+        matches.sort(key=lambda match: (match[0], match[1]))
+        peers = [peer for _, _, peer in matches]
+        return peers[:limit] if limit else peers
@@ -0,0 +1,144 @@
+"""
+Enrutado de callbacks de Telegram
+
+El callback_data tiene la forma prefijo:arg1:arg2...; el prefijo se busca
+en un diccionario (tiempo constante) y los argumentos se convierten con los
+tipos que declara la ruta antes de llamar al handler. Los callbacks
+guardados en un CallbackRegistry ("t:<token>") se resuelven antes.
+"""
+
+import inspect
+import logging
+from typing import Callable, Dict, Any, List, Optional, Tuple, TYPE_CHECKING
+
+from callback_registry import REGISTRY_PREFIX
+
+if TYPE_CHECKING:
+    from callback_registry import CallbackRegistry
+
+logger = logging.getLogger(__name__)
+
+class CallbackError(Exception):
+    """Callback que no se puede despachar"""
+    pass
+
+class UnknownCallback(CallbackError):
+    """Ningún handler registrado para el prefijo"""
+    pass
+
+class BadCallbackArgs(CallbackError):
+    """Número o tipo de argumentos incorrecto"""
+    pass
+
+class ExpiredCallback(CallbackError):
+    """Token del registro caducado, desconocido o con firma inválida"""
+    pass
+
+class CallbackForbidden(CallbackError):
+    """El rol del usuario no puede usar la ruta"""
+    pass
+
+class Route:
+    """
+    Handler registrado para un prefijo.
+    
+    arg_types convierte cada argumento (int, str, una función...); los
+    últimos optional argumentos pueden faltar y el handler usa su valor
+    por defecto.
+    """
+    
+    __slots__ = ("prefix", "handler", "arg_types", "required", "role", "wants_context")
+    
+    def __init__(self, prefix: str, handler: Callable, arg_types: Tuple[Callable, ...],
+                 role: Optional[str] = None, optional: int = 0):
+        self.prefix = prefix
+        self.handler = handler
+        self.arg_types = arg_types
+        self.required = len(arg_types) - optional
+        self.role = role
+        # Se decide una vez al registrar si el handler recibe el context
+        params = list(inspect.signature(handler).parameters)
+        self.wants_context = len(params) > 1 and params[1] == "context"
+    
+    def parse(self, args: List[str]) -> List[Any]:
+        """Convierte los argumentos o lanza BadCallbackArgs"""
+        if not self.required <= len(args) <= len(self.arg_types):
+            raise BadCallbackArgs(
+                f"{self.prefix}: se esperaban {self.required}-{len(self.arg_types)} argumentos, llegaron {len(args)}"
+            )
+        
+        try:
+            return [convert(arg) for convert, arg in zip(self.arg_types, args)]
+        except (ValueError, TypeError) as e:
+            raise BadCallbackArgs(f"{self.prefix}: argumento inválido ({e})") from e
+
+class CallbackRouter:
+    """Tabla prefijo -> Route"""
+    
+    def __init__(self, registry: Optional["CallbackRegistry"] = None):
+        self._routes: Dict[str, Route] = {}
+        self.registry = registry
+    
+    def add(self, prefix: str, handler: Callable, *arg_types: Callable,
+            role: Optional[str] = None, optional: int = 0) -> Route:
+        """
+        Registra un handler.
+        
+        Se llama como handler(query, [context], *args); role limita la ruta
+        a un rol concreto (None = cualquier usuario permitido).
+        """
+        if ":" in prefix:
+            raise ValueError(f"Prefijo inválido: {prefix}")
+        if prefix in self._routes:
+            raise ValueError(f"Ruta duplicada: {prefix}")
+        
+        route = Route(prefix, handler, arg_types, role, optional)
+        self._routes[prefix] = route
+        return route
+    
+    def route(self, prefix: str, *arg_types: Callable, role: Optional[str] = None, optional: int = 0):
+        """Decorador equivalente a add()"""
+        def decorator(handler: Callable) -> Callable:
+            self.add(prefix, handler, *arg_types, role=role, optional=optional)
+            return handler
+        return decorator
+    
+    def resolve(self, data: str) -> Tuple[Route, List[Any]]:
+        """Route y argumentos ya convertidos para un callback_data"""
+        prefix, sep, rest = data.partition(":")
+        
+        if self.registry is not None and prefix == REGISTRY_PREFIX:
+            payload = self.registry.resolve(rest)
+            if payload is None:
+                raise ExpiredCallback(data)
+            prefix, args = payload
+        else:
+            args = rest.split(":") if sep else []
+        
+        route = self._routes.get(prefix)
+        if route is None:
+            raise UnknownCallback(data)
+        return route, route.parse(args)
+    
+    async def dispatch(self, query, context, data: str, role: Optional[str] = None):
+        """
+        Resuelve el callback, comprueba el rol y llama al handler.
+        
+        Lanza UnknownCallback, BadCallbackArgs, ExpiredCallback o
+        CallbackForbidden sin llamar a nada; las excepciones del handler se
+        propagan.
+        """
+        route, args = self.resolve(data)
+        
+        if route.role is not None and route.role != role:
+            raise CallbackForbidden(route.prefix)
+        
+        if route.wants_context:
+            return await route.handler(query, context, *args)
+        return await route.handler(query, *args)
+    
+    def __contains__(self, prefix: str) -> bool:
+        return prefix in self._routes
+    
+    def __len__(self) -> int:
+        return len(self._routes)
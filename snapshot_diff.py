@@ -0,0 +1,99 @@
+"""
+Comparación de snapshots consecutivos de una configuración
+"""
+
+from typing import Dict, List, Any, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from wg_api import ConfigSnapshot, Peer
+
+def is_online(peer: "Peer") -> bool:
+    """Mismo criterio que ConfigSnapshot.connected"""
+    return peer.get('status') == 'running' and peer.get('latest_handshake_seconds', 0) > 0
+
+class SnapshotDiff:
+    """
+    Cambios entre dos versiones de un ConfigSnapshot, por clave pública.
+    
+    Cada lista contiene los Peer de la versión nueva (o de la anterior en
+    removed). Un peer puede aparecer en varios (p. ej. came_online y
+    traffic_changed).
+    """
+    
+    __slots__ = (
+        "config_name", "from_version", "to_version",
+        "added", "removed", "traffic_changed",
+        "came_online", "went_offline", "restricted", "unrestricted"
+    )
+    
+    def __init__(self, config_name: str, from_version: int, to_version: int):
+        self.config_name = config_name
+        self.from_version = from_version
+        self.to_version = to_version
+        self.added: List["Peer"] = []
+        self.removed: List["Peer"] = []
+        self.traffic_changed: List["Peer"] = []
+        self.came_online: List["Peer"] = []
+        self.went_offline: List["Peer"] = []
+        self.restricted: List["Peer"] = []
+        self.unrestricted: List["Peer"] = []
+    
+    @property
+    def is_empty(self) -> bool:
+        return not any((
+            self.added, self.removed, self.traffic_changed,
+            self.came_online, self.went_offline, self.restricted, self.unrestricted
+        ))
+    
+    def counts(self) -> Dict[str, int]:
+        """Número de peers por tipo de cambio"""
+        return {
+            "added": len(self.added),
+            "removed": len(self.removed),
+            "traffic_changed": len(self.traffic_changed),
+            "came_online": len(self.came_online),
+            "went_offline": len(self.went_offline),
+            "restricted": len(self.restricted),
+            "unrestricted": len(self.unrestricted)
+        }
+
+def _index(snapshot: "ConfigSnapshot") -> Dict[str, Any]:
+    """clave pública -> (peer, restringido); un peer en ambas listas cuenta como restringido"""
+    index: Dict[str, Any] = {peer.id: (peer, False) for peer in snapshot.peers}
+    index.update((peer.id, (peer, True)) for peer in snapshot.restricted_peers)
+    return index
+
+def diff_snapshots(old: "ConfigSnapshot", new: "ConfigSnapshot") -> SnapshotDiff:
+    """
+    Compara dos snapshots de la misma configuración en una sola pasada.
+    
+    Un peer que pasa de la lista normal a la de restringidos (o al revés)
+    se reporta como restricted/unrestricted, no como eliminado y añadido.
+    """
+    diff = SnapshotDiff(new.config_name, old.version, new.version)
+    
+    previous = _index(old)
+    
+    for key, (peer, now_restricted) in _index(new).items():
+        entry = previous.pop(key, None)
+        
+        if entry is None:
+            diff.added.append(peer)
+            continue
+        
+        before, was_restricted = entry
+        
+        if now_restricted != was_restricted:
+            (diff.restricted if now_restricted else diff.unrestricted).append(peer)
+        
+        online = is_online(peer)
+        if online != is_online(before):
+            (diff.came_online if online else diff.went_offline).append(peer)
+        
+        if peer.total_receive != before.total_receive or peer.total_sent != before.total_sent:
+            diff.traffic_changed.append(peer)
+    
+    # Lo que queda en previous ya no existe
+    diff.removed.extend(peer for peer, _ in previous.values())
+    
+    return diff
@@ -0,0 +1,212 @@
+"""
+Almacén compartido de snapshots de configuración
+
+Cada ConfigSnapshot se guarda una sola vez para todo el proceso, por
+(configuración, versión). Los handlers guardan en context.user_data solo una
+SnapshotRef y resuelven la lista de peers cuando la necesitan; así la memoria
+no crece con el número de administradores.
+"""
+
+import base64
+import hashlib
+from collections import OrderedDict
+from typing import Callable, Dict, Any, NamedTuple, Optional, Sequence, Tuple, TypeVar, TYPE_CHECKING
+
+from config import API_SNAPSHOT_RETENTION
+from peer_search import PeerIndex
+
+if TYPE_CHECKING:
+    from wg_api import ConfigSnapshot, Peer
+
+T = TypeVar("T")
+
+class SnapshotRef(NamedTuple):
+    """Referencia a una vista de un snapshot concreto"""
+    config_name: str
+    version: int
+    view: str
+
+def peer_token(public_key: str) -> str:
+    """
+    Identificador corto y estable de un peer para callback_data.
+    
+    Se deriva de la clave pública (8 caracteres base64 url-safe, sin ':'),
+    así que no cambia aunque la lista de peers se reordene.
+    """
+    digest = hashlib.blake2b(public_key.encode(), digest_size=6).digest()
+    return base64.urlsafe_b64encode(digest).decode("ascii")
+
+def _unrestricted(snapshot: "ConfigSnapshot") -> Tuple["Peer", ...]:
+    return tuple(peer for peer in snapshot.peers if peer.id not in snapshot.restricted_keys)
+
+def _by_name(snapshot: "ConfigSnapshot") -> Tuple["Peer", ...]:
+    return tuple(sorted(snapshot.peers, key=lambda peer: (peer.name.lower(), peer.id)))
+
+# Vistas disponibles: se calculan una vez por snapshot y se comparten
+VIEWS: Dict[str, Callable[["ConfigSnapshot"], Sequence["Peer"]]] = {
+    "peers": lambda snapshot: snapshot.peers,
+    "restricted": lambda snapshot: snapshot.restricted_peers,
+    "unrestricted": _unrestricted,
+    "by_name": _by_name
+}
+
+class SnapshotStore:
+    """
+    Últimas versiones de cada configuración y sus vistas derivadas.
+    
+    Se conservan las retention versiones más recientes por configuración;
+    las referencias a versiones más antiguas dejan de resolverse y su
+    memoria se libera.
+    """
+    
+    def __init__(self, retention: int = 3):
+        self.retention = max(1, retention)
+        # config -> OrderedDict(versión -> snapshot), de la más antigua a la más nueva
+        self._snapshots: Dict[str, "OrderedDict[int, ConfigSnapshot]"] = {}
+        # (config, versión, vista) -> peers
+        self._views: Dict[SnapshotRef, Sequence["Peer"]] = {}
+        # (config, versión) -> {token: peer}
+        self._token_indexes: Dict[Tuple[str, int], Dict[str, "Peer"]] = {}
+        # config -> (versión, {(pantalla, vista, página): contenido}), solo de la versión más reciente
+        self._pages: Dict[str, Tuple[int, Dict[Tuple[str, str, int], Any]]] = {}
+        # config -> índice de búsqueda, creado con la primera búsqueda
+        self._search_indexes: Dict[str, PeerIndex] = {}
+    
+    def add(self, snapshot: "ConfigSnapshot"):
+        """Registra un snapshot nuevo y descarta las versiones que sobran"""
+        versions = self._snapshots.setdefault(snapshot.config_name, OrderedDict())
+        versions[snapshot.version] = snapshot
+        # Las páginas renderizadas corresponden a la versión anterior
+        self._pages.pop(snapshot.config_name, None)
+        # El índice de búsqueda se actualiza solo con los peers que cambiaron
+        index = self._search_indexes.get(snapshot.config_name)
+        if index is not None:
+            index.update(snapshot)
+        
+        while len(versions) > self.retention:
+            old_version, _ = versions.popitem(last=False)
+            self._token_indexes.pop((snapshot.config_name, old_version), None)
+            for view in VIEWS:
+                self._views.pop(SnapshotRef(snapshot.config_name, old_version, view), None)
+    
+    def refresh(self, snapshot: "ConfigSnapshot"):
+        """
+        Sustituye la versión más reciente por una descarga con el mismo
+        contenido.
+        
+        Se conserva la versión (las referencias siguen resolviéndose), pero
+        los peers nuevos traen la antigüedad del handshake al día: las
+        vistas y páginas de la descarga anterior se descartan.
+        """
+        versions = self._snapshots.get(snapshot.config_name)
+        if not versions or snapshot.version not in versions:
+            self.add(snapshot)
+            return
+        
+        versions[snapshot.version] = snapshot
+        self._pages.pop(snapshot.config_name, None)
+        self._token_indexes.pop((snapshot.config_name, snapshot.version), None)
+        for view in VIEWS:
+            self._views.pop(SnapshotRef(snapshot.config_name, snapshot.version, view), None)
+        
+        index = self._search_indexes.get(snapshot.config_name)
+        if index is not None:
+            index.update(snapshot)
+    
+    def get(self, config_name: str, version: int) -> Optional["ConfigSnapshot"]:
+        versions = self._snapshots.get(config_name)
+        return versions.get(version) if versions else None
+    
+    def latest(self, config_name: str) -> Optional["ConfigSnapshot"]:
+        """Versión más reciente de una configuración"""
+        versions = self._snapshots.get(config_name)
+        if not versions:
+            return None
+        return next(reversed(versions.values()))
+    
+    def resolve(self, ref: Optional[SnapshotRef]) -> Optional[Sequence["Peer"]]:
+        """
+        Peers de la vista referenciada, o None si la versión ya se descartó
+        (el handler debe volver a pedir la lista).
+        """
+        if not isinstance(ref, SnapshotRef) or ref.view not in VIEWS:
+            return None
+        
+        peers = self._views.get(ref)
+        if peers is None:
+            snapshot = self.get(ref.config_name, ref.version)
+            if snapshot is None:
+                return None
+            peers = self._views[ref] = VIEWS[ref.view](snapshot)
+        return peers
+    
+    def rendered_page(self, ref: SnapshotRef, screen: str, page: int,
+                      render: Callable[[Sequence["Peer"], int], T],
+                      valid: Optional[Callable[[T], bool]] = None) -> Optional[T]:
+        """
+        Página ya renderizada (texto, teclado...) de una vista.
+        
+        render(peers, page) se llama la primera vez; las siguientes se
+        reutiliza el resultado hasta que llega una versión nueva de la
+        configuración, o hasta que valid(resultado) devuelve False. Las
+        versiones antiguas se renderizan sin guardar. None si la versión
+        ya se descartó.
+        """
+        peers = self.resolve(ref)
+        if peers is None:
+            return None
+        
+        latest = self.latest(ref.config_name)
+        if latest is None or latest.version != ref.version:
+            return render(peers, page)
+        
+        version, pages = self._pages.get(ref.config_name, (None, None))
+        if version != ref.version:
+            pages = {}
+            self._pages[ref.config_name] = (ref.version, pages)
+        
+        key = (screen, ref.view, page)
+        if key not in pages or (valid is not None and not valid(pages[key])):
+            pages[key] = render(peers, page)
+        return pages[key]
+    
+    def search_index(self, snapshot: "ConfigSnapshot") -> PeerIndex:
+        """Índice de búsqueda de la configuración, al día con snapshot"""
+        index = self._search_indexes.get(snapshot.config_name)
+        if index is None:
+            index = self._search_indexes[snapshot.config_name] = PeerIndex(snapshot.config_name)
+        if index.version != snapshot.version:
+            index.update(snapshot)
+        return index
+    
+    def find_peer(self, snapshot: "ConfigSnapshot", token: str) -> Optional["Peer"]:
+        """
+        Peer (normal o restringido) con ese token en el snapshot.
+        
+        El índice token -> peer se construye una vez por versión.
+        """
+        key = (snapshot.config_name, snapshot.version)
+        index = self._token_indexes.get(key)
+        
+        if index is None:
+            index = {peer_token(peer.id): peer for peer in snapshot.peers}
+            index.update((peer_token(peer.id), peer) for peer in snapshot.restricted_peers)
+            # Solo se guarda el índice de versiones retenidas
+            if self.get(*key) is snapshot:
+                self._token_indexes[key] = index
+        
+        return index.get(token)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Versiones y vistas en memoria, para diagnóstico"""
+        return {
+            "configs": len(self._snapshots),
+            "snapshots": sum(len(versions) for versions in self._snapshots.values()),
+            "views": len(self._views),
+            "pages": sum(len(pages) for _, pages in self._pages.values()),
+            "indexed_peers": sum(len(index) for index in self._search_indexes.values()),
+            "retention": self.retention
+        }
+
+# Instancia global del almacén
+snapshot_store = SnapshotStore(API_SNAPSHOT_RETENTION)
@@ -0,0 +1,10 @@
+"""
+Configuración común de los tests
+
+Los módulos del bot están en la raíz del repositorio.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
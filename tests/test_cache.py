@@ -0,0 +1,99 @@
+"""
+Tests de la cache LRU con TTL
+"""
+
+from cache import FRESH, STALE, TTLCache, get_all_stats
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+def make_cache(**kwargs):
+    clock = FakeClock()
+    return TTLCache("test", clock=clock, **kwargs), clock
+
+def test_fresh_then_expired():
+    cache, clock = make_cache(ttl=10)
+    cache.set("a", 1)
+    
+    assert cache.lookup("a") == (1, FRESH, 0.0)
+    clock.now += 10
+    assert cache.lookup("a") == (None, None, 0.0)
+    assert "a" not in cache
+    assert cache.stats()["expirations"] == 1
+
+def test_per_key_ttl():
+    cache, clock = make_cache(ttl=10)
+    cache.set("a", 1, ttl=60)
+    
+    clock.now += 30
+    assert cache.get("a") == 1
+
+def test_stale_entries():
+    cache, clock = make_cache(ttl=10, max_staleness=60)
+    cache.set("a", 1)
+    
+    clock.now += 20
+    # Sin allow_stale una entrada vencida cuenta como fallo, pero se conserva
+    assert cache.lookup("a") == (None, None, 0.0)
+    assert cache.lookup("a", allow_stale=True) == (1, STALE, 20.0)
+    assert cache.get("a") is None
+    assert cache.peek("a") == 1
+    
+    clock.now += 40
+    assert cache.lookup("a", allow_stale=True) == (None, None, 0.0)
+    assert len(cache) == 0
+
+def test_lru_eviction():
+    cache, _ = make_cache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # Consultar a la deja como la más reciente
+    cache.get("a")
+    cache.set("c", 3)
+    
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+def test_delete_and_invalidate_prefix():
+    cache, _ = make_cache()
+    for key in ("config:wg0:snapshot", "config:wg0:peers", "config:wg1:snapshot", "configurations"):
+        cache.set(key, key)
+    
+    assert cache.delete("configurations") is True
+    assert cache.delete("configurations") is False
+    assert cache.invalidate_prefix("config:wg0:") == 2
+    assert len(cache) == 1
+    
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.stats()["invalidations"] == 4
+
+def test_metrics():
+    cache, clock = make_cache(ttl=10, max_staleness=60)
+    cache.set("a", 1)
+    
+    cache.get("a")
+    cache.get("b")
+    clock.now += 20
+    cache.lookup("a", allow_stale=True)
+    
+    stats = cache.stats()
+    assert (stats["hits"], stats["stale_hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["hit_ratio"] == 2 / 3
+    assert stats in get_all_stats()
+
+def test_format_cache_stats_escapes_names():
+    from utils import format_cache_stats
+    
+    cache, _ = make_cache()
+    stats = cache.stats()
+    stats["name"] = "api_last<known>"
+    
+    message = format_cache_stats([stats])
+    assert "<b>api_last&lt;known&gt;</b>" in message
+    assert "**" not in message
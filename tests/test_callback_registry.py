@@ -0,0 +1,166 @@
+"""
+Tests del registro de callbacks largos
+"""
+
+import asyncio
+import json
+
+from callback_registry import CALLBACK_DATA_LIMIT, CallbackRegistry
+
+def test_short_callbacks_are_not_registered():
+    registry = CallbackRegistry(None)
+    
+    assert registry.pack("peer", "wg0", 3) == "peer:wg0:3"
+    assert registry.stats()["entries"] == 0
+
+def test_long_callbacks_are_registered():
+    registry = CallbackRegistry(None)
+    key = "x" * 50
+    
+    data = registry.pack("peer_detail", "wg0", key)
+    assert data.startswith("t:")
+    assert len(data.encode()) <= CALLBACK_DATA_LIMIT
+    assert registry.resolve(data[2:]) == ("peer_detail", ["wg0", key])
+    # El mismo botón reutiliza la entrada
+    assert registry.pack("peer_detail", "wg0", key) == data
+    assert registry.stats()["entries"] == 1
+
+def test_arguments_with_colons_are_registered():
+    registry = CallbackRegistry(None)
+    
+    data = registry.pack("job", "wg0", "10:30")
+    assert data.startswith("t:")
+    assert registry.resolve(data[2:]) == ("job", ["wg0", "10:30"])
+
+def test_long_arguments_with_colons_keep_their_boundaries():
+    registry = CallbackRegistry(None)
+    
+    data = registry.pack("peer_detail", "wg:0", "y" * 60)
+    assert registry.resolve(data[2:]) == ("peer_detail", ["wg:0", "y" * 60])
+
+def test_unknown_token():
+    registry = CallbackRegistry(None)
+    
+    assert registry.resolve("AAAAAAAA") is None
+    assert registry.touch("AAAAAAAA") is False
+
+def test_signed_tokens():
+    registry = CallbackRegistry(None, secret="secreto")
+    
+    token = registry.pack("job", "a:b")[2:]
+    assert registry.resolve(token) == ("job", ["a:b"])
+    
+    tampered = token[:8] + ("A" if token[8] != "A" else "B") + token[9:]
+    assert registry.resolve(tampered) is None
+    assert registry.touch(tampered) is False
+    # Otro secreto no acepta el token
+    other = CallbackRegistry(None, secret="otro")
+    other._entries.update(registry._entries)
+    assert other.resolve(token) is None
+
+def test_expired_entries():
+    registry = CallbackRegistry(None, ttl=-1)
+    
+    token = registry.pack("job", "a:b")[2:]
+    assert registry.touch(token) is False
+    assert registry.resolve(token) is None
+    assert registry.stats()["entries"] == 0
+
+def test_touch_renews_expiry():
+    registry = CallbackRegistry(None)
+    
+    token = registry.pack("job", "a:b")[2:]
+    expires = registry._entries[token][0]
+    registry.ttl = 1000000
+    
+    assert registry.touch(token) is True
+    assert registry._entries[token][0] > expires
+
+def test_least_recently_used_entries_are_evicted():
+    registry = CallbackRegistry(None, max_entries=2)
+    
+    first = registry.pack("job", "1:1")[2:]
+    second = registry.pack("job", "2:2")[2:]
+    # Usar la primera la deja como la más reciente
+    assert registry.resolve(first) is not None
+    third = registry.pack("job", "3:3")[2:]
+    
+    assert registry.resolve(second) is None
+    assert registry.resolve(first) == ("job", ["1:1"])
+    assert registry.resolve(third) == ("job", ["3:3"])
+    
+    assert registry.touch(first) is True
+    registry.pack("job", "4:4")
+    assert registry.resolve(third) is None
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / "data" / "callbacks.json")
+    registry = CallbackRegistry(path)
+    token = registry.pack("job", "a:b")[2:]
+    
+    registry.save()
+    loaded = CallbackRegistry(path)
+    assert loaded.resolve(token) == ("job", ["a:b"])
+
+def test_load_skips_expired_entries(tmp_path):
+    path = tmp_path / "callbacks.json"
+    path.write_text(json.dumps({"entries": {
+        "AAAAAAAA": [0, "job", ["old"]],
+        "BBBBBBBB": [9999999999, "job", ["new"]]
+    }}))
+    
+    registry = CallbackRegistry(str(path))
+    assert registry.resolve("AAAAAAAA") is None
+    assert registry.resolve("BBBBBBBB") == ("job", ["new"])
+
+def test_save_only_when_dirty(tmp_path):
+    path = tmp_path / "callbacks.json"
+    registry = CallbackRegistry(str(path))
+    
+    registry.save()
+    assert not path.exists()
+    
+    registry.pack("job", "a:b")
+    registry.save()
+    assert path.exists()
+
+def test_save_later_batches_writes(tmp_path):
+    path = tmp_path / "callbacks.json"
+    
+    async def run():
+        registry = CallbackRegistry(str(path), save_delay=0.01)
+        registry.pack("job", "a:b")
+        registry.save_later()
+        registry.pack("job", "c:d")
+        registry.save_later()
+        # Sigue programada la primera escritura
+        assert not path.exists()
+        await registry._save_task
+        return registry
+    
+    registry = asyncio.run(run())
+    assert len(json.loads(path.read_text())["entries"]) == 2
+    assert not registry._dirty
+
+def test_flush_cancels_pending_write(tmp_path):
+    path = tmp_path / "callbacks.json"
+    
+    async def run():
+        registry = CallbackRegistry(str(path), save_delay=60)
+        registry.pack("job", "a:b")
+        registry.save_later()
+        await registry.flush()
+        return registry
+    
+    registry = asyncio.run(run())
+    assert registry._save_task.cancelled()
+    assert len(json.loads(path.read_text())["entries"]) == 1
+
+def test_back_button_packs_arguments_separately():
+    from callback_registry import callback_registry
+    from keyboards import back_button
+    
+    button = back_button(("cfg", "wg:0")).inline_keyboard[0][0]
+    assert button.callback_data.startswith("t:")
+    assert callback_registry.resolve(button.callback_data[2:]) == ("cfg", ["wg:0"])
+    assert back_button(("cfg", "wg0")).inline_keyboard[0][0].callback_data == "cfg:wg0"
@@ -0,0 +1,72 @@
+"""
+Tests del circuit breaker
+"""
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+def make_breaker(threshold=3, reset_timeout=30):
+    clock = FakeClock()
+    return CircuitBreaker("/test", threshold, reset_timeout, clock=clock), clock
+
+def test_opens_after_consecutive_failures():
+    breaker, _ = make_breaker()
+    
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+    assert breaker.retry_after == 30
+
+def test_success_resets_failures():
+    breaker, _ = make_breaker()
+    
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+def test_half_open_allows_one_probe():
+    breaker, clock = make_breaker()
+    for _ in range(3):
+        breaker.record_failure()
+    
+    clock.now += 30
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow_request()
+
+def test_failed_probe_reopens():
+    breaker, clock = make_breaker()
+    for _ in range(3):
+        breaker.record_failure()
+    
+    clock.now += 30
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.retry_after == 30
+
+def test_abandoned_probe_is_retried():
+    breaker, clock = make_breaker()
+    for _ in range(3):
+        breaker.record_failure()
+    
+    clock.now += 30
+    assert breaker.allow_request()
+    # La prueba nunca informa del resultado (p. ej. se canceló)
+    clock.now += 30
+    assert breaker.allow_request()
@@ -0,0 +1,32 @@
+"""
+Tests de la conversión de latest_handshake a segundos
+"""
+
+import pytest
+
+from handshake import cache_info, parse_handshake_seconds
+
+@pytest.mark.parametrize("value, seconds", [
+    ("0:01:12", 72),
+    ("1:00:00", 3600),
+    ("12:34:56", 45296),
+    ("1 day, 0:00:05", 86405),
+    ("2 days, 3:04:05", 2 * 86400 + 3 * 3600 + 4 * 60 + 5),
+    ("0:00:07.123456", 7),
+    ("05:09", 309),
+    ("  0:01:12  ", 72)
+])
+def test_formats(value, seconds):
+    assert parse_handshake_seconds(value) == seconds
+
+@pytest.mark.parametrize("value", ["", None, "No Handshake", "no handshake", "nunca", "1:xx:00", "a:bc:de"])
+def test_without_handshake(value):
+    assert parse_handshake_seconds(value) == 0
+
+def test_repeated_values_are_memoized():
+    before = cache_info()
+    parse_handshake_seconds("3 days, 1:02:03")
+    parse_handshake_seconds("3 days, 1:02:03")
+    after = cache_info()
+    
+    assert after.hits >= before.hits + 1
@@ -0,0 +1,139 @@
+"""
+Tests del asignador de direcciones IP
+"""
+
+import pytest
+
+from ip_allocator import AddressRange, IpAllocator, parse_addresses
+from wg_api import ConfigSnapshot, Peer
+
+def make_snapshot(version, address, peers, restricted=(), config_name="wg0"):
+    """Snapshot con peers dados como (clave pública, allowed_ip)"""
+    return ConfigSnapshot(config_name, version, {
+        "configurationInfo": {"Address": address},
+        "configurationPeers": [Peer(id=key, name=key, allowed_ip=ip) for key, ip in peers],
+        "configurationRestrictedPeers": [Peer(id=key, name=key, allowed_ip=ip) for key, ip in restricted]
+    })
+
+def test_parse_addresses():
+    assert parse_addresses("10.0.0.2/32, fd00::2/128") == [
+        AddressRange(4, 0x0A000002, 0x0A000002),
+        AddressRange(6, 0xFD00 << 112 | 2, 0xFD00 << 112 | 2)
+    ]
+    assert parse_addresses("10.0.1.7/24") == [AddressRange(4, 0x0A000100, 0x0A0001FF)]
+    # Sin prefijo se toma como una sola dirección
+    assert parse_addresses("10.0.0.9") == [AddressRange(4, 0x0A000009, 0x0A000009)]
+
+def test_parse_addresses_ignores_invalid():
+    assert parse_addresses(None) == []
+    assert parse_addresses("") == []
+    assert parse_addresses("nope, 10.0.0.300/32, 10.0.0.2/33, 10.0.0.3/32") == [
+        AddressRange(4, 0x0A000003, 0x0A000003)
+    ]
+
+def test_address_range_str():
+    assert str(AddressRange.host(4, 0x0A000005)) == "10.0.0.5/32"
+    # Un entero pequeño sigue siendo IPv6
+    assert str(AddressRange.host(6, 5)) == "::5/128"
+
+def test_allocate_skips_used_addresses():
+    allocator = IpAllocator()
+    snapshot = make_snapshot(1, "10.0.0.1/24", [("a", "10.0.0.2/32"), ("b", "10.0.0.3/32")], [("c", "10.0.0.5/32")])
+    
+    assert allocator.allocate(snapshot) == "10.0.0.4/32"
+    # La anterior queda reservada
+    assert allocator.allocate(snapshot) == "10.0.0.6/32"
+    assert allocator.stats()["reservations"] == 2
+
+def test_allocate_skips_server_address():
+    allocator = IpAllocator()
+    snapshot = make_snapshot(1, "10.0.0.2/24", [])
+    
+    assert allocator.allocate(snapshot) == "10.0.0.3/32"
+
+def test_sync_follows_new_snapshots():
+    allocator = IpAllocator()
+    allocator.allocate(make_snapshot(1, "10.0.0.1/29", [("a", "10.0.0.2/32"), ("b", "10.0.0.3/32")]))
+    config = allocator._configs["wg0"]
+    
+    # Se elimina a, b cambia de IP y la reserva .4 pasa a ser del peer c
+    snapshot = make_snapshot(2, "10.0.0.1/29", [("b", "10.0.0.5/32"), ("c", "10.0.0.4/32")])
+    assert config.sync(snapshot) == 3
+    assert config.reserved == 0
+    assert config.version == 2
+    
+    assert allocator.allocate(snapshot) == "10.0.0.2/32"
+    assert allocator.allocate(snapshot) == "10.0.0.3/32"
+    assert allocator.allocate(snapshot) == "10.0.0.6/32"
+    # El broadcast nunca se asigna
+    assert allocator.allocate(snapshot) is None
+    
+    # Sin cambios no se toca nada
+    assert config.sync(make_snapshot(3, "10.0.0.1/29", [("b", "10.0.0.5/32"), ("c", "10.0.0.4/32")])) == 0
+
+def test_full_prefix_returns_none():
+    allocator = IpAllocator()
+    snapshot = make_snapshot(1, "10.0.0.1/30", [])
+    
+    assert allocator.allocate(snapshot) == "10.0.0.2/32"
+    assert allocator.allocate(snapshot) is None
+    assert allocator.stats()["free"] == {"wg0": 0}
+
+def test_reservation_expires():
+    allocator = IpAllocator(reservation_ttl=-1)
+    snapshot = make_snapshot(1, "10.0.0.1/30", [])
+    
+    assert allocator.allocate(snapshot) == "10.0.0.2/32"
+    # La reserva anterior ya caducó
+    assert allocator.allocate(snapshot) == "10.0.0.2/32"
+
+def test_release_frees_reservation():
+    allocator = IpAllocator()
+    snapshot = make_snapshot(1, "10.0.0.1/30", [])
+    
+    allowed_ips = allocator.allocate(snapshot)
+    allocator.release("wg0", allowed_ips)
+    
+    assert allocator.stats()["reservations"] == 0
+    assert allocator.allocate(snapshot) == allowed_ips
+
+def test_confirm_keeps_reservation_until_snapshot():
+    allocator = IpAllocator()
+    snapshot = make_snapshot(1, "10.0.0.1/29", [])
+    
+    allowed_ips = allocator.allocate(snapshot)
+    allocator.confirm("wg0", "new", allowed_ips)
+    # El peer creado sigue reservado hasta verlo en un snapshot
+    assert allocator.stats()["reservations"] == 1
+    assert allocator.allocate(snapshot) != allowed_ips
+    
+    config = allocator._configs["wg0"]
+    config.sync(make_snapshot(2, "10.0.0.1/29", [("new", allowed_ips)]))
+    # Solo queda la reserva de la segunda asignación
+    assert config.reserved == 1
+
+def test_remove_peers_frees_addresses():
+    allocator = IpAllocator()
+    snapshot = make_snapshot(1, "10.0.0.1/29", [("a", "10.0.0.2/32")])
+    
+    created = allocator.allocate(snapshot)
+    allocator.confirm("wg0", "created", created)
+    allocator.remove_peers("wg0", ["a", "created"])
+    
+    assert allocator.stats()["reservations"] == 0
+    assert allocator.allocate(snapshot) == "10.0.0.2/32"
+    assert allocator.allocate(snapshot) == created
+
+def test_dual_stack_address():
+    allocator = IpAllocator()
+    snapshot = make_snapshot(1, "10.8.0.1/24, fd42::1/64", [("a", "10.8.0.2/32, fd42::2/128")])
+    
+    assert allocator.allocate(snapshot) == "10.8.0.3/32, fd42::3/128"
+
+def test_invalid_address_raises():
+    allocator = IpAllocator()
+    
+    with pytest.raises(ValueError):
+        allocator.allocate(make_snapshot(1, "garbage", []))
+    with pytest.raises(ValueError):
+        allocator.allocate(make_snapshot(1, "", []))
@@ -0,0 +1,89 @@
+"""
+Tests del índice de búsqueda de peers
+"""
+
+from peer_search import PeerIndex
+from wg_api import ConfigSnapshot, Peer
+
+def make_snapshot(version, peers, restricted=()):
+    """Snapshot con peers dados como (clave pública, nombre, allowed_ip)"""
+    return ConfigSnapshot("wg0", version, {
+        "configurationPeers": [Peer(id=key, name=name, allowed_ip=ip) for key, name, ip in peers],
+        "configurationRestrictedPeers": [Peer(id=key, name=name, allowed_ip=ip) for key, name, ip in restricted]
+    })
+
+PEERS = [
+    ("KeyAlpha=", "Laptop Juan", "10.0.0.2/32"),
+    ("KeyBeta=", "juan", "10.0.0.3/32"),
+    ("KeyGamma=", "Juanito PC", "10.0.0.23/32"),
+    ("KeyDelta=", "Servidor", "10.0.0.4/32, fd00::4/128")
+]
+
+def names(peers):
+    return [peer.name for peer in peers]
+
+def make_index(peers=PEERS, restricted=()):
+    index = PeerIndex("wg0")
+    index.update(make_snapshot(1, peers, restricted))
+    return index
+
+def test_exact_then_prefix_then_substring():
+    index = make_index()
+    
+    # Exacto, luego "empieza por" y después "contiene"
+    assert names(index.search("JUAN")) == ["juan", "Juanito PC", "Laptop Juan"]
+
+def test_search_by_ip():
+    index = make_index()
+    
+    # La IP exacta va antes que las que solo empiezan igual
+    assert names(index.search("10.0.0.2")) == ["Laptop Juan", "Juanito PC"]
+    assert names(index.search("fd00::4")) == ["Servidor"]
+
+def test_search_by_public_key_is_case_insensitive():
+    index = make_index()
+    
+    assert names(index.search("keygamma")) == ["Juanito PC"]
+
+def test_short_query_scans_all_peers():
+    index = make_index()
+    
+    assert names(index.search("or")) == ["Servidor"]
+    assert names(index.search("a", limit=2)) == ["juan", "Juanito PC"]
+
+def test_no_match_and_empty_query():
+    index = make_index()
+    
+    assert index.search("impresora") == []
+    assert index.search("   ") == []
+
+def test_restricted_peers_are_indexed():
+    index = make_index(PEERS[:1], [("KeyZeta=", "Tablet", "10.0.0.9/32")])
+    
+    assert len(index) == 2
+    assert names(index.search("tablet")) == ["Tablet"]
+
+def test_update_only_reindexes_changes():
+    index = make_index()
+    
+    peers = [
+        PEERS[0],
+        ("KeyBeta=", "juan casa", "10.0.0.3/32"),
+        PEERS[3],
+        ("KeyEpsilon=", "Router", "10.0.0.5/32")
+    ]
+    # Un renombrado, un eliminado y un añadido
+    assert index.update(make_snapshot(2, peers)) == 3
+    assert index.version == 2
+    assert names(index.search("juanito")) == []
+    assert names(index.search("casa")) == ["juan casa"]
+    assert names(index.search("router")) == ["Router"]
+    
+    assert index.update(make_snapshot(3, peers)) == 0
+
+def test_update_points_to_new_peer_objects():
+    index = make_index()
+    snapshot = make_snapshot(2, PEERS)
+    
+    index.update(snapshot)
+    assert index.search("servidor")[0] is snapshot.peers[3]
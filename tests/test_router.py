@@ -0,0 +1,104 @@
+"""
+Tests del enrutado de callbacks
+"""
+
+import asyncio
+
+import pytest
+
+from callback_registry import CallbackRegistry
+from router import (
+    BadCallbackArgs, CallbackForbidden, CallbackRouter, ExpiredCallback, UnknownCallback
+)
+
+async def show_peer(query, config_name, index, page=0):
+    return ("peer", query, config_name, index, page)
+
+async def show_menu(query, context):
+    return ("menu", query, context)
+
+def make_router(registry=None):
+    router = CallbackRouter(registry)
+    router.add("peer", show_peer, str, int, int, optional=1)
+    router.add("menu", show_menu)
+    router.add("admin", show_menu, role="admin")
+    return router
+
+def test_resolve_converts_arguments():
+    router = make_router()
+    
+    route, args = router.resolve("peer:wg0:3:2")
+    assert route.handler is show_peer
+    assert args == ["wg0", 3, 2]
+
+def test_optional_arguments_can_be_missing():
+    router = make_router()
+    
+    assert router.resolve("peer:wg0:3")[1] == ["wg0", 3]
+    assert router.resolve("menu")[1] == []
+
+def test_bad_arguments():
+    router = make_router()
+    
+    with pytest.raises(BadCallbackArgs):
+        router.resolve("peer:wg0")
+    with pytest.raises(BadCallbackArgs):
+        router.resolve("peer:wg0:1:2:3")
+    with pytest.raises(BadCallbackArgs):
+        router.resolve("peer:wg0:tres")
+
+def test_unknown_prefix():
+    router = make_router()
+    
+    with pytest.raises(UnknownCallback):
+        router.resolve("nada:1")
+
+def test_invalid_and_duplicate_prefixes():
+    router = make_router()
+    
+    with pytest.raises(ValueError):
+        router.add("a:b", show_menu)
+    with pytest.raises(ValueError):
+        router.add("peer", show_peer)
+
+def test_route_decorator():
+    router = CallbackRouter()
+    
+    @router.route("page", int)
+    async def page(query, number):
+        return number
+    
+    assert "page" in router
+    assert len(router) == 1
+    assert asyncio.run(router.dispatch(None, None, "page:4")) == 4
+
+def test_registered_callbacks():
+    registry = CallbackRegistry(None)
+    router = make_router(registry)
+    
+    data = registry.pack("peer", "wg0:raro", 5)
+    assert router.resolve(data)[1] == ["wg0:raro", 5]
+    
+    with pytest.raises(ExpiredCallback):
+        router.resolve("t:AAAAAAAA")
+
+def test_registry_prefix_without_registry():
+    router = make_router()
+    
+    with pytest.raises(UnknownCallback):
+        router.resolve("t:AAAAAAAA")
+
+def test_dispatch_passes_context_only_when_wanted():
+    router = make_router()
+    
+    assert asyncio.run(router.dispatch("q", "ctx", "peer:wg0:1")) == ("peer", "q", "wg0", 1, 0)
+    assert asyncio.run(router.dispatch("q", "ctx", "menu")) == ("menu", "q", "ctx")
+
+def test_dispatch_checks_role():
+    router = make_router()
+    
+    with pytest.raises(CallbackForbidden):
+        asyncio.run(router.dispatch("q", "ctx", "admin", role="operator"))
+    assert asyncio.run(router.dispatch("q", "ctx", "admin", role="admin"))[0] == "menu"
+    # Las rutas sin rol valen para cualquiera
+    assert asyncio.run(router.dispatch("q", "ctx", "menu", role="operator"))[0] == "menu"
@@ -0,0 +1,66 @@
+"""
+Tests de la comparación de snapshots
+"""
+
+from snapshot_diff import diff_snapshots
+from wg_api import ConfigSnapshot, Peer
+
+def make_snapshot(version, peers, restricted=()):
+    return ConfigSnapshot("wg0", version, {
+        "configurationPeers": list(peers),
+        "configurationRestrictedPeers": list(restricted)
+    })
+
+def peer(key, status="stopped", handshake=0, receive=0, sent=0):
+    return Peer(id=key, name=key, status=status, latest_handshake_seconds=handshake,
+                total_receive=receive, total_sent=sent)
+
+def ids(peers):
+    return sorted(peer.id for peer in peers)
+
+def test_identical_snapshots_are_empty():
+    old = make_snapshot(1, [peer("a"), peer("b")], [peer("c")])
+    new = make_snapshot(2, [peer("a"), peer("b")], [peer("c")])
+    
+    diff = diff_snapshots(old, new)
+    assert diff.is_empty
+    assert (diff.from_version, diff.to_version) == (1, 2)
+    assert set(diff.counts().values()) == {0}
+
+def test_added_and_removed():
+    diff = diff_snapshots(make_snapshot(1, [peer("a"), peer("b")]), make_snapshot(2, [peer("b"), peer("c")]))
+    
+    assert ids(diff.added) == ["c"]
+    assert ids(diff.removed) == ["a"]
+    assert not diff.is_empty
+
+def test_restricted_and_unrestricted_are_not_added_or_removed():
+    old = make_snapshot(1, [peer("a")], [peer("b")])
+    new = make_snapshot(2, [peer("b")], [peer("a")])
+    
+    diff = diff_snapshots(old, new)
+    assert ids(diff.restricted) == ["a"]
+    assert ids(diff.unrestricted) == ["b"]
+    assert diff.added == [] and diff.removed == []
+
+def test_online_and_offline():
+    old = make_snapshot(1, [peer("a"), peer("b", "running", 10), peer("c", "running", 0)])
+    new = make_snapshot(2, [peer("a", "running", 5), peer("b", "running", 0), peer("c", "stopped", 0)])
+    
+    diff = diff_snapshots(old, new)
+    assert ids(diff.came_online) == ["a"]
+    assert ids(diff.went_offline) == ["b"]
+
+def test_traffic_changed():
+    old = make_snapshot(1, [peer("a", receive=1.5), peer("b", sent=2), peer("c", receive=3)])
+    new = make_snapshot(2, [peer("a", receive=1.6), peer("b", sent=2.1), peer("c", receive=3)])
+    
+    diff = diff_snapshots(old, new)
+    assert ids(diff.traffic_changed) == ["a", "b"]
+    assert diff.counts()["traffic_changed"] == 2
+
+def test_diff_lists_new_peer_objects():
+    new_peer = peer("a", "running", 5)
+    diff = diff_snapshots(make_snapshot(1, [peer("a")]), make_snapshot(2, [new_peer]))
+    
+    assert diff.came_online[0] is new_peer
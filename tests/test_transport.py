@@ -0,0 +1,101 @@
+"""
+Tests de la grabación y reproducción de respuestas (cassette)
+"""
+
+import asyncio
+import json
+
+import httpx
+
+from transport import REDACTED, RecordingTransport, ReplayTransport, build_transport, scrub
+
+BASE_URL = "http://dashboard.local:10086/api"
+
+def server(request):
+    """WGDashboard mínimo para grabar"""
+    if request.url.path.endswith("/getWireguardConfigurations"):
+        return httpx.Response(200, json={"status": True, "data": [{"Name": "wg0", "PrivateKey": "secreta"}]})
+    if request.url.path.endswith("/downloadPeer"):
+        return httpx.Response(200, text="[Interface]\nPrivateKey = secreta\nAddress = 10.0.0.2/32\n")
+    if request.url.path.endswith("/addPeers/wg0"):
+        return httpx.Response(200, json={"status": True, "message": "ok"})
+    return httpx.Response(404)
+
+async def record(cassette, requests):
+    transport = RecordingTransport(str(cassette), BASE_URL, httpx.MockTransport(server))
+    async with httpx.AsyncClient(transport=transport, headers={"wg-dashboard-apikey": "clave"}) as client:
+        return [await client.request(method, BASE_URL + path, **kwargs) for method, path, kwargs in requests]
+
+async def replay(cassette, requests):
+    transport = ReplayTransport(str(cassette), BASE_URL)
+    async with httpx.AsyncClient(transport=transport) as client:
+        responses = [await client.request(method, BASE_URL + path, **kwargs) for method, path, kwargs in requests]
+    return transport, responses
+
+def test_scrub():
+    assert scrub({"private_key": "x", "Name": "wg0", "peers": [{"presharedKey": "y", "id": "z"}]}) == {
+        "private_key": REDACTED, "Name": "wg0", "peers": [{"presharedKey": REDACTED, "id": "z"}]
+    }
+    # Los vacíos se dejan como están
+    assert scrub({"private_key": ""}) == {"private_key": ""}
+    assert scrub("PrivateKey = abc\nAddress = x") == f"PrivateKey = {REDACTED}\nAddress = x"
+
+def test_record_keeps_originals_and_scrubs_cassette(tmp_path):
+    cassette = tmp_path / "data" / "cassette.jsonl"
+    responses = asyncio.run(record(cassette, [
+        ("GET", "/getWireguardConfigurations", {}),
+        ("GET", "/downloadPeer?configurationName=wg0&id=a", {})
+    ]))
+    
+    # El bot recibe la respuesta real
+    assert responses[0].json()["data"][0]["PrivateKey"] == "secreta"
+    assert "secreta" in responses[1].text
+    
+    content = cassette.read_text()
+    assert "secreta" not in content and "clave" not in content
+    entries = [json.loads(line) for line in content.splitlines()]
+    assert entries[0]["path"] == "/getWireguardConfigurations"
+    assert entries[1]["query"] == "configurationName=wg0&id=a"
+
+def test_replay_serves_recorded_responses(tmp_path):
+    cassette = tmp_path / "cassette.jsonl"
+    body = {"name": "nuevo", "private_key": "otra", "allowed_ips": "10.0.0.3/32"}
+    asyncio.run(record(cassette, [
+        ("GET", "/getWireguardConfigurations", {}),
+        ("POST", "/addPeers/wg0", {"json": body})
+    ]))
+    
+    # La clave privada de la petición no tiene que coincidir con la grabada
+    transport, responses = asyncio.run(replay(cassette, [
+        ("GET", "/getWireguardConfigurations", {}),
+        ("GET", "/getWireguardConfigurations", {}),
+        ("POST", "/addPeers/wg0", {"json": {**body, "private_key": "distinta"}}),
+        ("GET", "/systemStatus", {})
+    ]))
+    
+    assert responses[0].json()["data"][0]["PrivateKey"] == REDACTED
+    # Agotadas las grabaciones se repite la última
+    assert responses[1].json() == responses[0].json()
+    assert responses[2].json() == {"status": True, "message": "ok"}
+    assert responses[3].status_code == 404
+    assert transport.misses == ["GET /systemStatus"]
+
+def test_replay_returns_responses_in_recorded_order(tmp_path):
+    cassette = tmp_path / "cassette.jsonl"
+    lines = [
+        {"method": "GET", "path": "/handshake", "status": 200, "headers": {"content-type": "application/json"}, "json": {"n": n}}
+        for n in (1, 2)
+    ]
+    cassette.write_text("\n".join(json.dumps(line) for line in lines) + "\n")
+    
+    _, responses = asyncio.run(replay(cassette, [("GET", "/handshake", {})] * 3))
+    assert [response.json()["n"] for response in responses] == [1, 2, 2]
+
+def test_build_transport(tmp_path):
+    cassette = tmp_path / "cassette.jsonl"
+    cassette.write_text("")
+    
+    assert build_transport("", str(cassette), BASE_URL) is None
+    assert build_transport("otro", str(cassette), BASE_URL) is None
+    assert isinstance(build_transport("record", str(cassette), BASE_URL), RecordingTransport)
+    assert isinstance(build_transport("REPLAY", str(cassette), BASE_URL), ReplayTransport)
@@ -0,0 +1,301 @@
+"""
+Tests de WGApiClient contra un WGDashboard simulado con httpx.MockTransport
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+import wg_api
+from snapshot_store import SnapshotStore
+from wg_api import WGApiClient
+
+def peer_data(key, handshake="No Handshake", status="stopped", receive=0):
+    return {
+        "id": key,
+        "name": key,
+        "allowed_ip": "10.0.0.2/32",
+        "status": status,
+        "latest_handshake": handshake,
+        "total_receive": receive,
+        "total_sent": 0
+    }
+
+def config_response(peers):
+    return httpx.Response(200, json={
+        "status": True,
+        "message": None,
+        "data": {
+            "configurationInfo": {"Name": "wg0", "Address": "10.0.0.1/24"},
+            "configurationPeers": peers,
+            "configurationRestrictedPeers": []
+        }
+    })
+
+@pytest.fixture
+def store(monkeypatch):
+    store = SnapshotStore(3)
+    monkeypatch.setattr(wg_api, "snapshot_store", store)
+    return store
+
+def make_client(handler):
+    """WGApiClient cuyas peticiones responde handler(request)"""
+    client = WGApiClient()
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+def test_unchanged_refetch_keeps_version_and_updates_handshake(store):
+    handshakes = iter(["0:01:00", "0:02:00"])
+    
+    def handler(request):
+        return config_response([peer_data("a", next(handshakes), "running")])
+    
+    async def run():
+        client = make_client(handler)
+        first = (await client.get_snapshot("wg0", use_cache=False))["data"]
+        second = (await client.get_snapshot("wg0", use_cache=False))["data"]
+        await client.close()
+        return first, second
+    
+    first, second = asyncio.run(run())
+    assert second.version == first.version
+    assert second.peers[0].latest_handshake_seconds == 120
+    assert store.latest("wg0") is second
+    assert store.stats()["snapshots"] == 1
+
+def test_changed_refetch_adds_version(store):
+    receive = iter([1, 2])
+    
+    def handler(request):
+        return config_response([peer_data("a", receive=next(receive))])
+    
+    async def run():
+        client = make_client(handler)
+        first = (await client.get_snapshot("wg0", use_cache=False))["data"]
+        second = (await client.get_snapshot("wg0", use_cache=False))["data"]
+        await client.close()
+        return client, first, second
+    
+    client, first, second = asyncio.run(run())
+    assert second.version == first.version + 1
+    assert client._last_diffs["wg0"].counts()["traffic_changed"] == 1
+
+def test_concurrent_requests_share_one_fetch(store):
+    calls = []
+    
+    async def handler(request):
+        calls.append(request.url.path)
+        await asyncio.sleep(0.01)
+        return config_response([peer_data("a")])
+    
+    async def run():
+        client = make_client(handler)
+        results = await asyncio.gather(*(client.get_snapshot("wg0") for _ in range(5)))
+        await client.close()
+        return results
+    
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(result["data"] is results[0]["data"] for result in results)
+
+def test_fetch_invalidated_in_flight_is_not_published(store):
+    responses = [[peer_data("a")], [peer_data("a"), peer_data("b")]]
+    
+    async def run():
+        gate = asyncio.Event()
+        
+        async def handler(request):
+            peers = responses.pop(0)
+            if len(peers) == 1:
+                # La primera descarga llega después de la modificación
+                await gate.wait()
+            return config_response(peers)
+        
+        client = make_client(handler)
+        task = asyncio.ensure_future(client.get_snapshot("wg0"))
+        await asyncio.sleep(0.01)
+        client.invalidate_config("wg0")
+        gate.set()
+        result = await task
+        await client.close()
+        return result
+    
+    result = asyncio.run(run())
+    assert [peer.id for peer in result["data"].peers] == ["a", "b"]
+    assert store.stats()["snapshots"] == 1
+    assert store.latest("wg0") is result["data"]
+
+def test_stale_snapshot_is_served_while_revalidating(store):
+    receive = iter([1, 2])
+    
+    def handler(request):
+        return config_response([peer_data("a", receive=next(receive))])
+    
+    async def run():
+        client = make_client(handler)
+        client._stale_while_revalidate = True
+        # Todo lo guardado vence al momento pero sigue sirviéndose
+        client._cache.ttl = 0
+        
+        first = (await client.get_snapshot("wg0"))["data"]
+        stale = (await client.get_snapshot("wg0"))["data"]
+        refresh = client._inflight["config:wg0:snapshot"]
+        await refresh
+        fresh = (await client.get_snapshot("wg0"))["data"]
+        await client.close()
+        return first, stale, fresh
+    
+    first, stale, fresh = asyncio.run(run())
+    assert stale is first
+    assert fresh.version == first.version + 1
+    assert fresh.peers[0].total_receive == 2
+
+def test_stale_snapshot_is_not_served_without_revalidation(store):
+    calls = []
+    
+    def handler(request):
+        calls.append(request)
+        return config_response([peer_data("a")])
+    
+    async def run():
+        client = make_client(handler)
+        client._stale_while_revalidate = False
+        client._cache.ttl = 0
+        
+        await client.get_snapshot("wg0")
+        await client.get_snapshot("wg0")
+        await client.close()
+    
+    asyncio.run(run())
+    assert len(calls) == 2
+
+def test_last_known_snapshot_when_server_is_down(store):
+    responses = [config_response([peer_data("a")])]
+    
+    def handler(request):
+        if responses:
+            return responses.pop(0)
+        raise httpx.ConnectError("sin conexión", request=request)
+    
+    async def run():
+        client = make_client(handler)
+        first = await client.get_snapshot("wg0")
+        client.invalidate_config("wg0")
+        fallback = await client.get_snapshot("wg0")
+        await client.close()
+        return first, fallback
+    
+    first, fallback = asyncio.run(run())
+    assert fallback["stale"] is True
+    assert fallback["data"] is first["data"]
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(wg_api, "API_RETRY_BACKOFF", 0)
+    monkeypatch.setattr(wg_api, "API_RETRY_ATTEMPTS", 2)
+
+def test_get_is_retried_after_transient_errors(store, no_backoff):
+    calls = []
+    
+    def handler(request):
+        calls.append(request)
+        if len(calls) < 3:
+            return httpx.Response(502, text="bad gateway")
+        return config_response([peer_data("a")])
+    
+    async def run():
+        client = make_client(handler)
+        result = await client.get_snapshot("wg0")
+        await client.close()
+        return client, result
+    
+    client, result = asyncio.run(run())
+    assert result["status"] is True
+    assert len(calls) == 3
+    assert client.circuit_status() == []
+
+def test_open_circuit_skips_requests_and_probes(store, no_backoff, monkeypatch):
+    calls = []
+    
+    def handler(request):
+        calls.append(request.url.path)
+        raise httpx.ConnectError("sin conexión", request=request)
+    
+    async def run():
+        client = make_client(handler)
+        for endpoint in ("/getWireguardConfigurationInfo", "/systemStatus"):
+            breaker = client._breaker(endpoint)
+            for _ in range(breaker.failure_threshold):
+                breaker.record_failure()
+        
+        result = await client.get_snapshot("wg0", use_cache=False)
+        probe = await client._probe_endpoint("/systemStatus")
+        await client.close()
+        return result, probe
+    
+    result, probe = asyncio.run(run())
+    assert result["unavailable"] is True
+    assert probe is None
+    assert calls == []
+
+def test_probe_failures_count_in_the_breaker(store):
+    calls = []
+    
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(503)
+    
+    async def run():
+        client = make_client(handler)
+        breaker = client._breaker("/systemStatus")
+        results = [await client._probe_endpoint("/systemStatus") for _ in range(breaker.failure_threshold + 2)]
+        await client.close()
+        return breaker, results
+    
+    breaker, results = asyncio.run(run())
+    assert set(results) == {None}
+    assert len(calls) == breaker.failure_threshold
+    assert breaker.state == "open"
+
+def test_probe_detects_missing_endpoints(store):
+    def handler(request):
+        return httpx.Response(404 if request.url.path.endswith("/systemStatus") else 405)
+    
+    async def run():
+        client = make_client(handler)
+        probes = (await client._probe_endpoint("/systemStatus"), await client._probe_endpoint("/status"))
+        endpoint = await client._resolve_endpoint("system_status")
+        await client.close()
+        return probes, endpoint
+    
+    probes, endpoint = asyncio.run(run())
+    assert probes == (False, True)
+    assert endpoint == "/getSystemStatus"
+
+@pytest.mark.skipif(wg_api.ijson is None, reason="ijson no instalado")
+def test_streaming_and_full_parse_agree(monkeypatch):
+    peers = [peer_data("a", "1 day, 0:00:05", "running", 1.5), peer_data("b")]
+    
+    async def parse(stream):
+        monkeypatch.setattr(wg_api, "API_STREAM_JSON", stream)
+        response = config_response(peers)
+        return await wg_api.parse_configuration_info(response)
+    
+    streamed = asyncio.run(parse(True))
+    loaded = asyncio.run(parse(False))
+    
+    assert streamed["status"] is True and loaded["status"] is True
+    assert streamed["data"]["configurationInfo"] == loaded["data"]["configurationInfo"]
+    assert [peer.to_dict() for peer in streamed["data"]["configurationPeers"]] == \
+        [peer.to_dict() for peer in loaded["data"]["configurationPeers"]]
+    assert streamed["data"]["configurationPeers"][0].latest_handshake_seconds == 86405
+
+def test_invalid_json_is_reported(monkeypatch):
+    async def parse(stream):
+        monkeypatch.setattr(wg_api, "API_STREAM_JSON", stream)
+        return await wg_api.parse_configuration_info(httpx.Response(200, content=b'{"status": tr'))
+    
+    assert asyncio.run(parse(False))["status"] is False
+    if wg_api.ijson is not None:
+        assert asyncio.run(parse(True))["status"] is False
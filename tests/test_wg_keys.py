@@ -0,0 +1,96 @@
+"""
+Tests de la generación de claves WireGuard
+"""
+
+import base64
+import time
+
+import pytest
+
+from wg_keys import KeyPool, derive_public_key, generate_keypair, generate_preshared_key
+
+def b64(hex_key):
+    return base64.b64encode(bytes.fromhex(hex_key)).decode("ascii")
+
+# Vectores de RFC 7748, sección 6.1
+RFC7748_VECTORS = [
+    (
+        "77076d0a7318a57d3c16c17251b26645df4c2f87ebc0992ab177fba51db92c2a",
+        "8520f0098930a754748b7ddcb43ef75a0dbf3a0d26381af4eba4a98eaa9b4e6a"
+    ),
+    (
+        "5dab087e624a8a4b79e17f8b83800ee66f3bb1292618b6fd1c2f8b27ff88e0eb",
+        "de9edb7d7b7dc1b4d35b61c2ece435373f8343c85b78674dadfc7e146f882b4f"
+    )
+]
+
+@pytest.mark.parametrize("private_key, public_key", RFC7748_VECTORS)
+def test_derive_public_key_rfc7748(private_key, public_key):
+    assert derive_public_key(b64(private_key)) == b64(public_key)
+
+def test_derive_public_key_base64():
+    private_key = b64(RFC7748_VECTORS[0][0])
+    assert derive_public_key(private_key) == "hSDwCYkwp1R0i33ctD73Wg2/Og0mOBr066SpjqqbTmo="
+
+def test_derive_public_key_rejects_bad_length():
+    with pytest.raises(ValueError):
+        derive_public_key(base64.b64encode(b"corta").decode())
+
+def test_generate_keypair():
+    private_key, public_key = generate_keypair()
+    raw = base64.b64decode(private_key)
+    
+    assert len(raw) == 32
+    # Clamping como wg genkey
+    assert raw[0] & 7 == 0
+    assert raw[31] & 128 == 0 and raw[31] & 64 == 64
+    assert derive_public_key(private_key) == public_key
+    assert generate_keypair()[0] != private_key
+
+def test_generate_preshared_key():
+    psk = generate_preshared_key()
+    
+    assert len(base64.b64decode(psk)) == 32
+    assert generate_preshared_key() != psk
+
+def test_empty_pool_generates_on_demand():
+    pool = KeyPool(0)
+    pool.start()
+    
+    private_key, public_key = pool.keypair()
+    assert derive_public_key(private_key) == public_key
+    assert len(base64.b64decode(pool.psk())) == 32
+    # Cuentan tanto el par como la PSK
+    assert pool.stats() == {"size": 0, "keypairs": 0, "psks": 0, "misses": 2}
+
+def test_pool_serves_pregenerated_keys():
+    pool = KeyPool(4)
+    keypairs = [generate_keypair() for _ in range(4)]
+    pool._keypairs.extend(keypairs)
+    pool._psks.extend(generate_preshared_key() for _ in range(4))
+    
+    assert pool.keypair() == keypairs[0]
+    pool.psk()
+    assert pool.stats()["misses"] == 0
+    assert pool.stats()["psks"] == 3
+    
+    pool._psks.clear()
+    pool.psk()
+    assert pool.stats()["misses"] == 1
+
+def test_pool_refills_in_background():
+    pool = KeyPool(4)
+    pool.start()
+    
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        stats = pool.stats()
+        if stats["keypairs"] == 4 and stats["psks"] == 4:
+            break
+        time.sleep(0.01)
+    assert pool.stats()["keypairs"] == 4
+    assert pool.stats()["psks"] == 4
+    
+    private_key, public_key = pool.keypair()
+    assert derive_public_key(private_key) == public_key
+    assert pool.stats()["misses"] == 0
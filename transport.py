@@ -0,0 +1,262 @@
+"""
+Transportes httpx para grabar y reproducir respuestas de WGDashboard
+
+- record: las peticiones van al servidor real y cada respuesta se guarda
+  en un fichero JSON Lines (cassette) sin API key ni claves privadas
+- replay: las respuestas se sirven desde el cassette, sin red, opcionalmente
+  con la latencia original
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict, List, Any, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Modos de API_TRANSPORT_MODE
+RECORD = "record"
+REPLAY = "replay"
+
+REDACTED = "REDACTED"
+
+# Cabeceras que nunca se guardan
+_SECRET_HEADERS = {"wg-dashboard-apikey", "authorization", "cookie", "set-cookie"}
+
+# Campos JSON con secretos (en minúsculas, sin guiones ni guiones bajos)
+_SECRET_FIELDS = {"privatekey", "presharedkey", "apikey", "password", "totpkey"}
+
+# Claves dentro de ficheros .conf incluidos como texto
+_SECRET_CONF_RE = re.compile(r"^(\s*(?:PrivateKey|PresharedKey)\s*=\s*).+$", re.IGNORECASE | re.MULTILINE)
+
+# Cabeceras de la respuesta que se conservan al grabar
+_KEPT_HEADERS = ("content-type",)
+
+# Cabeceras que dejan de ser válidas al reenviar el cuerpo ya decodificado
+_ENCODING_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+def _is_secret_field(name: str) -> bool:
+    return name.replace("_", "").replace("-", "").lower() in _SECRET_FIELDS
+
+def scrub(value: Any) -> Any:
+    """Sustituye los secretos de un valor JSON decodificado por REDACTED"""
+    if isinstance(value, dict):
+        return {
+            key: (REDACTED if _is_secret_field(key) and item else scrub(item))
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [scrub(item) for item in value]
+    if isinstance(value, str) and "=" in value:
+        return _SECRET_CONF_RE.sub(rf"\g<1>{REDACTED}", value)
+    return value
+
+def _scrub_body(content: bytes, content_type: str) -> Dict[str, Any]:
+    """Cuerpo listo para el cassette: JSON saneado, texto o base64"""
+    if not content:
+        return {"body": ""}
+    
+    if "json" in content_type:
+        try:
+            return {"json": scrub(json.loads(content))}
+        except ValueError:
+            pass
+    
+    try:
+        return {"body": scrub(content.decode("utf-8"))}
+    except UnicodeDecodeError:
+        return {"body_b64": base64.b64encode(content).decode("ascii")}
+
+def _entry_body(entry: Dict[str, Any]) -> bytes:
+    if "json" in entry:
+        return json.dumps(entry["json"]).encode()
+    if "body_b64" in entry:
+        return base64.b64decode(entry["body_b64"])
+    return entry.get("body", "").encode()
+
+def _request_key(method: str, path: str, query: str, body: bytes) -> Tuple[str, str, str, str]:
+    """
+    Clave con la que se empareja una petición en replay.
+    
+    El cuerpo se compara ya saneado para que las peticiones con claves
+    privadas coincidan con lo grabado.
+    """
+    if body:
+        try:
+            body_key = json.dumps(scrub(json.loads(body)), sort_keys=True)
+        except ValueError:
+            body_key = body.decode("utf-8", "replace")
+    else:
+        body_key = ""
+    return method.upper(), path, query, body_key
+
+def _relative_path(url: httpx.URL, base_path: str) -> str:
+    """Ruta sin el prefijo de la URL base, para que el cassette no dependa del host"""
+    path = url.path
+    if base_path and path.startswith(base_path):
+        path = path[len(base_path):] or "/"
+    return path
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Reenvía las peticiones al servidor real y guarda cada respuesta en el cassette"""
+    
+    def __init__(self, path: str, base_url: str, transport: httpx.AsyncBaseTransport):
+        self.path = path
+        self._base_path = httpx.URL(base_url).path.rstrip("/")
+        self._transport = transport
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request_body = await request.aread()
+        
+        started = time.perf_counter()
+        response = await self._transport.handle_async_request(request)
+        try:
+            # La respuesta se lee completa para poder guardarla
+            content = await response.aread()
+        finally:
+            await response.aclose()
+        elapsed = time.perf_counter() - started
+        
+        content_type = response.headers.get("content-type", "")
+        headers = {
+            name: value for name, value in response.headers.items()
+            if name.lower() in _KEPT_HEADERS and name.lower() not in _SECRET_HEADERS
+        }
+        method, path, query, body_key = _request_key(
+            request.method,
+            _relative_path(request.url, self._base_path),
+            request.url.query.decode("ascii"),
+            request_body
+        )
+        entry = {
+            "method": method,
+            "path": path,
+            "query": query,
+            "request": body_key,
+            "status": response.status_code,
+            "headers": headers,
+            "elapsed": round(elapsed, 4),
+            **_scrub_body(content, content_type)
+        }
+        
+        line = json.dumps(entry, ensure_ascii=False)
+        await asyncio.to_thread(self._append, line)
+        logger.debug(f"[TRANSPORT] Grabado {method} {path} ({response.status_code}, {elapsed:.3f}s)")
+        
+        # El contenido original (sin sanear) sigue llegando al bot; ya está
+        # descomprimido, así que no se reenvían las cabeceras de codificación
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=[
+                (name, value) for name, value in response.headers.multi_items()
+                if name.lower() not in _ENCODING_HEADERS
+            ],
+            content=content,
+            request=request,
+            extensions={"http_version": response.extensions.get("http_version", b"HTTP/1.1")}
+        )
+    
+    def _append(self, line: str):
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    
+    async def aclose(self):
+        await self._transport.aclose()
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """
+    Sirve las respuestas grabadas en el cassette, sin red.
+    
+    Las respuestas de una misma petición se devuelven en el orden en que se
+    grabaron; agotadas, se repite la última. Una petición que no está en el
+    cassette responde 404, igual que un endpoint que el servidor no tiene.
+    
+    latency_factor multiplica la latencia grabada (0 = sin espera).
+    """
+    
+    def __init__(self, path: str, base_url: str, latency_factor: float = 0.0):
+        self.path = path
+        self.latency_factor = max(0.0, latency_factor)
+        self._base_path = httpx.URL(base_url).path.rstrip("/")
+        self._entries: Dict[Tuple[str, str, str, str], deque] = defaultdict(deque)
+        self._last: Dict[Tuple[str, str, str, str], Dict[str, Any]] = {}
+        self.misses: List[str] = []
+        
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                key = (entry["method"], entry["path"], entry.get("query", ""), entry.get("request", ""))
+                self._entries[key].append(entry)
+        
+        logger.info(f"[TRANSPORT] Cassette {path}: {sum(len(q) for q in self._entries.values())} respuestas")
+    
+    def _next(self, key: Tuple[str, str, str, str]) -> Optional[Dict[str, Any]]:
+        queue = self._entries.get(key)
+        if queue:
+            self._last[key] = queue.popleft()
+        return self._last.get(key)
+    
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request_body = await request.aread()
+        key = _request_key(
+            request.method,
+            _relative_path(request.url, self._base_path),
+            request.url.query.decode("ascii"),
+            request_body
+        )
+        entry = self._next(key)
+        
+        if entry is None:
+            logger.warning(f"[TRANSPORT] Sin respuesta grabada para {key[0]} {key[1]}")
+            self.misses.append(f"{key[0]} {key[1]}")
+            return httpx.Response(
+                status_code=404,
+                json={"status": False, "message": "Not recorded", "data": None},
+                request=request
+            )
+        
+        if self.latency_factor and entry.get("elapsed"):
+            await asyncio.sleep(entry["elapsed"] * self.latency_factor)
+        
+        return httpx.Response(
+            status_code=entry["status"],
+            headers=entry.get("headers") or {},
+            content=_entry_body(entry),
+            request=request
+        )
+
+def build_transport(mode: str, path: str, base_url: str, latency_factor: float = 0.0,
+                    **transport_options) -> Optional[httpx.AsyncBaseTransport]:
+    """
+    Transporte para el modo indicado, o None para usar el de httpx.
+    
+    transport_options (limits, http2...) se pasan al transporte real
+    cuando se graba.
+    """
+    mode = (mode or "").lower()
+    
+    if mode == RECORD:
+        logger.info(f"[TRANSPORT] Grabando respuestas en {path}")
+        return RecordingTransport(path, base_url, httpx.AsyncHTTPTransport(**transport_options))
+    
+    if mode == REPLAY:
+        return ReplayTransport(path, base_url, latency_factor)
+    
+    if mode:
+        logger.warning(f"[TRANSPORT] Modo desconocido '{mode}', se usa la red")
+    return None
@@ -2,6 +2,7 @@
 Funciones de utilidad para el bot
 """
 
+import functools
 import logging
 import json
 from typing import Dict, List, Any, Optional
@@ -45,6 +46,20 @@ def is_operator(user_id: int) -> bool:
     """Verifica si el usuario es operador"""
     return get_user_role(user_id) == ROLE_OPERATOR
 
+def admin_only(handler):
+    """Decorador para comandos solo de administradores"""
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not is_admin(update.effective_user.id):
+            await update.message.reply_text(
+                "❌ *Acceso restringido*\n\n"
+                "Este comando solo está disponible para administradores.",
+                parse_mode="Markdown"
+            )
+            return
+        await handler(update, context)
+    return wrapper
+
 def can_operator_create_peer(user_id: int) -> tuple:
     """
     Verifica si un operador puede crear un peer.
@@ -131,6 +146,14 @@ def format_time_ago(seconds: int) -> str:
         days = seconds // 86400
         return f"hace {int(days)} días"
 
+def stale_notice(result: Dict) -> str:
+    """Aviso para datos servidos desde cache porque WGDashboard no responde"""
+    if not result.get("stale"):
+        return ""
+    
+    age = format_time_ago(max(1, int(result.get("stale_age", 0))))
+    return f"⚠️ Servidor no disponible. Mostrando datos guardados {age}.\n\n"
+
 def format_time_remaining(seconds: int) -> str:
     """Formatea segundos restantes en formato legible"""
     if seconds <= 0:
@@ -262,6 +285,21 @@ def format_system_status(status_data: Dict) -> str:
     
     return "\n".join(lines)
 
+def format_cache_stats(stats: List[Dict]) -> str:
+    """Formatea las métricas de las caches del bot (HTML)"""
+    if not stats:
+        return "🗄 <b>Cache</b>\n\nNo hay caches registradas."
+    
+    lines = ["🗄 <b>Cache</b>\n"]
+    for cache in stats:
+        lines.append(f"<b>{html.escape(cache['name'])}</b>: {cache['size']}/{cache['max_size']} entradas (TTL {cache['ttl']:.0f}s)")
+        lines.append(f"  ✅ Aciertos: {cache['hits']}  ⏳ Vencidos servidos: {cache['stale_hits']}")
+        lines.append(f"  ❌ Fallos: {cache['misses']}  📈 Ratio: {cache['hit_ratio'] * 100:.1f}%")
+        lines.append(f"  🗑 Expulsadas: {cache['evictions']}  ⌛ Expiradas: {cache['expirations']}  🔄 Invalidadas: {cache['invalidations']}")
+        lines.append("")
+    
+    return "\n".join(lines).rstrip()
+
 def format_config_summary(configs: List[Dict]) -> str:
     """Formatea un resumen de todas las configuraciones"""
     if not configs:
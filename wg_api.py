@@ -2,24 +2,312 @@
 Cliente para la API de WGDashboard
 """
 
+import asyncio
 import json
 import logging
+import operator
+import random
+import sys
 import uuid
-from typing import Dict, List, Optional, Any
-import requests
-from requests.exceptions import RequestException
+from typing import Dict, List, Optional, Any, Awaitable, Callable, Tuple
+import httpx
 from datetime import datetime
 import psutil
 import platform
 
-from config import WG_API_BASE_URL, WG_API_KEY, API_TIMEOUT, WG_API_PREFIX
+try:
+    import ijson
+except ImportError:  # En requirements.txt; sin ijson se decodifica la respuesta completa
+    ijson = None
+
+from config import (
+    WG_API_BASE_URL, WG_API_KEY, API_TIMEOUT, WG_API_PREFIX,
+    API_CACHE_TTL, API_CACHE_STALE_WHILE_REVALIDATE, API_CACHE_MAX_STALENESS,
+    API_CACHE_MAX_ENTRIES, API_CAPABILITY_TTL, API_BULK_CHUNK_SIZE,
+    API_RETRY_ATTEMPTS, API_RETRY_BACKOFF, API_RETRY_MAX_BACKOFF,
+    API_BREAKER_THRESHOLD, API_BREAKER_RESET_TIMEOUT, API_STALE_FALLBACK_TTL,
+    API_POOL_MAX_CONNECTIONS, API_POOL_MAX_KEEPALIVE, API_KEEPALIVE_EXPIRY,
+    API_HTTP2, API_WARMUP_CONNECTIONS, API_KEEPALIVE_PING_INTERVAL,
+    API_STREAM_JSON, API_TRANSPORT_MODE, API_CASSETTE_FILE, API_REPLAY_LATENCY
+)
+from cache import TTLCache, FRESH
+from handshake import parse_handshake_seconds
+from snapshot_diff import SnapshotDiff, diff_snapshots
+from snapshot_store import snapshot_store
+from ip_allocator import ip_allocator
+from circuit_breaker import CircuitBreaker, CLOSED
+from transport import build_transport
 
 logger = logging.getLogger(__name__)
 
+# Endpoints candidatos por capacidad, en orden de preferencia. Según la
+# versión de WGDashboard existen unos u otros
+CAPABILITY_ENDPOINTS: Dict[str, List[str]] = {
+    "system_status": ["/systemStatus", "/getSystemStatus", "/status", "/system/status"],
+    "delete_schedule_job": ["/deletePeerScheduleJob", "/savePeerScheduleJob"],
+    "protocols": ["/protocols"]
+}
+
+def _http2_available() -> bool:
+    """Comprueba si está instalado el soporte HTTP/2 de httpx (paquete h2)"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("[API] API_HTTP2 activado pero falta el paquete h2, se usará HTTP/1.1")
+        return False
+    return True
+
 class WGApiError(Exception):
     """Excepción personalizada para errores de API"""
     pass
 
+def _intern(value: Any) -> Any:
+    """Internaliza cadenas que se repiten entre peers (estado, DNS, endpoints)"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+class Peer:
+    """
+    Peer compacto con solo los campos que usa el bot.
+    
+    Sustituye al dict completo del dashboard. Mantiene la interfaz de lectura
+    de un dict (peer.get('name'), peer['id'], 'keepalive' in peer) para que
+    los handlers no cambien. Es compartido por todos los usuarios a través
+    del ConfigSnapshot: no debe modificarse.
+    """
+    
+    __slots__ = (
+        "id", "name", "allowed_ip", "status", "latest_handshake_seconds",
+        "total_receive", "total_sent", "jobs", "endpoint", "remote_endpoint",
+        "DNS", "mtu", "keepalive"
+    )
+    
+    def __init__(self, id: str = "", name: str = "", allowed_ip: Optional[str] = None,
+                 status: Optional[str] = None, latest_handshake_seconds: int = 0,
+                 total_receive: float = 0, total_sent: float = 0, jobs: tuple = (),
+                 endpoint: Optional[str] = None, remote_endpoint: Optional[str] = None,
+                 DNS: Optional[str] = None, mtu: Optional[int] = None, keepalive: Optional[int] = None):
+        self.id = id
+        self.name = name
+        self.allowed_ip = allowed_ip
+        self.status = _intern(status)
+        self.latest_handshake_seconds = latest_handshake_seconds
+        self.total_receive = total_receive
+        self.total_sent = total_sent
+        self.jobs = jobs
+        self.endpoint = _intern(endpoint)
+        self.remote_endpoint = _intern(remote_endpoint)
+        self.DNS = _intern(DNS)
+        self.mtu = mtu
+        self.keepalive = keepalive
+    
+    @classmethod
+    def from_api(cls, peer: Dict) -> "Peer":
+        """Crea un Peer a partir del dict de getWireguardConfigurationInfo"""
+        return cls(
+            id=peer.get('id') or "",
+            name=peer.get('name') or "",
+            allowed_ip=peer.get('allowed_ip'),
+            status=peer.get('status'),
+            latest_handshake_seconds=parse_handshake_seconds(peer.get('latest_handshake', '')),
+            total_receive=peer.get('total_receive') or 0,
+            total_sent=peer.get('total_sent') or 0,
+            # Tupla vacía compartida para la mayoría de peers, que no tienen jobs
+            jobs=tuple(peer.get('jobs') or ()),
+            endpoint=peer.get('endpoint'),
+            remote_endpoint=peer.get('remote_endpoint'),
+            DNS=peer.get('DNS'),
+            mtu=peer.get('mtu'),
+            keepalive=peer.get('keepalive')
+        )
+    
+    def get(self, key: str, default: Any = None) -> Any:
+        """Como dict.get; los campos sin valor devuelven default"""
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+    
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+    
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+    
+    def __iter__(self):
+        return (field for field in self.__slots__ if getattr(self, field) is not None)
+    
+    def to_dict(self) -> Dict:
+        """Dict con los campos que tienen valor"""
+        return {field: getattr(self, field) for field in self.__slots__ if getattr(self, field) is not None}
+    
+    def __repr__(self) -> str:
+        return f"Peer(name={self.name!r}, id={self.id[:12]!r}...)"
+
+# Prefijos de ijson de getWireguardConfigurationInfo -> clave en data
+_STREAM_TARGETS = {
+    "data.configurationInfo": "configurationInfo",
+    "data.configurationPeers.item": "configurationPeers",
+    "data.configurationRestrictedPeers.item": "configurationRestrictedPeers"
+}
+
+def _invalid_json_result() -> Dict:
+    return {
+        "status": False,
+        "message": "Respuesta JSON inválida del servidor",
+        "data": None
+    }
+
+def _load_configuration_info(body: bytes) -> Dict:
+    """Decodifica getWireguardConfigurationInfo completo y convierte sus peers a Peer"""
+    try:
+        result = json.loads(body)
+    except ValueError:
+        logger.error(f"[API] Respuesta no es JSON válido: {body[:200]!r}")
+        return _invalid_json_result()
+    
+    data = result.get("data")
+    if isinstance(data, dict):
+        for key in ("configurationPeers", "configurationRestrictedPeers"):
+            data[key] = [Peer.from_api(peer) for peer in data.get(key) or []]
+    
+    return result
+
+class _AsyncByteReader:
+    """Adapta un iterador asíncrono de bytes al read() asíncrono que espera ijson"""
+    
+    def __init__(self, chunks):
+        self._chunks = chunks.__aiter__()
+        self._buffer = b""
+    
+    async def read(self, size: int = -1) -> bytes:
+        # ijson llama a read(0) para saber si el fichero es de bytes o de texto
+        if size == 0:
+            return b""
+        
+        if not self._buffer:
+            try:
+                self._buffer = await self._chunks.__anext__()
+            except StopAsyncIteration:
+                return b""
+        
+        if size < 0:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+async def _stream_configuration_info(response: httpx.Response) -> Dict:
+    """
+    Decodifica getWireguardConfigurationInfo de forma incremental con ijson.
+    
+    Cada peer se construye y convierte a Peer en cuanto termina de llegar, así que
+    nunca se tiene en memoria el árbol JSON completo de la respuesta.
+    """
+    result = {
+        "status": False,
+        "message": None,
+        "data": {
+            "configurationInfo": {},
+            "configurationPeers": [],
+            "configurationRestrictedPeers": []
+        }
+    }
+    data = result["data"]
+    builder = None
+    current = None
+    
+    try:
+        events = ijson.parse_async(_AsyncByteReader(response.aiter_bytes()), use_float=True)
+        async for prefix, event, value in events:
+            if builder is None:
+                if prefix in _STREAM_TARGETS and event in ("start_map", "start_array"):
+                    builder = ijson.ObjectBuilder()
+                    current = prefix
+                    builder.event(event, value)
+                elif prefix in ("status", "message") and event in ("boolean", "string", "null"):
+                    result[prefix] = value
+                continue
+            
+            builder.event(event, value)
+            
+            if prefix == current and event in ("end_map", "end_array"):
+                target = _STREAM_TARGETS[current]
+                if target == "configurationInfo":
+                    data[target] = builder.value
+                else:
+                    data[target].append(Peer.from_api(builder.value))
+                builder = None
+    except ijson.JSONError as e:
+        logger.error(f"[API] Respuesta no es JSON válido: {str(e)}")
+        return _invalid_json_result()
+    
+    return result
+
+async def parse_configuration_info(response: httpx.Response) -> Dict:
+    """Decodifica la respuesta de getWireguardConfigurationInfo con los peers como Peer"""
+    if ijson is not None and API_STREAM_JSON:
+        return await _stream_configuration_info(response)
+    
+    body = await response.aread()
+    # json.loads de respuestas grandes bloquea: hacerlo fuera del event loop
+    return await asyncio.to_thread(_load_configuration_info, body)
+
+# Campos del Peer que cuentan como cambio de contenido. La antigüedad del
+# handshake crece en cada descarga aunque no pase nada; solo cuenta si hay
+# o no handshake
+_digest_fields = operator.attrgetter(*(
+    field for field in Peer.__slots__
+    if field not in ("latest_handshake_seconds", "jobs")
+))
+
+def _content_digest(config_info: Dict, peers: List[Peer], restricted_peers: List[Peer]) -> int:
+    """
+    Huella del contenido de una descarga, para saber si cambió algo.
+    
+    Se usa hash() de tuplas (las cadenas cachean su hash): con miles de
+    peers es mucho más rápido que un hash criptográfico y solo se compara
+    dentro del mismo proceso.
+    """
+    rows = [
+        (restricted, _digest_fields(peer), peer.latest_handshake_seconds > 0, repr(peer.jobs) if peer.jobs else None)
+        for restricted, group in ((False, peers), (True, restricted_peers))
+        for peer in group
+    ]
+    return hash((json.dumps(config_info, sort_keys=True, default=str), tuple(rows)))
+
+class ConfigSnapshot:
+    """
+    Estado de una configuración obtenido con una sola petición a
+    getWireguardConfigurationInfo y procesado una única vez.
+    
+    Es compartido por todos los usuarios: no debe modificarse.
+    """
+    
+    __slots__ = (
+        "config_name", "version", "config_info", "peers",
+        "restricted_peers", "restricted_keys", "connected", "digest"
+    )
+    
+    def __init__(self, config_name: str, version: int, data: Dict):
+        self.config_name = config_name
+        self.version = version
+        self.config_info: Dict = data.get("configurationInfo", {}) or {}
+        # Los peers llegan ya convertidos a Peer (ver parse_configuration_info)
+        self.peers: List[Peer] = data.get("configurationPeers", []) or []
+        self.restricted_peers: List[Peer] = data.get("configurationRestrictedPeers", []) or []
+        
+        self.connected = sum(
+            1 for peer in self.peers
+            if peer.status == 'running' and peer.latest_handshake_seconds > 0
+        )
+        self.restricted_keys = frozenset(peer.id for peer in self.restricted_peers)
+        self.digest = _content_digest(self.config_info, self.peers, self.restricted_peers)
+    
+    @property
+    def total(self) -> int:
+        """Total de peers (normales + restringidos)"""
+        return len(self.peers) + len(self.restricted_peers)
+
 class WGApiClient:
     """Cliente para interactuar con la API de WGDashboard"""
     
@@ -34,27 +322,322 @@ class WGApiClient:
             "User-Agent": "WGDashboard-Bot/1.0"
         }
         self.timeout = API_TIMEOUT
-        self.session = requests.Session()
-        self.session.headers.update(self.headers)
-        
-        # Cache simple
-        self._cache = {}
-        self._cache_ttl = 30  # segundos
-    
-    def _get_cached(self, key: str):
-        """Obtiene datos del cache si son recientes"""
-        if key in self._cache:
-            data, timestamp = self._cache[key]
-            if (datetime.now() - timestamp).seconds < self._cache_ttl:
-                return data
-        return None
+        
+        # Cliente HTTP asíncrono compartido (pool de conexiones)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._limits = httpx.Limits(
+            max_connections=API_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=API_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=API_KEEPALIVE_EXPIRY
+        )
+        self._http2 = API_HTTP2 and _http2_available()
+        
+        if API_STREAM_JSON and ijson is None:
+            logger.warning("[API] Falta el paquete ijson: las listas de peers se decodificarán completas en memoria")
+        
+        self._keepalive_task: Optional[asyncio.Task] = None
+        
+        # Peticiones en curso compartidas entre llamadas concurrentes
+        self._inflight: Dict[str, asyncio.Task] = {}
+        
+        # Stale-while-revalidate: tras el TTL se sirve el dato vencido y se
+        # refresca en segundo plano, hasta un máximo de antigüedad
+        self._stale_while_revalidate = API_CACHE_STALE_WHILE_REVALIDATE
+        
+        # Cache de respuestas. Claves: "configurations" y "config:{nombre}:..."
+        self._cache = TTLCache(
+            "api",
+            max_size=API_CACHE_MAX_ENTRIES,
+            ttl=API_CACHE_TTL,
+            max_staleness=max(API_CACHE_MAX_STALENESS, API_CACHE_TTL)
+        )
+        
+        # Último resultado correcto de cada clave, para mostrarlo marcado como
+        # desactualizado cuando el servidor no responde
+        self._last_known = TTLCache(
+            "api_last_known",
+            max_size=API_CACHE_MAX_ENTRIES,
+            ttl=API_STALE_FALLBACK_TTL
+        )
+        
+        # Circuit breaker por endpoint
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        
+        # Endpoint elegido por capacidad (None = no soportada). Los resultados
+        # negativos también se guardan y se revisan al vencer el TTL
+        self._capabilities = TTLCache(
+            "capabilities",
+            max_size=len(CAPABILITY_ENDPOINTS),
+            ttl=API_CAPABILITY_TTL
+        )
+        
+        # Versión de snapshot y generación de invalidación por configuración
+        self._snapshot_versions: Dict[str, int] = {}
+        self._config_generations: Dict[str, int] = {}
+        
+        # Cambios del último snapshot respecto al anterior, por configuración.
+        # Los snapshots se guardan en snapshot_store, compartido por todo el proceso
+        self._last_diffs: Dict[str, SnapshotDiff] = {}
     
     def _set_cache(self, key: str, data: Any):
         """Guarda datos en cache"""
-        self._cache[key] = (data, datetime.now())
+        self._cache.set(key, data)
+        self._last_known.set(key, data)
+    
+    def invalidate_config(self, config_name: str):
+        """Invalida el cache de una configuración tras una modificación"""
+        self._cache.delete("configurations")
+        self._cache.invalidate_prefix(f"config:{config_name}:")
+        
+        # Una descarga en curso puede traer datos previos a la modificación:
+        # no se reutiliza ni se guardará en cache
+        self._config_generations[config_name] = self._config_generations.get(config_name, 0) + 1
+        self._inflight.pop(f"config:{config_name}:snapshot", None)
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Devuelve el cliente HTTP compartido, creándolo bajo demanda"""
+        if self._client is None or self._client.is_closed:
+            # Con API_TRANSPORT_MODE las respuestas se graban o se reproducen
+            transport = build_transport(
+                API_TRANSPORT_MODE,
+                API_CASSETTE_FILE,
+                self.base_url,
+                latency_factor=API_REPLAY_LATENCY,
+                limits=self._limits,
+                http2=self._http2
+            )
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=self.timeout,
+                limits=self._limits,
+                http2=self._http2,
+                transport=transport
+            )
+        return self._client
+    
+    async def warm_up(self) -> Dict:
+        """
+        Abre conexiones con WGDashboard antes de atender usuarios.
+        
+        Lanza varios handshakes a la vez para dejar el pool con
+        API_WARMUP_CONNECTIONS conexiones abiertas (TCP y TLS ya negociados).
+        
+        Returns:
+            Resultado del primer handshake
+        """
+        connections = max(1, min(API_WARMUP_CONNECTIONS, API_POOL_MAX_KEEPALIVE))
+        results = await asyncio.gather(*(self.handshake() for _ in range(connections)))
+        
+        logger.info(f"[API] Pool precalentado con {connections} conexiones (HTTP/2: {self._http2})")
+        return results[0]
+    
+    def start_keepalive(self):
+        """Inicia el ping periódico que mantiene vivas las conexiones del pool"""
+        if API_KEEPALIVE_PING_INTERVAL <= 0 or self._keepalive_task is not None:
+            return
+        
+        self._keepalive_task = asyncio.ensure_future(self._keepalive_loop())
+    
+    async def _keepalive_loop(self):
+        """Hace un handshake cada API_KEEPALIVE_PING_INTERVAL segundos"""
+        while True:
+            await asyncio.sleep(API_KEEPALIVE_PING_INTERVAL)
+            await self.handshake()
+    
+    async def close(self):
+        """Cierra el pool de conexiones del cliente HTTP"""
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+        
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+    
+    def _start_flight(self, key: str, factory: Callable[[], Awaitable[Dict]]) -> asyncio.Task:
+        """Devuelve la petición en curso para key, o la inicia con factory"""
+        task = self._inflight.get(key)
+        
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            
+            def _release(finished: asyncio.Task):
+                if self._inflight.get(key) is finished:
+                    del self._inflight[key]
+            
+            task.add_done_callback(_release)
+        else:
+            logger.debug(f"[API] Reutilizando petición en curso: {key}")
+        
+        return task
+    
+    async def _single_flight(self, key: str, factory: Callable[[], Awaitable[Dict]]) -> Dict:
+        """
+        Ejecuta la petición de factory una sola vez por clave.
+        
+        Las llamadas concurrentes con la misma clave esperan la petición
+        ya en curso y reciben el mismo resultado (no debe modificarse).
+        """
+        task = self._start_flight(key, factory)
+        
+        # shield: si un llamador se cancela, la petición sigue para los demás
+        return await asyncio.shield(task)
+    
+    async def _cached_request(self, key: str, factory: Callable[[], Awaitable[Dict]], use_cache: bool = True) -> Dict:
+        """
+        Devuelve el resultado guardado en cache para key o lo obtiene con factory.
+        
+        factory es responsable de guardar el resultado en cache si tiene éxito.
+        Con stale-while-revalidate, un dato vencido pero dentro de la
+        antigüedad máxima se devuelve al momento y se refresca en segundo plano.
+        """
+        if use_cache:
+            data, state, age = self._cache.lookup(key, allow_stale=self._stale_while_revalidate)
+            
+            if state == FRESH:
+                logger.debug(f"[API] Usando cache para {key}")
+                return data
+            
+            if state is not None:
+                logger.debug(f"[API] Cache vencido para {key} ({age:.0f}s), refrescando en segundo plano")
+                self._start_flight(key, factory)
+                return data
+        
+        result = await self._single_flight(key, factory)
+        
+        if not result.get("status") and result.get("unavailable"):
+            # Servidor caído: devolver el último dato conocido marcado como desactualizado
+            data, state, age = self._last_known.lookup(key)
+            if state is not None:
+                logger.warning(f"[API] Servidor no disponible, usando datos de hace {age:.0f}s para {key}")
+                return {**data, "stale": True, "stale_age": age}
+        
+        return result
+    
+    async def _fetch_snapshot(self, config_name: str) -> Dict:
+        """Descarga y procesa getWireguardConfigurationInfo en un ConfigSnapshot"""
+        endpoint = f"/getWireguardConfigurationInfo?configurationName={config_name}"
+        generation = self._config_generations.get(config_name, 0)
+        
+        result = await self._make_request("GET", endpoint, parser=parse_configuration_info)
+        
+        if not result.get("status"):
+            logger.error(f"[API] Error en getWireguardConfigurationInfo: {result.get('message')}")
+            return result
+        
+        if self._config_generations.get(config_name, 0) != generation:
+            # Una modificación invalidó esta descarga mientras llegaba: sus
+            # datos son anteriores y no se publican. Se espera a la descarga
+            # posterior (invalidate_config ya sacó esta de _inflight)
+            logger.debug(f"[API] Descartada descarga de {config_name} anterior a una modificación")
+            return await self._single_flight(
+                f"config:{config_name}:snapshot",
+                lambda: self._fetch_snapshot(config_name)
+            )
+        
+        version = self._snapshot_versions.get(config_name, 0) + 1
+        snapshot = ConfigSnapshot(config_name, version, result.get("data") or {})
+        previous = snapshot_store.latest(config_name)
+        
+        if previous is not None and previous.digest == snapshot.digest:
+            # Sin cambios: se conserva la versión (listas abiertas, último
+            # diff) pero se guardan los peers nuevos, con el handshake al día.
+            # El snapshot aún no es visible fuera de aquí
+            logger.debug(f"[API] {config_name} sin cambios (versión {previous.version})")
+            snapshot.version = previous.version
+            snapshot_store.refresh(snapshot)
+        else:
+            self._snapshot_versions[config_name] = version
+            if previous is not None:
+                self._last_diffs[config_name] = diff_snapshots(previous, snapshot)
+            snapshot_store.add(snapshot)
+        snapshot_result = {
+            "status": True,
+            "message": None,
+            "data": snapshot
+        }
+        
+        self._set_cache(f"config:{config_name}:snapshot", snapshot_result)
+        return snapshot_result
+    
+    async def get_snapshot(self, config_name: str, use_cache: bool = True) -> Dict:
+        """Obtiene el ConfigSnapshot de una configuración (cache + peticiones compartidas)"""
+        return await self._cached_request(
+            f"config:{config_name}:snapshot",
+            lambda: self._fetch_snapshot(config_name),
+            use_cache
+        )
+    
+    def _breaker(self, endpoint: str) -> CircuitBreaker:
+        """Circuit breaker del endpoint (sin parámetros de consulta)"""
+        path = endpoint.split("?", 1)[0]
+        breaker = self._breakers.get(path)
+        
+        if breaker is None:
+            breaker = CircuitBreaker(path, API_BREAKER_THRESHOLD, API_BREAKER_RESET_TIMEOUT)
+            self._breakers[path] = breaker
+        
+        return breaker
+    
+    def circuit_status(self) -> List[Dict]:
+        """Estado de los circuit breakers que no están cerrados"""
+        return [breaker.stats() for breaker in self._breakers.values() if breaker.state != CLOSED]
     
-    def _make_request(self, method: str, endpoint: str, **kwargs) -> Dict:
-        """Realiza una petición HTTP a la API"""
+    async def _make_request(self, method: str, endpoint: str,
+                            parser: Optional[Callable[[httpx.Response], Awaitable[Dict]]] = None,
+                            **kwargs) -> Dict:
+        """
+        Realiza una petición HTTP a la API.
+        
+        Cada endpoint tiene un circuit breaker: con el circuito abierto se
+        falla al momento con "unavailable": True. Los GET se reintentan ante
+        fallos transitorios con backoff exponencial y jitter.
+        
+        parser, si se indica, recibe la respuesta 200 sin leer (streaming)
+        y devuelve el resultado decodificado.
+        """
+        breaker = self._breaker(endpoint)
+        attempts = 1 + max(0, API_RETRY_ATTEMPTS) if method == "GET" else 1
+        
+        for attempt in range(attempts):
+            if not breaker.allow_request():
+                logger.warning(f"[API] Circuito abierto para {method} {endpoint}, se omite la petición")
+                return {
+                    "status": False,
+                    "message": f"Servidor no disponible, reintento en {breaker.retry_after:.0f}s",
+                    "data": None,
+                    "unavailable": True
+                }
+            
+            result, transient = await self._send_request(method, endpoint, parser, **kwargs)
+            
+            if not transient:
+                breaker.record_success()
+                return result
+            
+            breaker.record_failure()
+            
+            if attempt + 1 < attempts:
+                # Backoff exponencial con jitter completo
+                delay = random.uniform(0, min(API_RETRY_MAX_BACKOFF, API_RETRY_BACKOFF * (2 ** attempt)))
+                logger.info(f"[API] Reintentando {method} {endpoint} en {delay:.2f}s ({attempt + 1}/{attempts - 1})")
+                await asyncio.sleep(delay)
+        
+        result["unavailable"] = True
+        return result
+    
+    async def _send_request(self, method: str, endpoint: str,
+                            parser: Optional[Callable[[httpx.Response], Awaitable[Dict]]] = None,
+                            **kwargs) -> Tuple[Dict, bool]:
+        """
+        Envía una única petición HTTP.
+        
+        Returns:
+            (resultado, transitorio): transitorio indica un fallo del servidor
+            o de la red (timeout, conexión, 5xx) que puede reintentarse
+        """
         url = f"{self.base_url}{endpoint}"
         
         logger.info(f"[API] {method} {url}")
@@ -62,14 +645,18 @@ class WGApiClient:
             logger.info(f"[API] JSON payload: {json.dumps(kwargs['json'], indent=2)}")
         
         try:
-            response = self.session.request(
+            async with self.client.stream(
                 method=method,
                 url=url,
                 timeout=self.timeout,
                 **kwargs
-            )
-            
-            logger.info(f"[API] Response: {response.status_code}")
+            ) as response:
+                logger.info(f"[API] Response: {response.status_code}")
+                
+                if response.status_code == 200 and parser is not None:
+                    return await parser(response), False
+                
+                await response.aread()
             
             if response.status_code == 200:
                 # Intentar determinar si es JSON o texto plano
@@ -78,21 +665,17 @@ class WGApiClient:
                 if 'application/json' in content_type:
                     try:
                         result = response.json()
-                        return result
+                        return result, False
                     except json.JSONDecodeError:
                         logger.error(f"[API] Respuesta no es JSON válido: {response.text[:200]}")
-                        return {
-                            "status": False,
-                            "message": "Respuesta JSON inválida del servidor",
-                            "data": None
-                        }
+                        return _invalid_json_result(), False
                 else:
                     # Es texto plano (como un archivo .conf)
                     return {
                         "status": True,
                         "message": "Configuración descargada",
                         "data": response.text
-                    }
+                    }, False
             else:
                 # Manejar otros códigos de estado
                 error_msg = f"HTTP {response.status_code}"
@@ -109,150 +692,270 @@ class WGApiClient:
                     "status": False,
                     "message": error_msg,
                     "data": None
-                }
+                }, response.status_code >= 500
                 
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             logger.error(f"[API] Timeout en {method} {endpoint}")
             return {
                 "status": False,
                 "message": "Timeout al conectar con el servidor",
                 "data": None
-            }
-        except requests.exceptions.ConnectionError:
+            }, True
+        except httpx.ConnectError:
             logger.error(f"[API] Error de conexión en {method} {endpoint}")
             return {
                 "status": False,
                 "message": "No se puede conectar al servidor",
                 "data": None
-            }
-        except RequestException as e:
+            }, True
+        except httpx.HTTPError as e:
             logger.error(f"[API] Error en petición: {str(e)}")
             return {
                 "status": False,
                 "message": f"Error de red: {str(e)}",
                 "data": None
-            }
+            }, True
         except Exception as e:
             logger.error(f"[API] Error inesperado: {str(e)}", exc_info=True)
             return {
                 "status": False,
                 "message": f"Error interno: {str(e)}",
                 "data": None
-            }
+            }, False
+    
+    # ================= CAPACIDADES ================= #
+    
+    async def _probe_endpoint(self, endpoint: str) -> Optional[bool]:
+        """
+        Comprueba si un endpoint existe con un GET.
+        
+        Un 404 indica que no existe; cualquier otra respuesta (incluido 405
+        en endpoints que solo aceptan POST) indica que sí. La prueba pasa
+        por el circuit breaker del endpoint: con el circuito abierto no se
+        envía y los fallos cuentan como los de cualquier otra petición.
+        
+        Returns:
+            True/False, o None si no se pudo contactar con el servidor
+        """
+        breaker = self._breaker(endpoint)
+        if not breaker.allow_request():
+            logger.debug(f"[API] Circuito abierto para {endpoint}, no se comprueba")
+            return None
+        
+        try:
+            response = await self.client.get(f"{self.base_url}{endpoint}", timeout=self.timeout)
+        except httpx.HTTPError as e:
+            logger.debug(f"[API] No se pudo comprobar {endpoint}: {str(e)}")
+            breaker.record_failure()
+            return None
+        
+        if response.status_code >= 500:
+            # Servidor con problemas: no se puede saber si el endpoint existe
+            breaker.record_failure()
+            return None
+        
+        breaker.record_success()
+        return response.status_code != 404
+    
+    async def _discover_capability(self, capability: str) -> Optional[str]:
+        """Busca el primer endpoint soportado para una capacidad y lo memoriza"""
+        for endpoint in CAPABILITY_ENDPOINTS[capability]:
+            supported = await self._probe_endpoint(endpoint)
+            
+            if supported is None:
+                # Servidor inaccesible: no se guarda nada y se reintentará
+                return None
+            
+            if supported:
+                logger.info(f"[API] Capacidad {capability}: {endpoint}")
+                self._capabilities.set(capability, endpoint)
+                return endpoint
+        
+        logger.info(f"[API] Capacidad {capability}: no soportada")
+        self._capabilities.set(capability, None)
+        return None
+    
+    async def _resolve_endpoint(self, capability: str) -> Optional[str]:
+        """Devuelve el endpoint memorizado para una capacidad, descubriéndolo si hace falta"""
+        endpoint, state, _ = self._capabilities.lookup(capability)
+        
+        if state == FRESH:
+            return endpoint
+        
+        return await self._single_flight(
+            f"capability:{capability}",
+            lambda: self._discover_capability(capability)
+        )
+    
+    def _forget_capability(self, capability: str, result: Dict):
+        """Olvida el endpoint de una capacidad si dejó de existir (404)"""
+        if str(result.get("message") or "").startswith("HTTP 404"):
+            logger.warning(f"[API] El endpoint de {capability} ya no existe, se volverá a comprobar")
+            self._capabilities.delete(capability)
+    
+    async def discover_capabilities(self) -> Dict[str, Optional[str]]:
+        """
+        Comprueba qué endpoints soporta el WGDashboard conectado.
+        
+        Se llama al iniciar el bot; después cada capacidad se vuelve a
+        comprobar cuando vence API_CAPABILITY_TTL.
+        """
+        self._capabilities.clear()
+        endpoints = await asyncio.gather(*(
+            self._resolve_endpoint(capability) for capability in CAPABILITY_ENDPOINTS
+        ))
+        return dict(zip(CAPABILITY_ENDPOINTS, endpoints))
     
     # ================= MÉTODOS DE API ================= #
     
-    def handshake(self) -> Dict:
+    async def handshake(self) -> Dict:
         """Verifica la conexión con la API"""
-        return self._make_request("GET", "/handshake")
+        return await self._make_request("GET", "/handshake")
+    
+    async def _fetch_configurations(self) -> Dict:
+        """Descarga la lista de configuraciones y la guarda en cache"""
+        result = await self._make_request("GET", "/getWireguardConfigurations")
+        
+        if result.get("status"):
+            self._set_cache("configurations", result)
+        
+        return result
     
-    def get_configurations(self, use_cache: bool = True) -> Dict:
+    async def get_configurations(self, use_cache: bool = True) -> Dict:
         """Obtiene todas las configuraciones WireGuard"""
-        cache_key = "configurations"
+        return await self._cached_request("configurations", self._fetch_configurations, use_cache)
+    
+    @staticmethod
+    def _with_freshness(source: Dict, result: Dict) -> Dict:
+        """Copia las marcas de dato desactualizado de source a result"""
+        if source.get("stale"):
+            result["stale"] = True
+            result["stale_age"] = source.get("stale_age", 0)
+        return result
+    
+    async def get_configuration_detail(self, config_name: str) -> Dict:
+        """Obtiene detalles de una configuración específica"""
+        result = await self.get_snapshot(config_name)
         
-        if use_cache:
-            cached = self._get_cached(cache_key)
-            if cached:
-                logger.debug("[API] Usando cache para configuraciones")
-                return cached
+        if not result.get("status"):
+            return result
         
-        result = self._make_request("GET", "/getWireguardConfigurations")
+        return self._with_freshness(result, {
+            "status": True,
+            "message": None,
+            "data": result["data"].config_info
+        })
+    
+    async def get_peers(self, config_name: str) -> Dict:
+        """Obtiene la lista de peers de una configuración"""
+        result = await self.get_snapshot(config_name)
         
-        if result.get("status") and use_cache:
-            self._set_cache(cache_key, result)
+        if not result.get("status"):
+            return result
         
-        return result
+        snapshot: ConfigSnapshot = result["data"]
+        
+        return self._with_freshness(result, {
+            "status": True,
+            "message": None,
+            "data": snapshot.peers,
+            "restricted_data": snapshot.restricted_peers,
+            "metadata": {
+                "total": snapshot.total,
+                "connected": snapshot.connected,
+                "restricted": len(snapshot.restricted_peers),
+                "config_name": config_name,
+                "config_data": snapshot.config_info,
+                "version": snapshot.version
+            }
+        })
     
-    def get_configuration_detail(self, config_name: str) -> Dict:
-        """Obtiene detalles de una configuración específica"""
-        endpoint = f"/getWireguardConfigurationInfo?configurationName={config_name}"
+    async def get_peer(self, config_name: str, token: str) -> Dict:
+        """
+        Busca un peer por su token (ver snapshot_store.peer_token).
         
-        result = self._make_request("GET", endpoint)
+        Usa el snapshot en cache, así que no descarga la lista de nuevo si
+        sigue vigente. restricted indica si el peer está restringido.
+        """
+        result = await self.get_snapshot(config_name)
         
         if not result.get("status"):
             return result
         
-        data = result.get("data", {})
-        config_info = data.get("configurationInfo", {})
+        snapshot: ConfigSnapshot = result["data"]
+        peer = snapshot_store.find_peer(snapshot, token)
         
-        return {
+        if peer is None:
+            return {
+                "status": False,
+                "message": "El peer ya no existe en la configuración",
+                "data": None
+            }
+        
+        return self._with_freshness(result, {
             "status": True,
             "message": None,
-            "data": config_info
-        }
+            "data": peer,
+            "restricted": peer.id in snapshot.restricted_keys
+        })
     
-    def get_peers(self, config_name: str) -> Dict:
-        """Obtiene la lista de peers de una configuración"""
-        endpoint = f"/getWireguardConfigurationInfo?configurationName={config_name}"
+    async def search_peers(self, config_name: str, text: str, limit: Optional[int] = None) -> Dict:
+        """
+        Peers cuyo nombre, IP o clave pública contienen text.
         
-        result = self._make_request("GET", endpoint)
+        Usa el snapshot en cache y el índice de trigramas de la
+        configuración (ver peer_search). total es el número de coincidencias
+        antes de aplicar limit; restricted_keys indica qué resultados están
+        restringidos.
+        """
+        result = await self.get_snapshot(config_name)
         
         if not result.get("status"):
-            logger.error(f"[API] Error en getWireguardConfigurationInfo: {result.get('message')}")
             return result
         
-        data = result.get("data", {})
-        config_info = data.get("configurationInfo", {})
-        peers = data.get("configurationPeers", [])
-        restricted_peers = data.get("configurationRestrictedPeers", [])
+        snapshot: ConfigSnapshot = result["data"]
+        matches = snapshot_store.search_index(snapshot).search(text)
         
-        # Convertir latest_handshake de string a segundos
-        for peer in peers:
-            latest_handshake_str = peer.get('latest_handshake', '').strip()
-            seconds = 0
-            
-            if latest_handshake_str and latest_handshake_str.lower() != 'no handshake':
-                try:
-                    if 'days' in latest_handshake_str:
-                        parts = latest_handshake_str.split(', ')
-                        days = int(parts[0].split(' ')[0])
-                        time_parts = list(map(int, parts[1].split(':')))
-                        seconds = days * 86400 + time_parts[0] * 3600 + time_parts[1] * 60 + time_parts[2]
-                    else:
-                        time_parts = list(map(int, latest_handshake_str.split(':')))
-                        if len(time_parts) == 3:
-                            seconds = time_parts[0] * 3600 + time_parts[1] * 60 + time_parts[2]
-                        elif len(time_parts) == 2:
-                            seconds = time_parts[0] * 60 + time_parts[1]
-                except (ValueError, IndexError):
-                    pass
-            
-            peer['latest_handshake_seconds'] = seconds
+        return self._with_freshness(result, {
+            "status": True,
+            "message": None,
+            "data": matches[:limit] if limit else matches,
+            "total": len(matches),
+            "restricted_keys": snapshot.restricted_keys
+        })
+    
+    async def get_changes(self, config_name: str, refresh: bool = True) -> Dict:
+        """
+        Cambios entre las dos últimas versiones descargadas de una configuración.
         
-        # Calcular peers conectados
-        connected_peers = 0
-        for peer in peers:
-            if peer.get('status') == 'running' and peer.get('latest_handshake_seconds', 0) > 0:
-                connected_peers += 1
+        Con refresh se descarga una versión nueva antes de comparar.
+        data es None si todavía no hay una versión anterior.
+        """
+        result = await self.get_snapshot(config_name, use_cache=not refresh)
         
-        return {
+        if not result.get("status"):
+            return result
+        
+        diff = self._last_diffs.get(config_name)
+        if diff is not None and diff.to_version != result["data"].version:
+            diff = None
+        
+        return self._with_freshness(result, {
             "status": True,
             "message": None,
-            "data": peers,
-            "restricted_data": restricted_peers,
-            "metadata": {
-                "total": len(peers) + len(restricted_peers),
-                "connected": connected_peers,
-                "restricted": len(restricted_peers),
-                "config_name": config_name,
-                "config_data": config_info
-            }
-        }
+            "data": diff
+        })
     
-    def get_restricted_peers(self, config_name: str) -> Dict:
+    async def get_restricted_peers(self, config_name: str) -> Dict:
         """Obtiene solo los peers restringidos de una configuración"""
-        endpoint = f"/getWireguardConfigurationInfo?configurationName={config_name}"
-        
-        result = self._make_request("GET", endpoint)
+        result = await self.get_snapshot(config_name)
         
         if not result.get("status"):
-            logger.error(f"[API] Error en getWireguardConfigurationInfo: {result.get('message')}")
             return result
         
-        data = result.get("data", {})
-        restricted_peers = data.get("configurationRestrictedPeers", [])
+        restricted_peers = result["data"].restricted_peers
         
-        return {
+        return self._with_freshness(result, {
             "status": True,
             "message": None,
             "data": restricted_peers,
@@ -260,9 +963,9 @@ class WGApiClient:
                 "total": len(restricted_peers),
                 "config_name": config_name
             }
-        }
+        })
     
-    def restrict_peer(self, config_name: str, public_key: str) -> Dict:
+    async def restrict_peer(self, config_name: str, public_key: str) -> Dict:
         """Restringe un peer específico"""
         endpoint = f"/restrictPeers/{config_name}"
         payload = {
@@ -271,15 +974,14 @@ class WGApiClient:
         
         logger.info(f"[API] Restringiendo peer en {config_name}: {public_key[:30]}...")
         
-        result = self._make_request("POST", endpoint, json=payload)
+        result = await self._make_request("POST", endpoint, json=payload)
         
-        # Invalidar cache de configuraciones
-        if "configurations" in self._cache:
-            del self._cache["configurations"]
+        # Invalidar cache de la configuración
+        self.invalidate_config(config_name)
         
         return result
     
-    def allow_access_peer(self, config_name: str, public_key: str) -> Dict:
+    async def allow_access_peer(self, config_name: str, public_key: str) -> Dict:
         """Quita la restricción de un peer específico"""
         endpoint = f"/allowAccessPeers/{config_name}"
         payload = {
@@ -288,15 +990,14 @@ class WGApiClient:
         
         logger.info(f"[API] Quitando restricción a peer en {config_name}: {public_key[:30]}...")
         
-        result = self._make_request("POST", endpoint, json=payload)
+        result = await self._make_request("POST", endpoint, json=payload)
         
-        # Invalidar cache de configuraciones
-        if "configurations" in self._cache:
-            del self._cache["configurations"]
+        # Invalidar cache de la configuración
+        self.invalidate_config(config_name)
         
         return result
     
-    def delete_peer(self, config_name: str, public_key: str) -> Dict:
+    async def delete_peer(self, config_name: str, public_key: str) -> Dict:
         """Elimina un peer específico"""
         endpoint = f"/deletePeers/{config_name}"
         payload = {
@@ -305,15 +1006,74 @@ class WGApiClient:
         
         logger.info(f"[API] Eliminando peer de {config_name}: {public_key[:30]}...")
         
-        result = self._make_request("POST", endpoint, json=payload)
+        result = await self._make_request("POST", endpoint, json=payload)
+        
+        if result.get("status"):
+            ip_allocator.remove_peers(config_name, [public_key])
+        
+        # Invalidar cache de la configuración
+        self.invalidate_config(config_name)
+        
+        return result
+    
+    async def _bulk_peer_action(self, endpoint: str, config_name: str, public_keys: List[str], action: str) -> Dict:
+        """
+        Aplica una acción a varios peers usando el payload {"peers": [...]}.
+        
+        Las listas grandes se dividen en bloques de API_BULK_CHUNK_SIZE. La API
+        responde por petición, así que si un bloque falla todos sus peers se
+        reportan como fallidos.
+        
+        Returns:
+            Dict con data = {"succeeded": [claves], "failed": [{"id", "message"}]}
+        """
+        # Quitar vacíos y duplicados conservando el orden
+        keys = list(dict.fromkeys(key for key in public_keys if key))
+        chunk_size = max(1, API_BULK_CHUNK_SIZE)
+        
+        succeeded: List[str] = []
+        failed: List[Dict] = []
+        
+        logger.info(f"[API] {action} {len(keys)} peers en {config_name} (bloques de {chunk_size})")
+        
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            result = await self._make_request("POST", endpoint, json={"peers": chunk})
+            
+            if result.get("status"):
+                succeeded.extend(chunk)
+            else:
+                message = result.get("message") or "Error desconocido"
+                failed.extend({"id": key, "message": message} for key in chunk)
         
-        # Invalidar cache de configuraciones
-        if "configurations" in self._cache:
-            del self._cache["configurations"]
+        if keys:
+            # Invalidar cache de la configuración una sola vez
+            self.invalidate_config(config_name)
         
+        return {
+            "status": not failed,
+            "message": None if not failed else f"{len(failed)} de {len(keys)} peers fallaron",
+            "data": {
+                "succeeded": succeeded,
+                "failed": failed
+            }
+        }
+    
+    async def restrict_peers(self, config_name: str, public_keys: List[str]) -> Dict:
+        """Restringe varios peers"""
+        return await self._bulk_peer_action(f"/restrictPeers/{config_name}", config_name, public_keys, "Restringiendo")
+    
+    async def allow_access_peers(self, config_name: str, public_keys: List[str]) -> Dict:
+        """Quita la restricción de varios peers"""
+        return await self._bulk_peer_action(f"/allowAccessPeers/{config_name}", config_name, public_keys, "Quitando restricción a")
+    
+    async def delete_peers(self, config_name: str, public_keys: List[str]) -> Dict:
+        """Elimina varios peers"""
+        result = await self._bulk_peer_action(f"/deletePeers/{config_name}", config_name, public_keys, "Eliminando")
+        ip_allocator.remove_peers(config_name, result["data"]["succeeded"])
         return result
     
-    def reset_peer_data(self, config_name: str, public_key: str) -> Dict:
+    async def reset_peer_data(self, config_name: str, public_key: str) -> Dict:
         """Resetea el contador de datos de un peer específico"""
         endpoint = f"/resetPeerData/{config_name}"
         payload = {
@@ -325,14 +1085,17 @@ class WGApiClient:
         logger.info(f"[API] Endpoint: {endpoint}")
         logger.info(f"[API] Payload: {json.dumps(payload)}")
         
-        result = self._make_request("POST", endpoint, json=payload)
+        result = await self._make_request("POST", endpoint, json=payload)
         
         if result:
             logger.info(f"[API] Resultado: status={result.get('status')}, message={result.get('message')}")
         
+        # Los contadores de tráfico cambiaron
+        self.invalidate_config(config_name)
+        
         return result
     
-    def add_peer(self, config_name: str, peer_data: Dict) -> Dict:
+    async def add_peer(self, config_name: str, peer_data: Dict) -> Dict:
         """Agrega un nuevo peer a la configuración"""
         endpoint = f"/addPeers/{config_name}"
         
@@ -340,7 +1103,8 @@ class WGApiClient:
             "bulkAdd": False,
             "bulkAddAmount": 0,
             "name": peer_data.get("name", "nuevo-peer"),
-            "allowed_ips": [peer_data.get("allowed_ips", "10.21.0.2/32")],
+            # Una entrada por dirección ("10.0.0.5/32, fd00::5/128" con IPv4 e IPv6)
+            "allowed_ips": [ip.strip() for ip in peer_data.get("allowed_ips", "10.21.0.2/32").split(",")],
             "private_key": peer_data.get("private_key", ""),
             "public_key": peer_data.get("public_key", ""),
             "DNS": peer_data.get("dns", "1.1.1.1"),
@@ -356,19 +1120,24 @@ class WGApiClient:
         logger.info(f"[API] Agregando peer a {config_name}: {payload['name']}")
         logger.debug(f"[API] Payload EXACTO: {json.dumps(payload, indent=2)}")
         
-        result = self._make_request("POST", endpoint, json=payload)
+        result = await self._make_request("POST", endpoint, json=payload)
         
         # Log de respuesta completa
         if result:
             logger.debug(f"[API] Respuesta completa: {json.dumps(result, indent=2)}")
         
-        # Invalidar cache de configuraciones
-        if "configurations" in self._cache:
-            del self._cache["configurations"]
+        # La dirección reservada se mantiene hasta ver el peer o se libera
+        if result.get("status"):
+            ip_allocator.confirm(config_name, payload["public_key"], peer_data.get("allowed_ips", ""))
+        else:
+            ip_allocator.release(config_name, peer_data.get("allowed_ips", ""))
+        
+        # Invalidar cache de la configuración
+        self.invalidate_config(config_name)
         
         return result
     
-    def create_schedule_job(self, config_name: str, public_key: str, job_data: Dict) -> Dict:
+    async def create_schedule_job(self, config_name: str, public_key: str, job_data: Dict) -> Dict:
         """Crea un trabajo programado para un peer usando el endpoint correcto"""
         endpoint = "/savePeerScheduleJob"
         
@@ -410,16 +1179,19 @@ class WGApiClient:
         logger.info(f"[API] Creando schedule job para peer {public_key[:30]}... en {config_name}")
         logger.debug(f"[API] Payload EXACTO: {json.dumps(payload, indent=2)}")
         
-        result = self._make_request("POST", endpoint, json=payload)
+        result = await self._make_request("POST", endpoint, json=payload)
+        
+        # Los jobs del peer forman parte del snapshot
+        self.invalidate_config(config_name)
         
         return result
     
-    def delete_schedule_job(self, config_name: str, public_key: str, job_id: str, job_data: Dict = None) -> Dict:
+    async def delete_schedule_job(self, config_name: str, public_key: str, job_id: str, job_data: Dict = None) -> Dict:
         """
         Elimina un trabajo programado específico.
         """
-        # Intentar primero con el endpoint principal
-        endpoint = "/deletePeerScheduleJob"
+        # Endpoint detectado para esta versión de WGDashboard
+        endpoint = await self._resolve_endpoint("delete_schedule_job") or "/savePeerScheduleJob"
         
         # Construir payload mínimo
         payload = {
@@ -439,23 +1211,22 @@ class WGApiClient:
             # Forzar acción delete
             payload["Job"]["Action"] = "delete"
         
-        logger.info(f"[API] Eliminando schedule job: {job_id} para peer {public_key[:30]}")
+        if endpoint == "/savePeerScheduleJob":
+            # Sin endpoint de borrado: se guarda el job con acción delete
+            payload["Job"]["Action"] = "delete"
+        
+        logger.info(f"[API] Eliminando schedule job: {job_id} para peer {public_key[:30]} ({endpoint})")
         
-        result = self._make_request("POST", endpoint, json=payload)
+        result = await self._make_request("POST", endpoint, json=payload)
         
-        # Si falla, intentar con endpoint alternativo
         if not result.get("status"):
-            logger.warning(f"Endpoint {endpoint} falló, intentando con /savePeerScheduleJob...")
-            
-            alt_endpoint = "/savePeerScheduleJob"
-            alt_payload = payload.copy()
-            alt_payload["Job"]["Action"] = "delete"
-            
-            result = self._make_request("POST", alt_endpoint, json=alt_payload)
+            self._forget_capability("delete_schedule_job", result)
+        
+        self.invalidate_config(config_name)
         
         return result
     
-    def download_peer_config(self, config_name: str, public_key: str) -> Dict:
+    async def download_peer_config(self, config_name: str, public_key: str) -> Dict:
         """Descarga la configuración de un peer"""
         logger.info(f"[API] Descargando configuración para peer recién creado: {public_key[:30]}...")
         
@@ -465,27 +1236,27 @@ class WGApiClient:
             "data": None
         }
     
-    def get_system_status(self) -> Dict:
+    async def get_system_status(self) -> Dict:
         """Obtiene el estado del sistema"""
-        # Intentar diferentes endpoints posibles
-        endpoints = [
-            "/systemStatus",
-            "/getSystemStatus",
-            "/status",
-            "/system/status"
-        ]
-        
-        for endpoint in endpoints:
-            result = self._make_request("GET", endpoint)
-            if result.get("status"):
-                data = result.get("data", {})
-                if data:
-                    logger.info(f"[API] Sistema status obtenido desde {endpoint}")
-                    return result
+        # Endpoint detectado para esta versión de WGDashboard
+        endpoint = await self._resolve_endpoint("system_status")
+        
+        if endpoint:
+            result = await self._make_request("GET", endpoint)
+            if result.get("status") and result.get("data"):
+                logger.info(f"[API] Sistema status obtenido desde {endpoint}")
+                return result
+            
+            self._forget_capability("system_status", result)
         
-        # Si ninguno funcionó, devolver datos de ejemplo
+        # Si no está disponible, devolver datos de ejemplo
         logger.warning("[API] No se pudo obtener estado del sistema, devolviendo datos de ejemplo")
         
+        # psutil bloquea (cpu_percent espera 0.1s), ejecutarlo fuera del event loop
+        return await asyncio.to_thread(self._local_system_status)
+    
+    def _local_system_status(self) -> Dict:
+        """Construye el estado del sistema local usando psutil"""
         # Datos de ejemplo basados en psutil
         disks = []
         for partition in psutil.disk_partitions():
@@ -546,15 +1317,17 @@ class WGApiClient:
             }
         }
     
-    def get_protocols(self) -> Dict:
+    async def get_protocols(self) -> Dict:
         """Obtiene los protocolos habilitados"""
-        # Solo intentar el endpoint principal
-        endpoint = "/protocols"
-        result = self._make_request("GET", endpoint)
+        endpoint = await self._resolve_endpoint("protocols")
         
         # Si el endpoint existe y devuelve datos, usarlos
-        if result.get("status") and result.get("data"):
-            return result
+        if endpoint:
+            result = await self._make_request("GET", endpoint)
+            if result.get("status") and result.get("data"):
+                return result
+            
+            self._forget_capability("protocols", result)
         
         # Si no, devolver la lista básica
         logger.debug("[API] Endpoint de protocolos no disponible, usando lista por defecto")
@@ -564,9 +1337,9 @@ class WGApiClient:
             "data": ["wg"]
         }
     
-    def get_system_stats(self) -> Dict:
+    async def get_system_stats(self) -> Dict:
         """Obtiene estadísticas del sistema"""
-        return self.get_system_status()
+        return await self.get_system_status()
 
 # ========== INSTANCIA GLOBAL DEL CLIENTE ==========
 api_client = WGApiClient()
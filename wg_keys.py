@@ -0,0 +1,134 @@
+"""
+Claves WireGuard generadas en el propio proceso
+
+La clave pública se deriva de la privada con X25519 (Curve25519) del
+paquete cryptography, igual que `wg pubkey`, sin lanzar procesos. Un pool
+rellenado en segundo plano mantiene pares de claves y pre-shared keys
+listos para que crear peers no espere al cálculo.
+"""
+
+import base64
+import logging
+import secrets
+import threading
+from collections import deque
+from typing import Dict, Any, Optional, Tuple
+
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+from config import WG_KEY_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+KEY_SIZE = 32
+
+def _clamp(scalar: bytes) -> bytes:
+    """Escalar con los bits fijados por RFC 7748 (clamping)"""
+    value = bytearray(scalar)
+    value[0] &= 248
+    value[31] &= 127
+    value[31] |= 64
+    return bytes(value)
+
+def _encode(key: bytes) -> str:
+    return base64.b64encode(key).decode("ascii")
+
+def derive_public_key(private_key: str) -> str:
+    """Clave pública (base64) de una clave privada en base64, como `wg pubkey`"""
+    raw = base64.b64decode(private_key)
+    if len(raw) != KEY_SIZE:
+        raise ValueError("La clave privada debe tener 32 bytes")
+    
+    public = X25519PrivateKey.from_private_bytes(raw).public_key()
+    return _encode(public.public_bytes(Encoding.Raw, PublicFormat.Raw))
+
+def generate_keypair() -> Tuple[str, str]:
+    """(privada, pública) en base64, como `wg genkey | wg pubkey`"""
+    # wg genkey entrega la clave ya con los bits fijados
+    private_key = _encode(_clamp(secrets.token_bytes(KEY_SIZE)))
+    return private_key, derive_public_key(private_key)
+
+def generate_preshared_key() -> str:
+    """Pre-shared key en base64, como `wg genpsk`"""
+    return _encode(secrets.token_bytes(KEY_SIZE))
+
+class KeyPool:
+    """
+    Pares de claves y pre-shared keys ya generados.
+    
+    Un hilo en segundo plano rellena el pool cuando baja de la mitad. Si
+    está vacío (o size es 0) las claves se generan en el momento.
+    """
+    
+    def __init__(self, size: int = 0):
+        self.size = max(0, size)
+        self._keypairs: "deque[Tuple[str, str]]" = deque()
+        self._psks: "deque[str]" = deque()
+        self._wanted = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # Claves (pares o PSK) generadas en el momento por encontrar el pool vacío
+        self.misses = 0
+    
+    def start(self):
+        """Arranca el hilo de relleno (si el pool está activado)"""
+        if not self.size:
+            return
+        
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="wg-key-pool", daemon=True)
+                self._thread.start()
+        self._wanted.set()
+    
+    def _run(self):
+        while True:
+            self._wanted.wait()
+            self._wanted.clear()
+            
+            try:
+                while len(self._keypairs) < self.size:
+                    self._keypairs.append(generate_keypair())
+                while len(self._psks) < self.size:
+                    self._psks.append(generate_preshared_key())
+            except Exception as e:
+                logger.error(f"[KEYS] Error rellenando el pool de claves: {e}")
+    
+    def _refill_if_low(self, pool: deque):
+        if self.size and len(pool) <= self.size // 2:
+            self.start()
+    
+    def keypair(self) -> Tuple[str, str]:
+        """Par (privada, pública) del pool, o generado si está vacío"""
+        try:
+            keypair = self._keypairs.popleft()
+        except IndexError:
+            self.misses += 1
+            keypair = generate_keypair()
+        
+        self._refill_if_low(self._keypairs)
+        return keypair
+    
+    def psk(self) -> str:
+        """Pre-shared key del pool, o generada si está vacío"""
+        try:
+            psk = self._psks.popleft()
+        except IndexError:
+            self.misses += 1
+            psk = generate_preshared_key()
+        
+        self._refill_if_low(self._psks)
+        return psk
+    
+    def stats(self) -> Dict[str, Any]:
+        """Claves disponibles, para diagnóstico"""
+        return {
+            "size": self.size,
+            "keypairs": len(self._keypairs),
+            "psks": len(self._psks),
+            "misses": self.misses
+        }
+
+# Instancia global del pool
+key_pool = KeyPool(WG_KEY_POOL_SIZE)